@@ -0,0 +1,393 @@
+import os
+import re
+from os.path import join, dirname, exists
+import gc
+import time
+from array import array
+from typing import Optional, Tuple
+from urllib.parse import urlparse
+
+import dotenv
+import numpy as np
+import pandas as pd
+from tqdm import tqdm
+
+from core.enums.db_enums import DatabaseType
+from core.funcs import detect_encoding
+
+from dataset.utils.columnar_cache import get_cache_dir, is_cache_valid, read_table
+from dataset.utils.dataset_reader import iter_dataset
+
+from analytics.citation_graph import CitationGraph, get_citation_graph_path
+from database.bulk_load_by_model import run_statements
+from database.utils.db_connection import neomodel_connect
+
+
+# Metrics of each author, the columns of the metrics file and the properties of the Author nodes.
+METRIC_COLUMNS = ['h_index', 'citation_count', 'paper_count', 'first_year', 'last_year']
+
+# Sets the metrics of a batch of authors, years are null when no paper of the author has a year.
+AUTHOR_METRICS_QUERY = '''
+UNWIND $rows AS row
+MATCH (a:Author {author_id: row.author_id})
+SET a.h_index = row.h_index, a.citation_count = row.citation_count, a.paper_count = row.paper_count,
+    a.first_year = row.first_year, a.last_year = row.last_year
+'''
+
+# Removes the metrics of the authors that are no longer in the dataset.
+REMOVE_AUTHOR_METRICS_QUERY = '''
+UNWIND $author_ids AS author_id
+MATCH (a:Author {author_id: author_id})
+REMOVE a.h_index, a.citation_count, a.paper_count, a.first_year, a.last_year
+'''
+
+
+
+def get_author_metrics_path(database_url: str, database_name: str) -> str:
+    '''
+    Get the path of the metrics written last to a database, one file per server and database so the metrics
+    of one database are never compared with the metrics written to another. The directory is set with
+    AUTHOR_METRICS_PATH (default './dataset').
+
+    Parameters
+    ----------
+    database_url : str
+        URL of the database. Only the host and port are used, the credentials are not part of the path.
+    database_name : str
+        Name of the database.
+
+    Returns
+    -------
+    str
+        Path to the metrics file, e.g. './dataset/author-metrics.localhost-7687.neo4j.feather'.
+    '''
+    server = urlparse(database_url)
+    host = f'{server.hostname}-{server.port}' if server.port else f'{server.hostname}'
+    key = re.sub(r'[^A-Za-z0-9_.-]', '_', f'{host}.{database_name}')
+
+    return join(os.environ.get('AUTHOR_METRICS_PATH', './dataset'), f'author-metrics.{key}.feather')
+
+
+def read_authorships(dataset_path: str, dataset_encoding: str, parse_workers: int = 1) -> pd.DataFrame:
+    '''
+    Read the authors of every paper, from the columnar cache when it is up to date.
+    Authors without id are skipped and a repeated author of a paper is kept once.
+
+    Parameters
+    ----------
+    dataset_path : str
+        Path to the dataset.
+    dataset_encoding : str
+        Encoding of the dataset.
+    parse_workers : int
+        Number of processes used to parse the dataset. Default is 1.
+
+    Returns
+    -------
+    pd.DataFrame
+        One row per (paper, author): paper_id, author_id and year of the paper (0 if it has none).
+    '''
+    if is_cache_valid(dataset_path):
+        cache_dir = get_cache_dir()
+        paper_author = read_table('paper_author', cache_dir)
+        paper_years = read_table('papers', cache_dir).column('year').fill_null(0).to_numpy()
+
+        authorships = pd.DataFrame({
+            'paper_id': paper_author.column('paper_id').to_numpy(),
+            'author_id': paper_author.column('author_id').fill_null(-1).to_numpy(),
+            'year': paper_years[paper_author.column('paper_idx').to_numpy()].astype(np.int32),
+        })
+        authorships = authorships[authorships['author_id'] >= 0]
+
+    else:
+        paper_ids = array('q')
+        author_ids = array('q')
+        years = array('i')
+
+        for obj in tqdm(iter_dataset(dataset_path, dataset_encoding, workers=parse_workers,
+                                     fields=frozenset(['id', 'year', 'authors'])),
+                        desc='Reading dataset', unit=' papers'):
+            paper_id = int(obj['id'])
+            year = str(obj.get('year', None) or '')
+            year = int(year) if year.isdecimal() and len(year) <= 4 else 0
+
+            for author in obj.get('authors', None) or []:
+                if author.get('id', None) is None:
+                    continue
+
+                paper_ids.append(paper_id)
+                author_ids.append(int(author['id']))
+                years.append(year)
+
+        authorships = pd.DataFrame({
+            'paper_id': np.frombuffer(paper_ids, dtype=np.int64),
+            'author_id': np.frombuffer(author_ids, dtype=np.int64),
+            'year': np.frombuffer(years, dtype=np.int32),
+        })
+
+    authorships = authorships.drop_duplicates(['paper_id', 'author_id'], ignore_index=True)
+
+    gc.collect()
+
+    return authorships
+
+
+def compute_author_metrics(author_ids: np.ndarray, citations: np.ndarray, years: np.ndarray) -> pd.DataFrame:
+    '''
+    Compute the metrics of every author from one row per (paper, author), without a loop over the authors.
+    The rows are sorted by author and by citations (descending), so the papers of an author are a contiguous
+    group where the paper at rank r (from 1) counts for the h-index if it has at least r citations.
+    Every metric is then a reduction over the groups ('np.add.reduceat', 'np.minimum.reduceat', ...).
+
+    Parameters
+    ----------
+    author_ids : np.ndarray
+        Author of each row.
+    citations : np.ndarray
+        Citations of the paper of each row.
+    years : np.ndarray
+        Year of the paper of each row, 0 if unknown.
+
+    Returns
+    -------
+    pd.DataFrame
+        One row per author (sorted by author_id): author_id, h_index, citation_count, paper_count,
+        first_year and last_year (0 if no paper of the author has a year).
+    '''
+    author_ids = np.asarray(author_ids, dtype=np.int64)
+    citations = np.asarray(citations, dtype=np.int64)
+    years = np.asarray(years, dtype=np.int32)
+
+    if not len(author_ids):
+        return pd.DataFrame({column: np.empty(0, dtype=np.int64) for column in ['author_id'] + METRIC_COLUMNS})
+
+    order = np.lexsort((-citations, author_ids))
+    author_ids = author_ids[order]
+    citations = citations[order]
+    years = years[order]
+
+    starts = np.flatnonzero(np.concatenate([[True], author_ids[1:] != author_ids[:-1]]))
+    paper_count = np.diff(np.append(starts, len(author_ids)))
+
+    rank = np.arange(len(author_ids)) - np.repeat(starts, paper_count) + 1
+
+    # Unknown years are ignored by the minimum and by the maximum
+    known = years > 0
+    first_year = np.minimum.reduceat(np.where(known, years, np.iinfo(np.int32).max), starts)
+    last_year = np.maximum.reduceat(np.where(known, years, 0), starts)
+
+    metrics = pd.DataFrame({
+        'author_id': author_ids[starts],
+        'h_index': np.add.reduceat((citations >= rank).astype(np.int64), starts),
+        'citation_count': np.add.reduceat(citations, starts),
+        'paper_count': paper_count.astype(np.int64),
+        'first_year': np.where(first_year == np.iinfo(np.int32).max, 0, first_year).astype(np.int64),
+        'last_year': last_year.astype(np.int64),
+    })
+
+    return metrics
+
+
+def author_metrics(authorships: pd.DataFrame, graph: CitationGraph) -> pd.DataFrame:
+    '''
+    Compute the metrics of every author, counting the citations of each paper in the citation graph
+    (papers that are not in the graph have no citations).
+
+    Parameters
+    ----------
+    authorships : pd.DataFrame
+        One row per (paper, author), from 'read_authorships'.
+    graph : CitationGraph
+        Citation graph.
+
+    Returns
+    -------
+    pd.DataFrame
+        Metrics of each author, from 'compute_author_metrics'.
+    '''
+    positions = graph.positions(authorships['paper_id'].to_numpy())
+    in_degree = graph.in_degree()
+
+    citations = np.zeros(len(positions), dtype=np.int64)
+    found = positions >= 0
+    citations[found] = in_degree[positions[found]]
+
+    return compute_author_metrics(authorships['author_id'].to_numpy(), citations, authorships['year'].to_numpy())
+
+
+def diff_author_metrics(metrics: pd.DataFrame,
+                        previous: Optional[pd.DataFrame] = None) -> Tuple[pd.DataFrame, np.ndarray]:
+    '''
+    Compare the metrics with the metrics written last.
+
+    Parameters
+    ----------
+    metrics : pd.DataFrame
+        Current metrics.
+    previous : Optional[pd.DataFrame]
+        Metrics written last. Default is None, every author has changed.
+
+    Returns
+    -------
+    Tuple[pd.DataFrame, np.ndarray]
+        Metrics of the new and changed authors, and ids of the authors that are no longer in the metrics.
+    '''
+    if previous is None or previous.empty:
+        return metrics, np.empty(0, dtype=np.int64)
+
+    merged = metrics.merge(previous, on='author_id', how='outer', suffixes=('', '_previous'), indicator=True)
+
+    current = merged['_merge'] != 'right_only'
+    changed = merged['_merge'] == 'left_only'
+    for column in METRIC_COLUMNS:
+        changed |= merged[column] != merged[f'{column}_previous']
+
+    changed_ids = merged.loc[current & changed, 'author_id'].to_numpy()
+    removed_ids = merged.loc[merged['_merge'] == 'right_only', 'author_id'].to_numpy().astype(np.int64)
+
+    return metrics[metrics['author_id'].isin(changed_ids)], removed_ids
+
+
+def load_author_metrics(path: str) -> Optional[pd.DataFrame]:
+    '''
+    Load the metrics written last, None if there are none.
+    '''
+    if not exists(path):
+        return None
+
+    return pd.read_feather(path)
+
+
+def save_author_metrics(metrics: pd.DataFrame, path: str) -> None:
+    '''
+    Save the metrics written to the database. The file is replaced at once.
+    '''
+    directory = dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+
+    metrics.reset_index(drop=True).to_feather(f'{path}.tmp')
+    os.replace(f'{path}.tmp', path)
+
+
+def write_author_metrics(metrics: pd.DataFrame, database_url: str, database_name: str,
+                         removed_ids: Optional[np.ndarray] = None, batch_size: int = 50000) -> int:
+    '''
+    Write the metrics to the Author nodes, a transaction per batch. Authors that are not in the database
+    are skipped. The metrics of the 'removed_ids' authors are removed.
+
+    Parameters
+    ----------
+    metrics : pd.DataFrame
+        Metrics to write.
+    database_url : str
+        URL of the database.
+    database_name : str
+        Name of the database.
+    removed_ids : Optional[np.ndarray]
+        Authors whose metrics are removed. Default is None.
+    batch_size : int
+        Authors per transaction. Default is 50000.
+
+    Returns
+    -------
+    int
+        Number of authors written.
+    '''
+    columns = {column: metrics[column].to_numpy() for column in ['author_id'] + METRIC_COLUMNS}
+
+    for start in tqdm(range(0, len(metrics), batch_size), desc='Writing author metrics', unit=' batches'):
+        batch = {column: values[start:start + batch_size].tolist() for column, values in columns.items()}
+
+        rows = [{
+            'author_id': author_id,
+            'h_index': h_index,
+            'citation_count': citation_count,
+            'paper_count': paper_count,
+            'first_year': first_year or None,
+            'last_year': last_year or None,
+        } for author_id, h_index, citation_count, paper_count, first_year, last_year in zip(
+            batch['author_id'], batch['h_index'], batch['citation_count'], batch['paper_count'],
+            batch['first_year'], batch['last_year'])]
+
+        run_statements([(AUTHOR_METRICS_QUERY, {'rows': rows})], database_url, database_name)
+
+    if removed_ids is not None:
+        for start in range(0, len(removed_ids), batch_size):
+            run_statements([(REMOVE_AUTHOR_METRICS_QUERY, {'author_ids': removed_ids[start:start + batch_size].tolist()})],
+                           database_url, database_name)
+
+    gc.collect()
+
+    return len(metrics)
+
+
+
+
+if __name__ == '__main__':
+    dotenv_path = join(dirname(__file__), '.env')
+    dotenv.load_dotenv(dotenv_path)
+
+    dataset_path = os.environ.get('DATASET_PATH', './dataset/dblp.v12.json')
+    graph_path = get_citation_graph_path()
+    PARSE_WORKERS = int(os.environ.get('PARSE_WORKERS', 1))
+    BATCH_SIZE_AUTHOR_METRICS = int(os.environ.get('BATCH_SIZE_AUTHOR_METRICS', 50000))
+
+
+
+    print('==============================')
+    print(' Author Metrics')
+    print('==============================')
+    print(f'Dataset: {dataset_path}')
+    print(f'Snapshot: {graph_path}')
+
+    print('\nOptions:')
+    print('1. Write the new and changed metrics')
+    print('2. Write every metric')
+    print('3. Compute the metrics only (dry run)')
+
+    option = None
+    while option not in ['1', '2', '3']:
+        option = input('\nOption: ')
+
+    # The metrics written last are kept per database, so the database is chosen before the diff
+    print('\nChoose Database:')
+    print(f'1. {DatabaseType.PRODUCTION.value}')
+    print(f'2. {DatabaseType.TEST.value}')
+
+    db_option = None
+    while db_option not in [DatabaseType.PRODUCTION.value, DatabaseType.TEST.value]:
+        db_option = input('\nDatabase: ')
+
+        if db_option not in [DatabaseType.PRODUCTION.value, DatabaseType.TEST.value]:
+            print(f'Invalid Database. Please choose between \'{DatabaseType.PRODUCTION.value}\' and \'{DatabaseType.TEST.value}\'.')
+
+    database_url, database_name = neomodel_connect(DatabaseType(db_option))
+    metrics_path = get_author_metrics_path(database_url, database_name)
+    print(f'Database: {database_name}')
+    print(f'Metrics: {metrics_path}')
+
+    time_start = time.time()
+
+    graph = CitationGraph.load(graph_path)
+    authorships = read_authorships(dataset_path, detect_encoding(dataset_path), PARSE_WORKERS)
+    metrics = author_metrics(authorships, graph)
+
+    previous = load_author_metrics(metrics_path) if option != '2' else None
+    changed, removed_ids = diff_author_metrics(metrics, previous)
+
+    print(f'\nAuthors: {len(metrics)}')
+    print(f'New or changed: {len(changed)}')
+    print(f'Removed: {len(removed_ids)}')
+
+    print('\nTop 10 authors by h-index:')
+    print(metrics.nlargest(10, ['h_index', 'citation_count']).to_string(index=False))
+
+    if option != '3':
+        written = write_author_metrics(changed, database_url, database_name, removed_ids, BATCH_SIZE_AUTHOR_METRICS)
+
+        # Saved once every batch is written, an interrupted run is written again by the next one
+        save_author_metrics(metrics, metrics_path)
+        print(f'\n{written} authors written to the database')
+
+    time_elapsed = time.time() - time_start
+    print(f'Time Elapsed: {time_elapsed // 3600:.0f} hours {time_elapsed % 3600 // 60:.0f} minutes')
@@ -0,0 +1,508 @@
+import os
+from os.path import join, dirname, exists
+import gc
+import json
+import shutil
+import tempfile
+from array import array
+from typing import Iterator, Optional, Tuple
+
+import time
+import dotenv
+import numpy as np
+from tqdm import tqdm
+
+from core.enums.db_enums import DatabaseType
+from core.funcs import detect_encoding
+
+from dataset.utils.columnar_cache import get_cache_dir, is_cache_valid, read_table
+from dataset.utils.dataset_reader import iter_dataset
+
+from database.load_citations import iter_reference_pairs, iter_spooled_pairs
+from database.utils.connection_manager import session
+from database.utils.db_connection import neomodel_connect
+
+
+# Arrays of a snapshot, one '.npy' file each.
+GRAPH_ARRAYS = ['paper_ids', 'out_indptr', 'out_indices', 'in_indptr', 'in_indices']
+
+GRAPH_META_FILE = 'meta.json'
+
+# File in the snapshot directory with the name of the version directory that is current.
+GRAPH_CURRENT_FILE = 'CURRENT'
+
+
+
+def get_citation_graph_path() -> str:
+    '''
+    Get the directory of the citation graph snapshot, set with CITATION_GRAPH_PATH (default './dataset/citation-graph').
+    '''
+    return os.environ.get('CITATION_GRAPH_PATH', './dataset/citation-graph')
+
+
+def read_current_version(path: str) -> Optional[str]:
+    '''
+    Get the name of the current version directory of a snapshot, None if it has no 'CURRENT' pointer.
+    '''
+    if not exists(join(path, GRAPH_CURRENT_FILE)):
+        return None
+
+    with open(join(path, GRAPH_CURRENT_FILE), 'r', encoding='utf-8') as f:
+        return f.read().strip() or None
+
+
+def current_version_path(path: str) -> str:
+    '''
+    Get the directory with the files of the current version of a snapshot. Snapshots saved before
+    the versions were added have their files directly in 'path'.
+    '''
+    version = read_current_version(path)
+
+    return join(path, version) if version else path
+
+
+def gather_rows(indptr: np.ndarray, indices: np.ndarray, rows: np.ndarray) -> np.ndarray:
+    '''
+    Concatenate the CSR rows of a set of nodes without a Python loop.
+
+    Parameters
+    ----------
+    indptr : np.ndarray
+        Start of each row in 'indices', plus the total at the end.
+    indices : np.ndarray
+        Column of each entry.
+    rows : np.ndarray
+        Rows to gather.
+
+    Returns
+    -------
+    np.ndarray
+        Entries of every row, row after row.
+    '''
+    rows = np.asarray(rows, dtype=np.int64)
+    starts = np.asarray(indptr[rows], dtype=np.int64)
+    lengths = np.asarray(indptr[rows + 1], dtype=np.int64) - starts
+    total = int(lengths.sum())
+
+    if not total:
+        return np.empty(0, dtype=indices.dtype)
+
+    # Position of each entry: the start of its row plus its offset in the row
+    offsets = np.repeat(starts - np.concatenate([[0], np.cumsum(lengths)[:-1]]), lengths)
+    return indices[offsets + np.arange(total)]
+
+
+
+class CitationGraph:
+    '''
+    CITES graph in compressed sparse row (CSR) format, for analytics outside of the database.
+    Papers are numbered by their position in 'paper_ids' (int64, sorted):
+        - out_indptr, out_indices: papers cited by each paper, the references of paper i are
+          out_indices[out_indptr[i]:out_indptr[i + 1]] (sorted).
+        - in_indptr, in_indices: papers citing each paper, in the same layout.
+    Positions are int32 and offsets int64. DBLP-v12 (4.9M papers, 45M references) takes about 440 MB.
+    A snapshot is saved as one '.npy' file per array. 'load' memory-maps the files, so opening it takes
+    milliseconds, only the pages that are read are loaded, and every process that opens the same snapshot
+    shares them through the page cache.
+
+    Parameters
+    ----------
+    paper_ids : np.ndarray
+        Sorted paper ids.
+    out_indptr : np.ndarray
+        Offsets of the references of each paper.
+    out_indices : np.ndarray
+        Positions of the cited papers.
+    in_indptr : np.ndarray
+        Offsets of the citations of each paper.
+    in_indices : np.ndarray
+        Positions of the citing papers.
+    meta : Optional[dict]
+        Information of the snapshot (source, counts, creation time).
+    '''
+    def __init__(self, paper_ids: np.ndarray, out_indptr: np.ndarray, out_indices: np.ndarray,
+                 in_indptr: np.ndarray, in_indices: np.ndarray, meta: Optional[dict] = None) -> None:
+        self.paper_ids = paper_ids
+        self.out_indptr = out_indptr
+        self.out_indices = out_indices
+        self.in_indptr = in_indptr
+        self.in_indices = in_indices
+        self.meta = meta or {}
+
+    def __len__(self) -> int:
+        return len(self.paper_ids)
+
+    @property
+    def edges(self) -> int:
+        return len(self.out_indices)
+
+    @classmethod
+    def from_pairs(cls, paper_ids: np.ndarray, pairs: Iterator[Tuple[np.ndarray, np.ndarray]],
+                   meta: Optional[dict] = None) -> 'CitationGraph':
+        '''
+        Build the graph from (citing paper_id, cited paper_id) batches. Like the CITES loader, references to
+        papers that are not in 'paper_ids' are dropped and repeated references are kept once.
+        Each reference takes 8 bytes while the graph is built (about 1 GB for DBLP-v12).
+
+        Parameters
+        ----------
+        paper_ids : np.ndarray
+            Ids of every paper (nodes of the graph), repeated ids are kept once.
+        pairs : Iterator[Tuple[np.ndarray, np.ndarray]]
+            Batches of citing and cited paper ids.
+        meta : Optional[dict]
+            Information of the snapshot.
+
+        Returns
+        -------
+        CitationGraph
+            Graph in memory.
+        '''
+        paper_ids = np.unique(np.asarray(paper_ids, dtype=np.int64))
+        n = len(paper_ids)
+        graph = cls(paper_ids, None, None, None, None, meta)
+
+        # Each edge is one int64 key (citing position * n + cited position): sorting the keys sorts the edges
+        # by citing paper, then by cited paper, which is the order of the out CSR
+        keys = []
+        for src, dst in tqdm(pairs, desc='Reading citations', unit=' batches'):
+            src_positions = graph.positions(src)
+            dst_positions = graph.positions(dst)
+            valid = (src_positions >= 0) & (dst_positions >= 0)
+
+            keys.append(np.unique(src_positions[valid] * n + dst_positions[valid]))
+
+        keys = np.unique(np.concatenate(keys)) if keys else np.empty(0, dtype=np.int64)
+        src = (keys // max(n, 1)).astype(np.int32)
+        dst = (keys % max(n, 1)).astype(np.int32)
+        del keys
+
+        graph.out_indptr = np.concatenate([[0], np.cumsum(np.bincount(src, minlength=n))]).astype(np.int64)
+        graph.out_indices = dst
+
+        # A stable sort by cited paper keeps the citing papers of each row sorted
+        order = np.argsort(dst, kind='stable')
+        graph.in_indptr = np.concatenate([[0], np.cumsum(np.bincount(dst, minlength=n))]).astype(np.int64)
+        graph.in_indices = src[order]
+        del order, src
+
+        graph.meta.update({'papers': n, 'citations': graph.edges})
+        gc.collect()
+
+        return graph
+
+    @classmethod
+    def load(cls, path: str, mmap: bool = True) -> 'CitationGraph':
+        '''
+        Open a snapshot saved with 'save'.
+
+        Parameters
+        ----------
+        path : str
+            Directory of the snapshot.
+        mmap : bool
+            Memory-map the arrays (read-only) instead of reading them. Default is True.
+
+        Returns
+        -------
+        CitationGraph
+            Graph backed by the files.
+
+        Raises
+        ------
+        FileNotFoundError
+            If there is no snapshot in 'path'.
+        '''
+        path = current_version_path(path)
+
+        if not exists(join(path, GRAPH_META_FILE)):
+            raise FileNotFoundError(f'There is no citation graph in {path}.')
+
+        with open(join(path, GRAPH_META_FILE), 'r', encoding='utf-8') as f:
+            meta = json.load(f)
+
+        arrays = {name: np.load(join(path, f'{name}.npy'), mmap_mode='r' if mmap else None) for name in GRAPH_ARRAYS}
+
+        return cls(meta=meta, **arrays)
+
+    def save(self, path: str) -> None:
+        '''
+        Save the snapshot to a directory. Each save writes a new version directory inside 'path' and then
+        replaces the 'CURRENT' pointer file at once, so 'path' always holds a complete snapshot: a concurrent
+        'load' opens either the previous version or the new one. The version that was replaced is kept
+        for the loads that are still opening it, older versions are removed.
+        '''
+        os.makedirs(path, exist_ok=True)
+        previous = read_current_version(path)
+
+        version = f'v{time.time_ns()}'
+        os.makedirs(join(path, version))
+
+        for name in GRAPH_ARRAYS:
+            np.save(join(path, version, f'{name}.npy'), getattr(self, name))
+
+        with open(join(path, version, GRAPH_META_FILE), 'w', encoding='utf-8') as f:
+            json.dump(self.meta, f, indent=2)
+
+        with open(join(path, f'{GRAPH_CURRENT_FILE}.tmp'), 'w', encoding='utf-8') as f:
+            f.write(version)
+        os.replace(join(path, f'{GRAPH_CURRENT_FILE}.tmp'), join(path, GRAPH_CURRENT_FILE))
+
+        # Snapshots saved before the versions were added have their files directly in 'path'
+        for name in [f'{name}.npy' for name in GRAPH_ARRAYS] + [GRAPH_META_FILE]:
+            if exists(join(path, name)):
+                os.remove(join(path, name))
+
+        for entry in os.listdir(path):
+            if entry[:1] == 'v' and entry[1:].isdigit() and entry not in [version, previous]:
+                shutil.rmtree(join(path, entry), ignore_errors=True)
+
+    def positions(self, paper_ids: np.ndarray) -> np.ndarray:
+        '''
+        Get the positions of a batch of paper ids.
+
+        Returns
+        -------
+        np.ndarray
+            Position of each paper id (int64), or -1 if the paper is not in the graph.
+        '''
+        paper_ids = np.asarray(paper_ids, dtype=np.int64)
+
+        if not len(self.paper_ids):
+            return np.full(len(paper_ids), -1, dtype=np.int64)
+
+        positions = np.minimum(np.searchsorted(self.paper_ids, paper_ids), len(self.paper_ids) - 1)
+        return np.where(self.paper_ids[positions] == paper_ids, positions, -1)
+
+    def out_degree(self) -> np.ndarray:
+        '''
+        Number of references of each paper in the graph.
+        '''
+        return np.diff(self.out_indptr)
+
+    def in_degree(self) -> np.ndarray:
+        '''
+        Number of citations of each paper in the graph.
+        '''
+        return np.diff(self.in_indptr)
+
+    def references(self, paper_id: int) -> np.ndarray:
+        '''
+        Paper ids cited by a paper, empty if the paper is not in the graph.
+        '''
+        position = self.positions([paper_id])[0]
+        if position < 0:
+            return np.empty(0, dtype=np.int64)
+
+        return self.paper_ids[self.out_indices[self.out_indptr[position]:self.out_indptr[position + 1]]]
+
+    def cited_by(self, paper_id: int) -> np.ndarray:
+        '''
+        Paper ids citing a paper, empty if the paper is not in the graph.
+        '''
+        position = self.positions([paper_id])[0]
+        if position < 0:
+            return np.empty(0, dtype=np.int64)
+
+        return self.paper_ids[self.in_indices[self.in_indptr[position]:self.in_indptr[position + 1]]]
+
+    def reachable(self, paper_ids: np.ndarray, direction: str = 'out', max_depth: Optional[int] = None) -> np.ndarray:
+        '''
+        Find the papers reachable from a set of papers, with a breadth-first search that expands
+        the whole frontier at once.
+
+        Parameters
+        ----------
+        paper_ids : np.ndarray
+            Paper ids to start from.
+        direction : str - Options: 'out', 'in'
+            'out' follows the references (papers the start papers build on), 'in' the citations
+            (papers influenced by the start papers). Default is 'out'.
+        max_depth : Optional[int]
+            Maximum number of hops, by default None (no limit).
+
+        Returns
+        -------
+        np.ndarray
+            Depth of each paper of the graph (int32): 0 for the start papers, -1 for the papers not reached.
+        '''
+        if direction not in ['out', 'in']:
+            raise ValueError(f'Invalid direction: {direction}. Options: \'out\', \'in\'.')
+
+        indptr, indices = (self.out_indptr, self.out_indices) if direction == 'out' else (self.in_indptr, self.in_indices)
+
+        depth = np.full(len(self), -1, dtype=np.int32)
+        frontier = np.unique(self.positions(paper_ids))
+        frontier = frontier[frontier >= 0]
+        depth[frontier] = 0
+        hops = 0
+
+        while len(frontier) and (max_depth is None or hops < max_depth):
+            hops += 1
+            neighbors = np.unique(gather_rows(indptr, indices, frontier))
+            frontier = neighbors[depth[neighbors] < 0]
+            depth[frontier] = hops
+
+        return depth
+
+
+def build_from_dataset(dataset_path: str, dataset_encoding: str, parse_workers: int = 1,
+                       batch_size: int = 1000000) -> CitationGraph:
+    '''
+    Build the citation graph from the dataset (from the columnar cache when it is up to date).
+    The references are kept in a temporary file while the dataset is read.
+
+    Parameters
+    ----------
+    dataset_path : str
+        Path to the dataset.
+    dataset_encoding : str
+        Encoding of the dataset.
+    parse_workers : int
+        Number of processes used to parse the dataset. Default is 1.
+    batch_size : int
+        References converted to positions at a time. Default is 1000000.
+
+    Returns
+    -------
+    CitationGraph
+        Graph in memory.
+    '''
+    with tempfile.TemporaryFile() as pairs_file:
+        if is_cache_valid(dataset_path):
+            paper_ids = read_table('papers', get_cache_dir()).column('paper_id').to_numpy()
+
+            for src, dst in iter_reference_pairs(dataset_path, dataset_encoding, batch_size):
+                np.column_stack((src, dst)).astype(np.int64).tofile(pairs_file)
+
+        else:
+            paper_ids = array('q')
+            references = array('q')
+
+            for obj in tqdm(iter_dataset(dataset_path, dataset_encoding, workers=parse_workers,
+                                         fields=frozenset(['id', 'references'])),
+                            desc='Reading dataset', unit=' papers'):
+                paper_id = int(obj['id'])
+                paper_ids.append(paper_id)
+
+                for ref_id in obj.get('references', None) or []:
+                    references.extend((paper_id, int(ref_id)))
+
+                if len(references) >= 2 * batch_size:
+                    references.tofile(pairs_file)
+                    del references[:]
+
+            references.tofile(pairs_file)
+            paper_ids = np.frombuffer(paper_ids, dtype=np.int64)
+
+        pairs_file.seek(0)
+
+        return CitationGraph.from_pairs(paper_ids, iter_spooled_pairs(pairs_file, batch_size),
+                                        {'source': os.path.abspath(dataset_path), 'created': time.time()})
+
+
+def build_from_database(database_url: str, database_name: str, batch_size: int = 1000000,
+                        fetch_size: int = 100000) -> CitationGraph:
+    '''
+    Build the citation graph from the Paper nodes and CITES relationships of the database.
+    Results are streamed from the driver into compact arrays.
+
+    Parameters
+    ----------
+    database_url : str
+        URL of the database.
+    database_name : str
+        Name of the database.
+    batch_size : int
+        References converted to positions at a time. Default is 1000000.
+    fetch_size : int
+        Records fetched from the server at a time. Default is 100000.
+
+    Returns
+    -------
+    CitationGraph
+        Graph in memory.
+    '''
+    paper_ids = array('q')
+
+    with session(database_url, database_name, fetch_size=fetch_size) as driver_session:
+        result = driver_session.run('MATCH (p:Paper) RETURN p.paper_id AS paper_id')
+
+        for record in tqdm(result, desc='Loading Paper ids', unit=' papers'):
+            paper_ids.append(record['paper_id'])
+
+    def iter_pairs():
+        src = array('q')
+        dst = array('q')
+
+        with session(database_url, database_name, fetch_size=fetch_size) as driver_session:
+            result = driver_session.run('MATCH (p:Paper)-[:CITES]->(ref:Paper) RETURN p.paper_id AS src, ref.paper_id AS dst')
+
+            for record in result:
+                src.append(record['src'])
+                dst.append(record['dst'])
+
+                if len(src) >= batch_size:
+                    yield np.frombuffer(src, dtype=np.int64), np.frombuffer(dst, dtype=np.int64)
+                    src = array('q')
+                    dst = array('q')
+
+        if src:
+            yield np.frombuffer(src, dtype=np.int64), np.frombuffer(dst, dtype=np.int64)
+
+    return CitationGraph.from_pairs(np.frombuffer(paper_ids, dtype=np.int64), iter_pairs(),
+                                    {'source': f'database:{database_name}', 'created': time.time()})
+
+
+
+
+if __name__ == '__main__':
+    dotenv_path = join(dirname(__file__), '.env')
+    dotenv.load_dotenv(dotenv_path)
+
+    dataset_path = os.environ.get('DATASET_PATH', './dataset/dblp.v12.json')
+    graph_path = get_citation_graph_path()
+    PARSE_WORKERS = int(os.environ.get('PARSE_WORKERS', 1))
+
+
+
+    print('==============================')
+    print(' Citation Graph Snapshot')
+    print('==============================')
+    print(f'Snapshot: {graph_path}')
+
+    print('\nBuild the snapshot from:')
+    print('1. Dataset')
+    print('2. Database')
+
+    option = None
+    while option not in ['1', '2']:
+        option = input('\nOption: ')
+
+    time_start = time.time()
+
+    if option == '1':
+        print(f'Dataset: {dataset_path}')
+        graph = build_from_dataset(dataset_path, detect_encoding(dataset_path), PARSE_WORKERS)
+
+    else:
+        print('Choose Database:')
+        print(f'1. {DatabaseType.PRODUCTION.value}')
+        print(f'2. {DatabaseType.TEST.value}')
+
+        db_option = None
+        while db_option not in [DatabaseType.PRODUCTION.value, DatabaseType.TEST.value]:
+            db_option = input('\nDatabase: ')
+
+            if db_option not in [DatabaseType.PRODUCTION.value, DatabaseType.TEST.value]:
+                print(f'Invalid Database. Please choose between \'{DatabaseType.PRODUCTION.value}\' and \'{DatabaseType.TEST.value}\'.')
+
+        database_url, database_name = neomodel_connect(DatabaseType(db_option))
+        print(f'Database: {database_name}')
+        graph = build_from_database(database_url, database_name)
+
+    graph.save(graph_path)
+
+    time_elapsed = time.time() - time_start
+    print(f'\nSnapshot of {len(graph)} papers and {graph.edges} citations saved to {graph_path}')
+    print(f'Time Elapsed: {time_elapsed // 3600:.0f} hours {time_elapsed % 3600 // 60:.0f} minutes')
@@ -0,0 +1,360 @@
+import os
+from os.path import join, dirname
+import gc
+import time
+from typing import Dict, Optional, Tuple
+
+import dotenv
+import numpy as np
+from neomodel import db
+from tqdm import tqdm
+
+from core.enums.db_enums import DatabaseType
+from analytics.citation_graph import CitationGraph, get_citation_graph_path
+from database.bulk_load_by_model import run_statements
+from database.utils.connection_manager import use_database
+from database.utils.db_connection import neomodel_connect
+
+# SciPy is in the requirements, without it the products are computed with NumPy (slower)
+try:
+    from scipy import sparse
+except ImportError:
+    sparse = None
+
+
+# Sets the score of a batch of papers, the Paper (pagerank) index of the model serves the top-k queries.
+PAGERANK_QUERY = '''
+UNWIND $rows AS row
+MATCH (p:Paper {paper_id: row.paper_id})
+SET p.pagerank = row.pagerank
+'''
+
+TOP_PAPERS_QUERY = '''
+MATCH (p:Paper)
+WHERE p.pagerank IS NOT NULL
+RETURN p.paper_id AS paper_id, p.title AS title, p.pagerank AS pagerank
+ORDER BY p.pagerank DESC
+LIMIT $limit
+'''
+
+
+
+def citation_operator(graph: CitationGraph, use_scipy: Optional[bool] = None):
+    '''
+    Build the product of the transposed adjacency matrix of the graph with a vector:
+    y[j] = sum of x[i] over the papers i that cite j.
+    With SciPy the product is a sparse matrix-vector product over the in-CSR arrays. Without it,
+    the entries of each row are gathered and summed with 'np.add.reduceat'.
+
+    Parameters
+    ----------
+    graph : CitationGraph
+        Citation graph.
+    use_scipy : Optional[bool]
+        Use SciPy. Default is None, use it if it is installed.
+
+    Returns
+    -------
+    Callable[[np.ndarray], np.ndarray]
+        The product.
+    '''
+    n = len(graph)
+
+    if use_scipy is None:
+        use_scipy = sparse is not None
+
+    if use_scipy:
+        if sparse is None:
+            raise ImportError('SciPy is not installed.')
+
+        matrix = sparse.csr_matrix((np.ones(graph.edges, dtype=np.float64),
+                                    np.asarray(graph.in_indices), np.asarray(graph.in_indptr)), shape=(n, n))
+        return lambda x: matrix @ x
+
+    in_indptr = np.asarray(graph.in_indptr, dtype=np.int64)
+    in_indices = np.asarray(graph.in_indices)
+
+    # 'reduceat' returns the entry at the start of an empty row instead of 0, only rows with entries are reduced
+    rows = np.flatnonzero(in_indptr[1:] > in_indptr[:-1])
+    starts = in_indptr[rows]
+
+    def product(x: np.ndarray) -> np.ndarray:
+        y = np.zeros(n, dtype=np.float64)
+
+        if len(rows):
+            y[rows] = np.add.reduceat(x[in_indices], starts)
+
+        return y
+
+    return product
+
+
+def personalization_vector(graph: CitationGraph, personalization: Optional[Dict[int, float]] = None) -> np.ndarray:
+    '''
+    Build the teleport distribution of PageRank.
+
+    Parameters
+    ----------
+    graph : CitationGraph
+        Citation graph.
+    personalization : Optional[Dict[int, float]]
+        Weight of each paper id, papers that are not in the graph are ignored. Default is None, uniform.
+
+    Returns
+    -------
+    np.ndarray
+        Probability of each paper (float64, sums to 1).
+
+    Raises
+    ------
+    ValueError
+        If a weight is negative or no paper of the graph has a positive weight.
+    '''
+    n = len(graph)
+
+    if personalization is None:
+        return np.full(n, 1.0 / n)
+
+    paper_ids = np.fromiter(personalization.keys(), dtype=np.int64, count=len(personalization))
+    weights = np.fromiter(personalization.values(), dtype=np.float64, count=len(personalization))
+
+    if (weights < 0).any():
+        raise ValueError('Personalization weights must not be negative.')
+
+    positions = graph.positions(paper_ids)
+    found = positions >= 0
+
+    vector = np.zeros(n, dtype=np.float64)
+    np.add.at(vector, positions[found], weights[found])
+
+    total = vector.sum()
+    if total <= 0:
+        raise ValueError('No paper of the personalization is in the citation graph.')
+
+    return vector / total
+
+
+def pagerank(graph: CitationGraph, damping: float = 0.85, personalization: Optional[Dict[int, float]] = None,
+             tolerance: float = 1e-10, max_iterations: int = 100,
+             use_scipy: Optional[bool] = None) -> Tuple[np.ndarray, dict]:
+    '''
+    Compute the PageRank of the papers of the citation graph by power iteration:
+        x' = damping * (A^T D^-1 x + dangling mass * p) + (1 - damping) * p
+    where p is the teleport distribution (uniform or personalized). The score of the papers without
+    references in the graph (dangling papers) is spread with the teleport distribution, so the scores
+    always sum to 1. Iterations stop when the L1 change of the scores is below 'tolerance * n'.
+    Besides the graph, it takes about 6 vectors of n floats (240 MB for DBLP-v12) and, for the product,
+    one float per citation (360 MB).
+
+    Parameters
+    ----------
+    graph : CitationGraph
+        Citation graph.
+    damping : float
+        Probability of following a reference. Default is 0.85.
+    personalization : Optional[Dict[int, float]]
+        Teleport weight of each paper id. Default is None, uniform.
+    tolerance : float
+        Convergence tolerance per paper. Default is 1e-10.
+    max_iterations : int
+        Maximum number of iterations. Default is 100.
+    use_scipy : Optional[bool]
+        Use SciPy for the products. Default is None, use it if it is installed.
+
+    Returns
+    -------
+    Tuple[np.ndarray, dict]
+        Score of each paper, in the order of 'graph.paper_ids', and the convergence report:
+        converged, iterations, residuals (L1 change of each iteration), tolerance, damping,
+        dangling (number of dangling papers), backend ('scipy' or 'numpy') and elapsed (seconds).
+
+    Raises
+    ------
+    ValueError
+        If the damping is not in [0, 1) or the graph is empty.
+    '''
+    if not 0 <= damping < 1:
+        raise ValueError('The damping must be in [0, 1).')
+
+    n = len(graph)
+    if not n:
+        raise ValueError('The citation graph is empty.')
+
+    time_start = time.perf_counter()
+
+    if use_scipy is None:
+        use_scipy = sparse is not None
+
+    product = citation_operator(graph, use_scipy)
+
+    teleport = personalization_vector(graph, personalization)
+
+    out_degree = np.asarray(graph.out_degree(), dtype=np.float64)
+    dangling = out_degree == 0
+    inverse_degree = np.divide(1.0, out_degree, out=np.zeros(n), where=~dangling)
+
+    scores = teleport.copy()
+    residuals = []
+    converged = False
+
+    for iteration in range(max_iterations):
+        dangling_mass = scores[dangling].sum()
+        scores_next = damping * product(scores * inverse_degree)
+        scores_next += (damping * dangling_mass + 1 - damping) * teleport
+
+        # Renormalize the rounding errors of the sums
+        scores_next /= scores_next.sum()
+
+        residual = float(np.abs(scores_next - scores).sum())
+        residuals.append(residual)
+        scores = scores_next
+
+        if residual < tolerance * n:
+            converged = True
+            break
+
+    report = {
+        'converged': converged,
+        'iterations': len(residuals),
+        'residuals': residuals,
+        'tolerance': tolerance,
+        'damping': damping,
+        'dangling': int(dangling.sum()),
+        'backend': 'scipy' if use_scipy else 'numpy',
+        'elapsed': time.perf_counter() - time_start,
+    }
+
+    gc.collect()
+
+    return scores, report
+
+
+def write_pagerank(paper_ids: np.ndarray, scores: np.ndarray, database_url: str, database_name: str,
+                   batch_size: int = 50000) -> int:
+    '''
+    Write the scores to the 'pagerank' property of the Paper nodes, a transaction per batch.
+    Papers that are not in the database are skipped.
+
+    Parameters
+    ----------
+    paper_ids : np.ndarray
+        Paper ids.
+    scores : np.ndarray
+        Score of each paper.
+    database_url : str
+        URL of the database.
+    database_name : str
+        Name of the database.
+    batch_size : int
+        Papers per transaction. Default is 50000.
+
+    Returns
+    -------
+    int
+        Number of scores sent.
+    '''
+    for start in tqdm(range(0, len(paper_ids), batch_size), desc='Writing PageRank', unit=' batches'):
+        batch_ids = paper_ids[start:start + batch_size].tolist()
+        batch_scores = scores[start:start + batch_size].tolist()
+
+        rows = [{'paper_id': paper_id, 'pagerank': score} for paper_id, score in zip(batch_ids, batch_scores)]
+        run_statements([(PAGERANK_QUERY, {'rows': rows})], database_url, database_name)
+
+    gc.collect()
+
+    return len(paper_ids)
+
+
+def top_papers(database_url: str, database_name: str, limit: int = 10) -> list:
+    '''
+    Get the papers with the highest PageRank in the database, served by the Paper (pagerank) index.
+
+    Parameters
+    ----------
+    database_url : str
+        URL of the database.
+    database_name : str
+        Name of the database.
+    limit : int
+        Number of papers. Default is 10.
+
+    Returns
+    -------
+    list
+        Rows of paper_id, title and pagerank.
+    '''
+    use_database(database_url, database_name)
+
+    results, meta = db.cypher_query(TOP_PAPERS_QUERY, {'limit': limit})
+
+    return results
+
+
+
+
+if __name__ == '__main__':
+    dotenv_path = join(dirname(__file__), '.env')
+    dotenv.load_dotenv(dotenv_path)
+
+    graph_path = get_citation_graph_path()
+    PAGERANK_DAMPING = float(os.environ.get('PAGERANK_DAMPING', 0.85))
+    PAGERANK_TOLERANCE = float(os.environ.get('PAGERANK_TOLERANCE', 1e-10))
+    PAGERANK_MAX_ITERATIONS = int(os.environ.get('PAGERANK_MAX_ITERATIONS', 100))
+    BATCH_SIZE_PAGERANK = int(os.environ.get('BATCH_SIZE_PAGERANK', 50000))
+
+
+
+    print('==============================')
+    print(' PageRank of the Papers')
+    print('==============================')
+    print(f'Snapshot: {graph_path}')
+
+    graph = CitationGraph.load(graph_path)
+    print(f'{len(graph)} papers and {graph.edges} citations')
+    print(f'Backend: {"scipy" if sparse is not None else "numpy (SciPy is not installed)"}')
+
+    scores, report = pagerank(graph, PAGERANK_DAMPING, tolerance=PAGERANK_TOLERANCE,
+                              max_iterations=PAGERANK_MAX_ITERATIONS)
+
+    print(f'\nConverged: {report["converged"]} after {report["iterations"]} iterations '
+          f'(residual {report["residuals"][-1]:.3e})')
+    print(f'Dangling papers: {report["dangling"]}')
+    print(f'Time Elapsed: {report["elapsed"]:.1f} seconds')
+
+    print('\nTop 10 papers:')
+    for position in np.argsort(scores)[::-1][:10]:
+        print(f'{graph.paper_ids[position]}: {scores[position]:.6e}')
+
+    print('\nWrite the scores to the database?')
+    print('1. Yes')
+    print('2. No')
+
+    option = None
+    while option not in ['1', '2']:
+        option = input('\nOption: ')
+
+    if option == '1':
+        print('Choose Database:')
+        print(f'1. {DatabaseType.PRODUCTION.value}')
+        print(f'2. {DatabaseType.TEST.value}')
+
+        db_option = None
+        while db_option not in [DatabaseType.PRODUCTION.value, DatabaseType.TEST.value]:
+            db_option = input('\nDatabase: ')
+
+            if db_option not in [DatabaseType.PRODUCTION.value, DatabaseType.TEST.value]:
+                print(f'Invalid Database. Please choose between \'{DatabaseType.PRODUCTION.value}\' and \'{DatabaseType.TEST.value}\'.')
+
+        database_url, database_name = neomodel_connect(DatabaseType(db_option))
+        print(f'Database: {database_name}')
+
+        time_start = time.time()
+        written = write_pagerank(np.asarray(graph.paper_ids), scores, database_url, database_name, BATCH_SIZE_PAGERANK)
+
+        time_elapsed = time.time() - time_start
+        print(f'\n{written} scores written to the database')
+        print(f'Time Elapsed: {time_elapsed // 3600:.0f} hours {time_elapsed % 3600 // 60:.0f} minutes')
+
+        print('\nTop 10 papers in the database:')
+        for paper_id, title, score in top_papers(database_url, database_name):
+            print(f'{paper_id}: {score:.6e} {title}')
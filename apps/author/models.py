@@ -16,6 +16,11 @@ class AuthorOrganizationRel(StructuredRel):
 class Author(StructuredNode):
     author_id = IntegerProperty(unique_index=True, required=True)
     name = StringProperty(required=True)
+    h_index = IntegerProperty(index=True, default=None)
+    citation_count = IntegerProperty(default=None)
+    paper_count = IntegerProperty(default=None)
+    first_year = IntegerProperty(default=None)
+    last_year = IntegerProperty(default=None)
     organization = RelationshipTo('apps.institution.models.Organization', 'AFFILIATED_WITH', cardinality=ZeroOrMore, model=AuthorOrganizationRel)
     paper = RelationshipFrom('apps.paper.models.Paper', 'AUTHORED_BY', cardinality=ZeroOrMore)
 
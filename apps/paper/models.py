@@ -38,6 +38,7 @@ class Paper(StructuredNode):
     volume = IntegerProperty(max_length=4, default=None)
     issue = IntegerProperty(max_length=4, default=None)
     n_citation = IntegerProperty(default=0)
+    pagerank = FloatProperty(index=True, default=None)
 
     type = RelationshipTo('DocumentType', 'OF_TYPE', cardinality=One)
     publisher = RelationshipTo('apps.institution.models.Publisher', 'PUBLISHED_BY', cardinality=One)
@@ -0,0 +1,500 @@
+import re
+import time
+import asyncio
+from collections import deque
+from typing import Any, Dict, List, Optional, Tuple
+
+from neo4j.graph import Graph, Node
+from neomodel import db
+
+from database.utils import connection_manager
+
+
+# Answer of the server version query run by neomodel when a connection is set.
+SERVER_VERSION = ['5.19.0', 'community']
+
+# Queries of the neomodel OGM answered from the node store of the backend.
+CREATE_NODE_QUERY = re.compile(r'^\s*CREATE \(n:([\w:]+) \$create_params\) RETURN n\s*$')
+MATCH_NODE_QUERY = re.compile(r'^\s*MATCH \((\w+):(\w+)\) WHERE (.+) RETURN \1(?: LIMIT (\d+))?\s*$', re.DOTALL)
+MATCH_CONDITION = re.compile(r'^\w+\.(\w+) = \$(\w+)$')
+COUNT_NODES_QUERY = re.compile(r'^\s*MATCH \(n(?::(\w+))?\) RETURN count\(n\)\s*$')
+COUNT_QUERY = re.compile(r'RETURN count\(\w+\)\s*$')
+
+
+
+def normalize_query(query: str) -> str:
+    '''
+    Collapse the whitespace of a query, so the same statement built with a different indentation is counted once.
+    '''
+    return ' '.join(query.split())
+
+
+def count_rows(params: Optional[dict]) -> int:
+    '''
+    Get the number of rows sent with a statement: the length of its first list parameter ('rows', 'pairs', ...),
+    or 1 for a statement without list parameters.
+    '''
+    for value in (params or {}).values():
+        if isinstance(value, list):
+            return len(value)
+
+    return 1
+
+
+
+class FakeRecord:
+    '''
+    Record of a fake result, with the methods of 'neo4j.Record' used by the loaders.
+    '''
+    def __init__(self, keys: List[str], values: list) -> None:
+        self._keys = keys
+        self._values = values
+
+    def keys(self) -> List[str]:
+        return list(self._keys)
+
+    def values(self) -> list:
+        return list(self._values)
+
+    def data(self) -> dict:
+        return dict(zip(self._keys, self._values))
+
+    def __getitem__(self, key):
+        if isinstance(key, int):
+            return self._values[key]
+        return self._values[self._keys.index(key)]
+
+
+class FakeResult:
+    '''
+    Result of a fake query, with the methods of 'neo4j.Result' used by the loaders and neomodel.
+    '''
+    def __init__(self, keys: List[str], rows: List[list]) -> None:
+        self._keys = keys
+        self._records = [FakeRecord(keys, row) for row in rows]
+
+    def __iter__(self):
+        return iter(self._records)
+
+    def keys(self) -> List[str]:
+        return list(self._keys)
+
+    def data(self) -> List[dict]:
+        return [record.data() for record in self._records]
+
+    def single(self) -> Optional[FakeRecord]:
+        return self._records[0] if self._records else None
+
+    def consume(self) -> None:
+        self._records = []
+
+
+class FakeAsyncResult(FakeResult):
+    '''
+    Result of a fake query of the async driver.
+    '''
+    def __aiter__(self):
+        return self._iter_async()
+
+    async def _iter_async(self):
+        for record in self._records:
+            yield record
+
+    async def data(self) -> List[dict]:
+        return super().data()
+
+    async def single(self) -> Optional[FakeRecord]:
+        return super().single()
+
+    async def consume(self) -> None:
+        super().consume()
+
+
+class FakeTransaction:
+    '''
+    Explicit transaction of a fake session. The statements are recorded when they run,
+    the commit adds one round trip.
+    '''
+    def __init__(self, backend: 'RecordingBackend') -> None:
+        self.backend = backend
+        self.closed = False
+
+    def run(self, query: str, parameters: Optional[dict] = None, **kwargs) -> FakeResult:
+        return self.backend.run(query, {**(parameters or {}), **kwargs})
+
+    def commit(self) -> None:
+        self.backend.commit()
+        self.closed = True
+
+    def rollback(self) -> None:
+        self.backend.rollback()
+        self.closed = True
+
+    def close(self) -> None:
+        self.closed = True
+
+    def __enter__(self) -> 'FakeTransaction':
+        return self
+
+    def __exit__(self, exc_type, *args) -> None:
+        if not self.closed:
+            self.rollback() if exc_type else self.commit()
+
+
+class FakeSession:
+    '''
+    Session of the fake driver: auto-commit queries, explicit transactions and managed transactions.
+    '''
+    def __init__(self, backend: 'RecordingBackend') -> None:
+        self.backend = backend
+
+    def run(self, query: str, parameters: Optional[dict] = None, **kwargs) -> FakeResult:
+        return self.backend.run(query, {**(parameters or {}), **kwargs})
+
+    def begin_transaction(self, *args, **kwargs) -> FakeTransaction:
+        return FakeTransaction(self.backend)
+
+    def execute_write(self, work, *args, **kwargs):
+        with FakeTransaction(self.backend) as tx:
+            return work(tx, *args, **kwargs)
+
+    execute_read = execute_write
+
+    def last_bookmarks(self) -> None:
+        return None
+
+    def close(self) -> None:
+        pass
+
+    def __enter__(self) -> 'FakeSession':
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close()
+
+
+class FakeAsyncTransaction:
+    '''
+    Managed transaction of a fake async session.
+    '''
+    def __init__(self, backend: 'RecordingBackend') -> None:
+        self.backend = backend
+
+    async def run(self, query: str, parameters: Optional[dict] = None, **kwargs) -> FakeAsyncResult:
+        await self.backend.wait_async()
+        return self.backend.run(query, {**(parameters or {}), **kwargs}, result_class=FakeAsyncResult, wait=False)
+
+
+class FakeAsyncSession:
+    '''
+    Session of the fake async driver, only managed transactions are supported.
+    '''
+    def __init__(self, backend: 'RecordingBackend') -> None:
+        self.backend = backend
+
+    async def execute_write(self, work, *args, **kwargs):
+        result = await work(FakeAsyncTransaction(self.backend), *args, **kwargs)
+
+        await self.backend.wait_async()
+        self.backend.commit(wait=False)
+        return result
+
+    execute_read = execute_write
+
+    async def close(self) -> None:
+        pass
+
+    async def __aenter__(self) -> 'FakeAsyncSession':
+        return self
+
+    async def __aexit__(self, *args) -> None:
+        await self.close()
+
+
+class FakeDriver:
+    '''
+    Driver of the fake backend, returned by 'connection_manager.get_driver' while the backend is installed.
+    '''
+    def __init__(self, backend: 'RecordingBackend') -> None:
+        self.backend = backend
+
+    def session(self, **kwargs) -> FakeSession:
+        return FakeSession(self.backend)
+
+    def close(self) -> None:
+        pass
+
+
+class FakeAsyncDriver:
+    '''
+    Async driver of the fake backend, returned by 'connection_manager.get_async_driver' while the backend is installed.
+    '''
+    def __init__(self, backend: 'RecordingBackend') -> None:
+        self.backend = backend
+
+    def session(self, **kwargs) -> FakeAsyncSession:
+        return FakeAsyncSession(self.backend)
+
+    async def close(self) -> None:
+        pass
+
+
+class _FakeGraphDatabase:
+    def __init__(self, driver_class, backend: 'RecordingBackend') -> None:
+        self.driver_class = driver_class
+        self.backend = backend
+
+    def driver(self, uri: str, **kwargs):
+        return self.driver_class(self.backend)
+
+
+
+class RecordingBackend:
+    '''
+    Local stand-in of a Neo4j server to run the loaders without a database.
+    While it is installed (use it as a context manager), the shared drivers of 'database/utils/connection_manager.py'
+    are fake drivers: every query sent by neomodel ('database/load_by_model.py', 'database/utils/querys.py', ...),
+    by the sessions of the connection manager and by the async pipeline is accepted and recorded instead of being sent.
+
+    Round trips are counted as the Bolt protocol sends them: one per query (RUN and PULL are pipelined, and so is
+    the BEGIN of a transaction with its first query) and one per commit or rollback. An optional latency is added
+    to every round trip to model the network.
+
+    The backend keeps the nodes created by the neomodel OGM ('StructuredNode.save'), so 'nodes.get_or_none'
+    finds them afterwards and node counts are answered. Any other query returns no rows
+    (counts return 0): the UNWIND statements of the 'bulk' engine are recorded but not applied.
+
+    Worker processes started with fork use the backend of their parent, but their queries are not recorded
+    in the parent: measure 'ParallelConnectionLoader' in a single process.
+
+    Parameters
+    ----------
+    latency : float
+        Seconds added to every round trip. Default is 0.
+    max_log : int
+        Number of (query, parameters) statements kept in 'log', the oldest are dropped. Default is 1000.
+    '''
+    def __init__(self, latency: float = 0.0, max_log: int = 1000) -> None:
+        self.latency = latency
+        self.max_log = max_log
+
+        self._saved = None
+        self.reset()
+
+    def reset(self) -> None:
+        '''
+        Clear the recorded statements, the counters and the node store.
+        '''
+        self.log = deque(maxlen=self.max_log)
+        self.statements = {}
+        self.queries = 0
+        self.rows = 0
+        self.commits = 0
+        self.rollbacks = 0
+
+        self.nodes = {}
+        self.node_count = 0
+        self._node_index = {}
+
+    @property
+    def round_trips(self) -> int:
+        return self.queries + self.commits + self.rollbacks
+
+    def counters(self) -> Dict[str, int]:
+        '''
+        Get the counters of the backend.
+
+        Returns
+        -------
+        Dict[str, int]
+            queries, rows, commits, rollbacks and round_trips.
+        '''
+        return {'queries': self.queries, 'rows': self.rows, 'commits': self.commits,
+                'rollbacks': self.rollbacks, 'round_trips': self.round_trips}
+
+    def _wait(self) -> None:
+        if self.latency:
+            time.sleep(self.latency)
+
+    async def wait_async(self) -> None:
+        '''
+        Add the latency of a round trip without blocking the event loop.
+        '''
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+    def run(self, query: str, params: Optional[dict] = None, result_class=FakeResult, wait: bool = True) -> FakeResult:
+        '''
+        Record a query and answer it.
+
+        Parameters
+        ----------
+        query : str
+            Cypher query.
+        params : Optional[dict]
+            Parameters of the query.
+        result_class : type
+            Class of the result, FakeResult or FakeAsyncResult.
+        wait : bool
+            Add the latency of the round trip. Default is True.
+
+        Returns
+        -------
+        FakeResult
+            Result of the query.
+        '''
+        if wait:
+            self._wait()
+
+        rows = count_rows(params)
+        self.queries += 1
+        self.rows += rows
+        self.log.append((query, params))
+
+        stats = self.statements.setdefault(normalize_query(query), {'calls': 0, 'rows': 0})
+        stats['calls'] += 1
+        stats['rows'] += rows
+
+        return result_class(*self.answer(query, params or {}))
+
+    def commit(self, wait: bool = True) -> None:
+        if wait:
+            self._wait()
+        self.commits += 1
+
+    def rollback(self, wait: bool = True) -> None:
+        if wait:
+            self._wait()
+        self.rollbacks += 1
+
+    def create_node(self, labels: List[str], properties: dict) -> Node:
+        '''
+        Add a node to the store of the backend.
+
+        Parameters
+        ----------
+        labels : List[str]
+            Labels of the node.
+        properties : dict
+            Properties of the node.
+
+        Returns
+        -------
+        Node
+            Driver node, as the server returns it.
+        '''
+        node_id = self.node_count
+        node = Node(Graph(), f'4:fake:{node_id}', node_id, labels, properties)
+        self.node_count += 1
+
+        for label in labels:
+            self.nodes.setdefault(label, []).append(node)
+
+            for key, value in properties.items():
+                if isinstance(value, (str, int, float, bool)):
+                    self._node_index.setdefault((label, key, value), []).append(node)
+
+        return node
+
+    def find_nodes(self, label: str, conditions: Dict[str, Any]) -> List[Node]:
+        '''
+        Get the nodes of a label whose properties are equal to all the conditions.
+        '''
+        if not conditions:
+            return list(self.nodes.get(label, []))
+
+        (key, value), *others = conditions.items()
+        candidates = self._node_index.get((label, key, value), [])
+
+        return [node for node in candidates if all(node.get(other) == other_value for other, other_value in others)]
+
+    def answer(self, query: str, params: dict) -> Tuple[List[str], List[list]]:
+        '''
+        Build the result of a query: the keys and the rows.
+        '''
+        if 'dbms.components()' in query:
+            return ['versions[0]', 'edition'], [list(SERVER_VERSION)]
+
+        match = CREATE_NODE_QUERY.match(query)
+        if match:
+            return ['n'], [[self.create_node(match.group(1).split(':'), params.get('create_params', {}))]]
+
+        match = MATCH_NODE_QUERY.match(query)
+        if match:
+            conditions = {}
+
+            for condition in match.group(3).split(' AND '):
+                condition_match = MATCH_CONDITION.match(condition.strip())
+                if not condition_match:
+                    return [match.group(1)], []
+                conditions[condition_match.group(1)] = params.get(condition_match.group(2), None)
+
+            nodes = self.find_nodes(match.group(2), conditions)
+            if match.group(4):
+                nodes = nodes[:int(match.group(4))]
+
+            return [match.group(1)], [[node] for node in nodes]
+
+        match = COUNT_NODES_QUERY.match(query)
+        if match:
+            label = match.group(1)
+            count = len(self.nodes.get(label, [])) if label else self.node_count
+            return ['count(n)'], [[count]]
+
+        if COUNT_QUERY.search(query):
+            return ['count'], [[0]]
+
+        return [], []
+
+    def install(self) -> None:
+        '''
+        Replace the drivers of the connection manager by fake drivers. The drivers already open are closed.
+        '''
+        if self._saved is not None:
+            return
+
+        connection_manager.close_drivers()
+        self._saved = (connection_manager.GraphDatabase, connection_manager.AsyncGraphDatabase, db.driver)
+
+        connection_manager.GraphDatabase = _FakeGraphDatabase(FakeDriver, self)
+        connection_manager.AsyncGraphDatabase = _FakeGraphDatabase(FakeAsyncDriver, self)
+
+    def uninstall(self) -> None:
+        '''
+        Restore the drivers of the connection manager.
+        '''
+        if self._saved is None:
+            return
+
+        connection_manager.close_drivers()
+        connection_manager._async_drivers.clear()
+        connection_manager.GraphDatabase, connection_manager.AsyncGraphDatabase, db.driver = self._saved
+        self._saved = None
+
+    def __enter__(self) -> 'RecordingBackend':
+        self.install()
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.uninstall()
+
+    def summary(self, top: int = 10) -> dict:
+        '''
+        Get the counters and the statements that sent the most rows.
+
+        Parameters
+        ----------
+        top : int
+            Number of statements. Default is 10.
+
+        Returns
+        -------
+        dict
+            Counters of the backend and a 'statements' list of {'query', 'calls', 'rows'}.
+        '''
+        statements = sorted(self.statements.items(), key=lambda item: (item[1]['rows'], item[1]['calls']), reverse=True)
+
+        return {
+            **self.counters(),
+            'statements': [{'query': query, **stats} for query, stats in statements[:top]],
+        }
@@ -0,0 +1,275 @@
+import os
+import json
+from typing import Iterator, Optional
+
+import numpy as np
+
+
+# Document types of DBLP-v12 and their approximate share of the papers ('' is a paper without type).
+DOC_TYPES = ['Journal', 'Conference', 'Book', 'BookChapter', 'Patent', 'Repository', 'Thesis', '']
+DOC_TYPE_WEIGHTS = [0.45, 0.35, 0.02, 0.03, 0.01, 0.04, 0.01, 0.09]
+
+VENUE_TYPES = ['J', 'C', '']
+
+WORDS = [
+    'graph', 'network', 'learning', 'neural', 'data', 'analysis', 'model', 'system', 'distributed', 'query',
+    'optimization', 'algorithm', 'efficient', 'scalable', 'deep', 'citation', 'semantic', 'search', 'index', 'parallel',
+    'database', 'retrieval', 'clustering', 'embedding', 'stochastic', 'robust', 'adaptive', 'secure', 'wireless', 'image',
+]
+
+
+
+def power_law_weights(size: int, exponent: float) -> np.ndarray:
+    '''
+    Get the probabilities of a Zipf distribution over 'size' ranks: rank r is chosen with probability r ** -exponent.
+
+    Parameters
+    ----------
+    size : int
+        Number of ranks.
+    exponent : float
+        Exponent of the distribution, higher values concentrate the choices on the first ranks.
+
+    Returns
+    -------
+    np.ndarray
+        Probability of each rank.
+    '''
+    weights = np.arange(1, size + 1, dtype=np.float64) ** -exponent
+    return weights / weights.sum()
+
+
+def generate_papers(papers: int, seed: int = 0, authors: Optional[int] = None, organizations: Optional[int] = None,
+                    venues: Optional[int] = None, publishers: int = 500, fields_of_study: Optional[int] = None,
+                    mean_references: float = 9.3, mean_authors: float = 3.0, missing_references: float = 0.05,
+                    abstract_words: int = 120, chunk_size: int = 10000) -> Iterator[dict]:
+    '''
+    Generate records with the shape of DBLP-v12 ('dataset/dblp.v12.json'), in the order of the dataset
+    (increasing 'id' and year). The defaults follow the ratios of DBLP-v12: 4.9M papers, 45.6M references,
+    about 0.9 distinct authors per paper and 3 authors per paper.
+
+    Distributions:
+        - references: the number of references of a paper is log-normal, and every reference points to an earlier
+          paper chosen by preferential attachment (a paper that is cited more is more likely to be cited again),
+          so the citations per paper follow a power law (exponent about 2.5). A share of the references ('missing_references')
+          point to papers that are not in the dataset, like in DBLP.
+        - authorship: the number of authors of a paper is log-normal, and authors are chosen with a Zipf
+          distribution, so a few authors write many papers. Each author has a fixed organization.
+        - venues, publishers, fields of study and organizations are chosen with Zipf distributions.
+
+    Records are built in chunks that double in size up to 'chunk_size' papers. The papers of a chunk only cite
+    the papers of the previous chunks, so the first 16 papers have no references.
+
+    Parameters
+    ----------
+    papers : int
+        Number of papers.
+    seed : int
+        Seed of the random generator, the same seed gives the same records. Default is 0.
+    authors : Optional[int]
+        Number of distinct authors. Default is 0.9 per paper.
+    organizations : Optional[int]
+        Number of distinct organizations. Default is 1 per 20 authors.
+    venues : Optional[int]
+        Number of distinct venues. Default is 1 per 200 papers.
+    publishers : int
+        Number of distinct publishers. Default is 500.
+    fields_of_study : Optional[int]
+        Number of distinct fields of study. Default is 1 per 25 papers.
+    mean_references : float
+        Mean number of references per paper. Default is 9.3.
+    mean_authors : float
+        Mean number of authors per paper. Default is 3.
+    missing_references : float
+        Share of the references to papers that are not in the dataset. Default is 0.05.
+    abstract_words : int
+        Mean number of words of the abstracts ('indexed_abstract'), 0 to leave them out. Default is 120.
+    chunk_size : int
+        Maximum papers generated at a time. Default is 10000.
+
+    Yields
+    ------
+    dict
+        Paper record.
+    '''
+    rng = np.random.default_rng(seed)
+
+    authors = authors or max(1, int(papers * 0.9))
+    organizations = organizations or max(1, authors // 20)
+    venues = venues or max(1, papers // 200)
+    fields_of_study = fields_of_study or max(10, papers // 25)
+
+    author_weights = power_law_weights(authors, 0.8)
+    venue_weights = power_law_weights(venues, 1.0)
+    publisher_weights = power_law_weights(publishers, 1.2)
+    fos_weights = power_law_weights(fields_of_study, 1.0)
+
+    author_orgs = rng.choice(organizations, size=authors, p=power_law_weights(organizations, 1.0))
+    author_has_org = rng.random(authors) < 0.7
+    venue_types = rng.choice(VENUE_TYPES, size=venues, p=[0.5, 0.4, 0.1])
+    words = np.array(WORDS)
+
+    # Paper ids are increasing like in DBLP, with gaps for the papers that are not in the dataset
+    paper_ids = np.cumsum(rng.integers(1, 20, size=papers, dtype=np.int64)) + 1000
+    years = np.sort(rng.integers(1950, 2021, size=papers))
+
+    # Urn of the preferential attachment: every paper 'attractiveness' times, plus once per citation it received.
+    # The exponent of the citations per paper is about 2 + attractiveness / mean_references (2.5 by default).
+    attractiveness = max(1, int(round(mean_references / 2)))
+    urn = np.empty(max(1024, 2 * chunk_size), dtype=np.int32)
+    urn_size = 0
+
+    sigma = 1.0
+    mu_references = np.log(max(mean_references, 1e-9)) - sigma ** 2 / 2
+    mu_authors = np.log(max(mean_authors - 1, 1e-9)) - sigma ** 2 / 2
+
+    start = 0
+
+    while start < papers:
+        end = min(start + min(chunk_size, max(16, start)), papers)
+        size = end - start
+
+        n_references = np.floor(rng.lognormal(mu_references, sigma, size)).astype(np.int64) if mean_references else np.zeros(size, dtype=np.int64)
+        n_authors = 1 + np.floor(rng.lognormal(mu_authors, sigma, size)).astype(np.int64)
+        n_authors = np.minimum(n_authors, 50)
+        n_fos = rng.integers(1, 9, size=size)
+
+        if urn_size:
+            cited = urn[rng.integers(0, urn_size, size=int(n_references.sum()))]
+            cited_ids = paper_ids[cited]
+            missing = rng.random(len(cited_ids)) < missing_references
+            cited_ids[missing] = paper_ids[-1] + 1 + rng.integers(0, papers, size=int(missing.sum()))
+        else:
+            n_references[:] = 0
+            cited = np.empty(0, dtype=np.int32)
+            cited_ids = np.empty(0, dtype=np.int64)
+            missing = np.empty(0, dtype=bool)
+
+        author_idx = rng.choice(authors, size=int(n_authors.sum()), p=author_weights)
+        fos_idx = rng.choice(fields_of_study, size=int(n_fos.sum()), p=fos_weights)
+        fos_w = np.round(rng.uniform(0.3, 0.7, size=len(fos_idx)), 4)
+        venue_idx = rng.choice(venues, size=size, p=venue_weights)
+        publisher_idx = rng.choice(publishers, size=size, p=publisher_weights)
+        doc_types = rng.choice(DOC_TYPES, size=size, p=DOC_TYPE_WEIGHTS)
+        extras = rng.random((size, 6))
+        pages = rng.integers(1, 500, size=size)
+        n_citations = rng.zipf(2.0, size=size) - 1
+        title_words = rng.integers(0, len(WORDS), size=(size, 6))
+
+        ref_offsets = np.concatenate([[0], np.cumsum(n_references)])
+        author_offsets = np.concatenate([[0], np.cumsum(n_authors)])
+        fos_offsets = np.concatenate([[0], np.cumsum(n_fos)])
+
+        for i in range(size):
+            paper = start + i
+            paper_id = int(paper_ids[paper])
+
+            record = {
+                'id': paper_id,
+                'title': f'{" ".join(words[title_words[i]]).capitalize()} {paper_id}',
+                'authors': [],
+                'venue': {'raw': f'Venue {venue_idx[i]}', 'id': int(venue_idx[i]) + 1},
+                'year': int(years[paper]),
+                'keywords': list(words[title_words[i][:3]]),
+                'fos': [{'name': f'Field of study {fos}', 'w': float(w)}
+                        for fos, w in zip(fos_idx[fos_offsets[i]:fos_offsets[i + 1]], fos_w[fos_offsets[i]:fos_offsets[i + 1]])],
+                'references': sorted(set(cited_ids[ref_offsets[i]:ref_offsets[i + 1]].tolist())),
+                'n_citation': int(n_citations[i]),
+                'page_start': str(pages[i]),
+                'page_end': str(pages[i] + 10) if extras[i, 0] < 0.8 else f'e{pages[i]}',
+                'doc_type': str(doc_types[i]),
+                'publisher': f'Publisher {publisher_idx[i]}' if extras[i, 1] < 0.6 else '',
+                'volume': str(1 + paper % 60) if extras[i, 2] < 0.7 else '',
+                'issue': str(1 + paper % 12) if extras[i, 3] < 0.6 else '',
+                'doi': f'10.{1000 + paper % 9000}/{paper_id}' if extras[i, 4] < 0.7 else '',
+            }
+
+            for author in author_idx[author_offsets[i]:author_offsets[i + 1]]:
+                author_record = {'name': f'Author {author}', 'id': int(author) + 1}
+                if author_has_org[author]:
+                    author_record['org'] = f'Organization {author_orgs[author]}'
+                record['authors'].append(author_record)
+
+            if venue_types[venue_idx[i]]:
+                record['venue']['type'] = str(venue_types[venue_idx[i]])
+
+            if abstract_words:
+                length = int(rng.integers(abstract_words // 2, abstract_words * 3 // 2 + 1))
+                inverted_index = {}
+                for position, word in enumerate(rng.integers(0, len(WORDS), size=length)):
+                    inverted_index.setdefault(WORDS[word], []).append(position)
+                record['indexed_abstract'] = {'IndexLength': length, 'InvertedIndex': inverted_index}
+
+            yield record
+
+        # The papers of the chunk and their citations enter the urn after the chunk, see the docstring
+        added = np.concatenate([np.repeat(np.arange(start, end, dtype=np.int32), attractiveness), cited[~missing]])
+        if urn_size + len(added) > len(urn):
+            urn = np.resize(urn, 2 * (urn_size + len(added)))
+        urn[urn_size:urn_size + len(added)] = added
+        urn_size += len(added)
+        start = end
+
+
+def write_dataset(dataset_path: str, papers: int, seed: int = 0, **kwargs) -> dict:
+    '''
+    Write a synthetic dataset with the layout of 'dblp.v12.json': a JSON array with one paper per line,
+    every line after the first one starting with a comma. The file is written as UTF-8 and streamed,
+    so any scale fits in memory.
+
+    Parameters
+    ----------
+    dataset_path : str
+        Path of the dataset file.
+    papers : int
+        Number of papers.
+    seed : int
+        Seed of the random generator. Default is 0.
+    **kwargs
+        Other options of 'generate_papers'.
+
+    Returns
+    -------
+    dict
+        Number of papers, references, authorships and bytes written.
+    '''
+    stats = {'papers': 0, 'references': 0, 'authorships': 0, 'bytes': 0}
+
+    directory = os.path.dirname(dataset_path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+
+    with open(dataset_path, 'w', encoding='utf-8') as f:
+        f.write('[\n')
+
+        for record in generate_papers(papers, seed, **kwargs):
+            f.write((',' if stats['papers'] else '') + json.dumps(record, ensure_ascii=False) + '\n')
+
+            stats['papers'] += 1
+            stats['references'] += len(record['references'])
+            stats['authorships'] += len(record['authors'])
+
+        f.write(']\n')
+
+    stats['bytes'] = os.path.getsize(dataset_path)
+
+    return stats
+
+
+
+if __name__ == '__main__':
+    dataset_path = os.environ.get('BENCHMARK_DATASET_PATH', './dataset/benchmark.json')
+    papers = int(os.environ.get('BENCHMARK_PAPERS', 100000))
+    seed = int(os.environ.get('BENCHMARK_SEED', 0))
+
+    print('==========================')
+    print(' Generate Synthetic Dataset')
+    print('==========================')
+    print(f'Dataset: {dataset_path}')
+    print(f'Papers: {papers}')
+
+    stats = write_dataset(dataset_path, papers, seed)
+
+    print('\nDataset generated:')
+    for name, value in stats.items():
+        print(f'{name}: {value}')
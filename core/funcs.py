@@ -1,4 +1,17 @@
+from datetime import datetime
+from typing import Dict, List, Optional
+
 import chardet
+import numpy as np
+
+
+# Paper properties, in the order of the rows of 'paper_field_rows'.
+PAPER_FIELDS = ['paper_id', 'title', 'doi', 'year', 'page_start', 'page_end', 'volume', 'issue', 'n_citation']
+
+# Paper fields parsed from strings that are only kept when they are digit-only, see 'parse_digits_batch'.
+PAPER_DIGIT_FIELDS = ['page_start', 'page_end', 'volume', 'issue']
+
+POWERS_OF_TEN = 10 ** np.arange(18, dtype=np.int64)
 
 
 def detect_encoding(file_path: str) -> str:
@@ -20,3 +33,202 @@ def detect_encoding(file_path: str) -> str:
 
     result = chardet.detect(raw_data)
     return result['encoding']
+
+
+def normalize_fos_name(fos_name: str) -> str:
+    '''
+    Normalize a field of study name the way it is stored in the database.
+    Spaces are replaced by underscores and the name is lowercased.
+
+    Parameters
+    ----------
+    fos_name : str
+        Field of study name as it comes from the dataset.
+
+    Returns
+    -------
+    str
+        Normalized field of study name.
+    '''
+    return fos_name.replace(' ', '_').lower()
+
+
+def parse_digits_batch(values: list) -> np.ndarray:
+    '''
+    Parse a column of page, volume or issue values from the dataset at once.
+    Only digit-only values are kept; anything else (e.g. 'e123', '12-13') is discarded.
+
+    Parameters
+    ----------
+    values : list
+        Raw values from the dataset (str | int | None).
+
+    Returns
+    -------
+    np.ndarray
+        Parsed values (int64), 0 where the value is empty, zero, not digit-only or too long for an int64.
+    '''
+    if not len(values):
+        return np.zeros(0, dtype=np.int64)
+
+    # One row of code points per value, padded with zeros: the digits are checked and summed column by column.
+    # None is converted to 'None', which is not digit-only like any other invalid value
+    strings = np.array(values, dtype=str)
+    chars = strings.view(np.uint32).reshape(len(strings), -1)
+    lengths = np.count_nonzero(chars, axis=1)
+
+    padding = np.arange(chars.shape[1]) >= lengths[:, None]
+    valid = np.where(padding, chars == 0, (chars >= 48) & (chars <= 57)).all(axis=1) & (lengths > 0) & (lengths <= 18)
+
+    digits = chars[:, :18].astype(np.int64) - 48
+    exponents = lengths[:, None] - 1 - np.arange(digits.shape[1])
+    values = np.where(exponents >= 0, digits * POWERS_OF_TEN[np.clip(exponents, 0, 17)], 0).sum(axis=1)
+
+    return np.where(valid, values, 0)
+
+
+def parse_digits(value) -> Optional[int]:
+    '''
+    Parse a page, volume or issue value from the dataset, see 'parse_digits_batch'.
+
+    Parameters
+    ----------
+    value : str | int | None
+        Raw value from the dataset.
+
+    Returns
+    -------
+    Optional[int]
+        Parsed value, or None if the value is empty, zero, not digit-only or too long for an int64.
+    '''
+    return int(parse_digits_batch([value])[0]) or None
+
+
+def clean_paper_batch(nodes: list) -> Dict[str, np.ndarray]:
+    '''
+    Clean up the Paper fields of a batch of dataset records, one typed column per field.
+    Every loader cleans the Paper fields with this function, so all of them store the same values.
+
+    Parameters
+    ----------
+    nodes : list
+        A list of dictionaries containing the papers information, as they come from the dataset.
+
+    Returns
+    -------
+    Dict[str, np.ndarray]
+        Columns of the batch, in the order of 'nodes':
+            - paper_id, year, page_start, page_end, volume, issue and n_citation: int64. A missing
+              or invalid year, page, volume or issue is 0.
+            - title and doi: object. An empty doi is None.
+    '''
+    columns = {
+        'paper_id': np.array([int(obj['id']) for obj in nodes], dtype=np.int64),
+        'title': np.array([obj['title'] for obj in nodes], dtype=object),
+        'doi': np.array([obj.get('doi', None) or None for obj in nodes], dtype=object),
+    }
+
+    year = parse_digits_batch([obj.get('year', None) for obj in nodes])
+    year[year > 9999] = 0
+    columns['year'] = year
+
+    for field in PAPER_DIGIT_FIELDS:
+        columns[field] = parse_digits_batch([obj.get(field, None) for obj in nodes])
+
+    columns['n_citation'] = np.array([int(obj.get('n_citation', None) or 0) for obj in nodes], dtype=np.int64)
+
+    return columns
+
+
+def paper_parameter_columns(columns: Dict[str, np.ndarray], year_type: str = 'str') -> Dict[str, list]:
+    '''
+    Convert the columns of 'clean_paper_batch' to query parameters, one list per field.
+    Missing values (0) are None. The lists are sent as they are to the columnar UNWIND statements
+    ('UNWIND range(0, size($paper_id) - 1) AS i'), no dictionary is built per paper.
+
+    Parameters
+    ----------
+    columns : Dict[str, np.ndarray]
+        Columns returned by 'clean_paper_batch'.
+    year_type : str - Options: 'datetime', 'str', 'int'
+        Type of the year: 'datetime' for the neomodel properties, 'str' ('%Y') for query parameters
+        (how neomodel stores it), 'int' for the year number. Default is 'str'.
+
+    Returns
+    -------
+    Dict[str, list]
+        Lists of 'PAPER_FIELDS', in the order of the columns.
+
+    Raises
+    ------
+    ValueError
+        If the year type is invalid.
+    '''
+    year = columns['year']
+    valid_year = year > 0
+
+    if year_type == 'datetime':
+        years = [datetime(value, 1, 1) if value else None for value in year.tolist()]
+    elif year_type == 'str':
+        years = [str(value) if value else None for value in year.tolist()]
+    elif year_type == 'int':
+        years = np.where(valid_year, year, None).tolist()
+    else:
+        raise ValueError(f'Invalid year type: {year_type}. Options: \'datetime\', \'str\', \'int\'.')
+
+    parameters = {
+        'paper_id': columns['paper_id'].tolist(),
+        'title': columns['title'].tolist(),
+        'doi': columns['doi'].tolist(),
+        'year': years,
+    }
+
+    for field in PAPER_DIGIT_FIELDS:
+        parameters[field] = np.where(columns[field] > 0, columns[field], None).tolist()
+
+    parameters['n_citation'] = columns['n_citation'].tolist()
+
+    return parameters
+
+
+def paper_field_rows(columns: Dict[str, np.ndarray], year_type: str = 'datetime') -> List[dict]:
+    '''
+    Convert the columns of 'clean_paper_batch' to one dictionary of Paper fields per record,
+    for the loaders that handle one paper at a time (neomodel nodes, CSV rows, manifest hashes).
+    The bulk statements use 'paper_parameter_columns' instead.
+
+    Parameters
+    ----------
+    columns : Dict[str, np.ndarray]
+        Columns returned by 'clean_paper_batch'.
+    year_type : str - Options: 'datetime', 'str', 'int'
+        Type of the year, see 'paper_parameter_columns'. Default is 'datetime'.
+
+    Returns
+    -------
+    List[dict]
+        Paper fields: paper_id, title, doi, year, page_start, page_end, volume, issue and n_citation.
+    '''
+    parameters = paper_parameter_columns(columns, year_type)
+
+    return [dict(zip(PAPER_FIELDS, values)) for values in zip(*(parameters[field] for field in PAPER_FIELDS))]
+
+
+def clean_paper_fields(obj: dict, year_type: str = 'datetime') -> dict:
+    '''
+    Clean up the Paper fields of a dataset record, see 'clean_paper_batch'.
+
+    Parameters
+    ----------
+    obj : dict
+        A dictionary containing the paper's information, as it comes from the dataset.
+    year_type : str - Options: 'datetime', 'str', 'int'
+        Type of the year, see 'paper_parameter_columns'. Default is 'datetime'.
+
+    Returns
+    -------
+    dict
+        Cleaned Paper fields: paper_id, title, doi, year, page_start, page_end, volume, issue and n_citation.
+        A missing or invalid year, page, volume or issue is None.
+    '''
+    return paper_field_rows(clean_paper_batch([obj]), year_type)[0]
@@ -0,0 +1,330 @@
+import gc
+import time
+import asyncio
+import tempfile
+import threading
+from array import array
+from typing import Dict, Iterator, List, Optional, Union
+
+from tqdm import tqdm
+
+from core.enums.app_enums import AuthorApp, InstitutionApp, PaperApp
+
+from dataset.utils.dataset_reader import iter_dataset
+from dataset.utils.projection import get_projection
+
+from database.utils.connection_manager import async_session, close_async_drivers
+from database.utils.batch_sizer import AdaptiveBatchSizer, CONNECTIONS_BATCH_KEY, get_node_batch_key
+from database.utils.metrics import get_active_metrics
+from database.bulk_load_by_model import NODE_STATEMENTS, paper_connection_statements
+from database.load_citations import create_citations, iter_spooled_pairs
+
+
+# Records sent from the parser thread to the transform stage at a time.
+PARSE_CHUNK_SIZE = 1000
+
+# Models whose nodes are not protected by a uniqueness constraint (Venue is created with OPTIONAL MATCH + CREATE).
+# Only one of their transactions is in flight at a time, or two batches could create the same node.
+SERIAL_MODELS = [InstitutionApp.VENUE]
+
+
+
+def _parse_to_queue(records: Iterator[dict], queue: asyncio.Queue, loop: asyncio.AbstractEventLoop,
+                    stop: threading.Event, chunk_size: int) -> None:
+    '''
+    Parse stage, run in a thread. Put chunks of records in the queue, blocking while it is full.
+    The last item is None, or the exception raised by the parser.
+    '''
+    def put(item) -> None:
+        asyncio.run_coroutine_threadsafe(queue.put(item), loop).result()
+
+    try:
+        chunk = []
+        for obj in records:
+            if stop.is_set():
+                return
+
+            chunk.append(obj)
+            if len(chunk) >= chunk_size:
+                put(chunk)
+                chunk = []
+
+        if chunk:
+            put(chunk)
+        put(None)
+
+    except Exception as e:
+        put(e)
+
+
+async def _run_statements(database_url: str, database_name: str, statements: list) -> None:
+    '''
+    Run a list of (query, parameters) statements in one managed write transaction.
+    Deadlocks and other transient errors are retried by the driver.
+    '''
+    async def work(tx) -> None:
+        for query, params in statements:
+            result = await tx.run(query, params)
+            await result.consume()
+
+    async with async_session(database_url, database_name) as session:
+        await session.execute_write(work)
+
+
+async def populate_db_async(models: List[Union[AuthorApp, InstitutionApp, PaperApp]],
+                            dataset_path: str, dataset_encoding: str,
+                            batch_sizes: Dict[Union[AuthorApp, InstitutionApp, PaperApp], int],
+                            database_url: str, database_name: str,
+                            connection_models: Optional[List[Union[AuthorApp, InstitutionApp, PaperApp]]] = None,
+                            connections_batch_size: int = 5000, parse_workers: int = 1,
+                            citations_batch_size: int = 100000, write_concurrency: int = 4,
+                            queue_size: int = 8, batch_sizer: Optional[AdaptiveBatchSizer] = None,
+                            citations_transaction_size: int = 20000) -> dict:
+    '''
+    Populate the database with a pipeline of three stages joined by bounded queues, so parsing
+    and writing overlap instead of waiting on each other:
+        - parse: the dataset is read in a thread ('iter_dataset', which can itself use worker processes).
+        - transform: records are grouped in batches per model and turned into UNWIND statements,
+          the same ones as the 'bulk' engine ('database/bulk_load_by_model.py').
+        - write: up to 'write_concurrency' transactions are in flight on the async driver.
+    When a queue is full the stage before it waits, so memory stays bounded by the queue sizes.
+
+    Dependency ordering:
+        - A batch of connections is only written after every node batch sent before it is committed.
+        - Batches of models in 'SERIAL_MODELS' are written one at a time.
+        - PaperCitesRel connections are spooled and loaded after the pipeline, as in 'populate_db_single_pass'.
+
+    Inside a 'with LoadMetrics()' block, the parse, transform and write stages are recorded.
+    The 'write' stage of this engine includes the commit, managed transactions commit inside the driver.
+
+    Parameters
+    ----------
+    models : List[Union[AuthorApp, InstitutionApp, PaperApp]]
+        Models to populate. AuthorApp.AUTHOR and InstitutionApp.ORGANIZATION are loaded together.
+    dataset_path : str
+        Path to the dataset.
+    dataset_encoding : str
+        Encoding of the dataset.
+    batch_sizes : Dict[Union[AuthorApp, InstitutionApp, PaperApp], int]
+        Batch size of each model.
+    database_url : str
+        URL of the database.
+    database_name : str
+        Name of the database.
+    connection_models : Optional[List[Union[AuthorApp, InstitutionApp, PaperApp]]]
+        Models to connect to the Paper model, by default None (no connections are created).
+    connections_batch_size : int
+        Batch size to load the Paper connections. Default is 5000.
+    parse_workers : int
+        Number of processes used to parse the dataset. Default is 1.
+    citations_batch_size : int
+        References resolved and deduplicated at a time by the PaperCitesRel loader. Default is 100000.
+    write_concurrency : int
+        Maximum number of write transactions in flight. Default is 4.
+    queue_size : int
+        Maximum number of items waiting in each queue. Default is 8.
+    batch_sizer : Optional[AdaptiveBatchSizer]
+        Controller that adapts the batch sizes to the commit latency and the client memory, by default None.
+        Transactions that run out of memory are not split here, they fail the load.
+    citations_transaction_size : int
+        CITES relationships per transaction. Default is 20000.
+
+    Returns
+    -------
+    dict
+        records read, transactions written, and the PaperCitesRel loader totals ('citations') if they were loaded.
+    '''
+    models = list(dict.fromkeys(AuthorApp.AUTHOR if model == InstitutionApp.ORGANIZATION else model for model in models))
+    connection_models = connection_models or []
+    in_pass_connection_models = [model for model in connection_models if model != PaperApp.PAPER_CITES_REL]
+    defer_references = PaperApp.PAPER_CITES_REL in connection_models
+
+    loop = asyncio.get_running_loop()
+    records_queue = asyncio.Queue(queue_size)
+    write_queue = asyncio.Queue(queue_size)
+    stop = threading.Event()
+    stats = {'records': 0, 'transactions': 0}
+
+    if batch_sizer is not None:
+        for model in models:
+            batch_sizer.add(get_node_batch_key(model), batch_sizes[model])
+        if in_pass_connection_models:
+            batch_sizer.add(CONNECTIONS_BATCH_KEY, connections_batch_size)
+
+    def batch_size(key, size):
+        return batch_sizer.size(key) if batch_sizer is not None else size
+
+    metrics = get_active_metrics()
+
+    async def run_job(key, metrics_key, rows, statements) -> None:
+        time_start = time.perf_counter()
+        await _run_statements(database_url, database_name, statements)
+        seconds = time.perf_counter() - time_start
+
+        if batch_sizer is not None:
+            batch_sizer.record(key, rows, seconds)
+        if metrics is not None:
+            metrics.observe('write', seconds, sum(len(params.get('rows', ())) for query, params in statements), metrics_key)
+            metrics.maybe_export()
+
+    def build_statements(metrics_key, rows, build):
+        time_start = time.perf_counter()
+        statements = build()
+
+        if metrics is not None:
+            metrics.observe('transform', time.perf_counter() - time_start, rows, metrics_key)
+
+        return statements
+
+    async def transform(references_file) -> None:
+        batches = {model: [] for model in models}
+        connections_batch = []
+        references_buffer = array('q')
+
+        async def send_nodes(model) -> None:
+            if batches[model]:
+                statements = build_statements(model.value, len(batches[model]), lambda: NODE_STATEMENTS[model](batches[model]))
+                await write_queue.put((model, len(batches[model]), statements))
+                batches[model] = []
+
+        async def send_connections() -> None:
+            if connections_batch:
+                for model in models:
+                    await send_nodes(model)
+
+                statements = build_statements('connections', len(connections_batch),
+                                              lambda: paper_connection_statements(connections_batch, in_pass_connection_models))
+                await write_queue.put((None, len(connections_batch), statements))
+                connections_batch.clear()
+
+        with tqdm(desc='Loading dataset', unit=' papers') as progress:
+            while True:
+                chunk = await records_queue.get()
+
+                if chunk is None:
+                    break
+                if isinstance(chunk, Exception):
+                    raise chunk
+
+                for obj in chunk:
+                    for model in models:
+                        batches[model].append(obj)
+
+                        if len(batches[model]) >= batch_size(get_node_batch_key(model), batch_sizes[model]):
+                            await send_nodes(model)
+
+                    if in_pass_connection_models:
+                        connections_batch.append(obj)
+
+                        if len(connections_batch) >= batch_size(CONNECTIONS_BATCH_KEY, connections_batch_size):
+                            await send_connections()
+
+                    if defer_references and obj.get('references', None):
+                        paper_id = int(obj['id'])
+                        for ref_id in dict.fromkeys(obj['references']):
+                            references_buffer.extend((paper_id, int(ref_id)))
+
+                stats['records'] += len(chunk)
+                progress.update(len(chunk))
+
+                if len(references_buffer) >= 2 * citations_batch_size:
+                    references_buffer.tofile(references_file)
+                    references_buffer = array('q')
+
+        for model in models:
+            await send_nodes(model)
+        await send_connections()
+
+        references_buffer.tofile(references_file)
+        await write_queue.put(None)
+
+    async def write() -> None:
+        semaphore = asyncio.Semaphore(write_concurrency)
+        node_tasks = set()
+        serial_tasks = {}
+        errors = []
+
+        def done(task) -> None:
+            semaphore.release()
+            node_tasks.discard(task)
+
+            if not task.cancelled() and task.exception():
+                errors.append(task.exception())
+
+        while True:
+            job = await write_queue.get()
+
+            if errors:
+                raise errors[0]
+            if job is None:
+                break
+
+            model, rows, statements = job
+            if not statements:
+                continue
+
+            if model is None and node_tasks:
+                await asyncio.gather(*node_tasks)
+            if model in serial_tasks:
+                await serial_tasks.pop(model)
+
+            await semaphore.acquire()
+            if model is not None:
+                task = asyncio.create_task(run_job(get_node_batch_key(model), model.value, rows, statements))
+            else:
+                task = asyncio.create_task(run_job(CONNECTIONS_BATCH_KEY, 'connections', rows, statements))
+            task.add_done_callback(done)
+            stats['transactions'] += 1
+
+            if model is not None:
+                node_tasks.add(task)
+            if model in SERIAL_MODELS:
+                serial_tasks[model] = task
+
+        for _ in range(write_concurrency):
+            await semaphore.acquire()
+
+        if errors:
+            raise errors[0]
+
+    if models:
+        print(f'\nCreating {", ".join([model.value for model in models])} nodes')
+    if connection_models:
+        print(f'Creating {PaperApp.PAPER.value} connections: {", ".join([model.value for model in connection_models])}')
+
+    with tempfile.TemporaryFile() as references_file:
+        records = iter_dataset(dataset_path, dataset_encoding, workers=parse_workers,
+                               fields=get_projection(models, connection_models))
+
+        if metrics is not None:
+            records = metrics.timed_records(records)
+        parser = loop.run_in_executor(None, _parse_to_queue, records, records_queue, loop, stop, PARSE_CHUNK_SIZE)
+
+        stages = [asyncio.ensure_future(transform(references_file)), asyncio.ensure_future(write())]
+
+        try:
+            await asyncio.gather(*stages)
+
+        except BaseException:
+            stop.set()
+            for stage in stages:
+                stage.cancel()
+
+            # Unblock the parser if it is waiting on a full queue
+            while not records_queue.empty():
+                records_queue.get_nowait()
+            raise
+
+        finally:
+            await asyncio.gather(parser, return_exceptions=True)
+            await close_async_drivers()
+
+        if defer_references:
+            references_file.seek(0)
+            stats['citations'] = create_citations(iter_spooled_pairs(references_file, citations_batch_size),
+                                                  database_url, database_name, transaction_size=citations_transaction_size,
+                                                  batch_sizer=batch_sizer)
+
+    gc.collect()
+
+    return stats
@@ -0,0 +1,629 @@
+import gc
+import time
+from uuid import uuid4
+from typing import Union, Dict, List, Tuple
+
+import numpy as np
+
+from neomodel import db
+
+from core.enums.app_enums import AuthorApp, InstitutionApp, PaperApp
+from core.funcs import normalize_fos_name, clean_paper_batch, paper_parameter_columns
+from database.utils.connection_manager import use_database
+from database.utils.metrics import get_active_metrics
+
+
+
+def run_statements(statements: List[Tuple[str, dict]], database_url: str, database_name: str) -> None:
+    '''
+    Run a list of (query, parameters) statements in a single transaction.
+    The time spent running the statements ('write') and committing ('commit') is reported to the active metrics.
+
+    Parameters
+    ----------
+    statements : List[Tuple[str, dict]]
+        Statements to run, in order.
+    database_url : str
+        URL of the database.
+    database_name : str
+        Name of the database.
+    '''
+    use_database(database_url, database_name)
+
+    if statements:
+        time_start = time.perf_counter()
+
+        with db.transaction:
+            for query, params in statements:
+                db.cypher_query(query, params)
+            time_write = time.perf_counter()
+
+        metrics = get_active_metrics()
+        if metrics is not None:
+            rows = sum(len(params.get('rows', ())) for query, params in statements)
+            metrics.observe('write', time_write - time_start, rows)
+            metrics.observe('commit', time.perf_counter() - time_write)
+
+
+def document_type_statements(nodes: list) -> List[Tuple[str, dict]]:
+    '''
+    Build the statements of 'create_document_type_nodes'.
+
+    Parameters
+    ----------
+    nodes : list
+        A list of dictionaries containing the document type's information.
+
+    Returns
+    -------
+    List[Tuple[str, dict]]
+        Statements as (query, parameters), empty if there is nothing to write.
+    '''
+    doc_types = {obj['doc_type'] for obj in nodes if obj.get('doc_type', None)}
+    rows = [{'type': doc_type, 'type_id': uuid4().hex} for doc_type in doc_types]
+
+    if not rows:
+        return []
+
+    return [(
+        '''
+        UNWIND $rows AS row
+        MERGE (n:DocumentType {type: row.type})
+        ON CREATE SET n.type_id = row.type_id
+        ''',
+        {'rows': rows}
+    )]
+
+
+def create_document_type_nodes(nodes: list, database_url: str, database_name: str) -> None:
+    '''
+    Create nodes for each document type in the dataset with a single UNWIND statement.
+    Same behaviour as 'load_by_model.create_document_type_nodes', but in one round trip per batch.
+
+    Parameters
+    ----------
+    nodes : list
+        A list of dictionaries containing the document type's information.
+        Required fields:
+            - doc_type: str (required)
+                Document type.
+    database_url : str
+        URL of the database.
+    database_name : str
+        Name of the database.
+    '''
+    run_statements(document_type_statements(nodes), database_url, database_name)
+
+    gc.collect()
+
+
+def publisher_statements(nodes: list) -> List[Tuple[str, dict]]:
+    '''
+    Build the statements of 'create_publisher_nodes'.
+
+    Parameters
+    ----------
+    nodes : list
+        A list of dictionaries containing the publisher's information.
+
+    Returns
+    -------
+    List[Tuple[str, dict]]
+        Statements as (query, parameters), empty if there is nothing to write.
+    '''
+    publishers = {obj['publisher'] for obj in nodes if obj.get('publisher', None)}
+    rows = [{'name': publisher, 'pub_id': uuid4().hex} for publisher in publishers]
+
+    if not rows:
+        return []
+
+    return [(
+        '''
+        UNWIND $rows AS row
+        MERGE (n:Publisher {name: row.name})
+        ON CREATE SET n.pub_id = row.pub_id
+        ''',
+        {'rows': rows}
+    )]
+
+
+def create_publisher_nodes(nodes: list, database_url: str, database_name: str) -> None:
+    '''
+    Create nodes for each publisher in the dataset with a single UNWIND statement.
+    Same behaviour as 'load_by_model.create_publisher_nodes', but in one round trip per batch.
+
+    Parameters
+    ----------
+    nodes : list
+        A list of dictionaries containing the publisher's information.
+        Required fields:
+            - publisher: str (required)
+                Publisher name.
+    database_url : str
+        URL of the database.
+    database_name : str
+        Name of the database.
+    '''
+    run_statements(publisher_statements(nodes), database_url, database_name)
+
+    gc.collect()
+
+
+def venue_statements(nodes: list) -> List[Tuple[str, dict]]:
+    '''
+    Build the statements of 'create_venue_nodes'.
+
+    Parameters
+    ----------
+    nodes : list
+        A list of dictionaries containing the venue's information.
+
+    Returns
+    -------
+    List[Tuple[str, dict]]
+        Statements as (query, parameters), empty if there is nothing to write.
+    '''
+    venues = {}
+    for obj in nodes:
+        venue = obj.get('venue', None)
+
+        if venue and venue.get('raw', None) and venue['raw'] not in venues:
+            venues[venue['raw']] = {'name': venue['raw'], 'type': venue.get('type', None) or None, 'venue_id': uuid4().hex}
+
+    if not venues:
+        return []
+
+    venue_types = {row['type'] for row in venues.values() if row['type']}
+    venue_type_rows = [{'type': venue_type, 'venue_type_id': uuid4().hex} for venue_type in venue_types]
+    statements = []
+
+    if venue_type_rows:
+        statements.append((
+            '''
+            UNWIND $rows AS row
+            MERGE (t:VenueType {type: row.type})
+            ON CREATE SET t.venue_type_id = row.venue_type_id
+            ''',
+            {'rows': venue_type_rows}
+        ))
+
+    statements.append((
+        '''
+        UNWIND $rows AS row
+        OPTIONAL MATCH (existing:Venue {name: row.name})
+        WITH row, existing
+        WHERE existing IS NULL
+        CREATE (v:Venue {name: row.name, venue_id: row.venue_id})
+        WITH v, row
+        WHERE row.type IS NOT NULL
+        MATCH (t:VenueType {type: row.type})
+        CREATE (v)-[:OF_TYPE]->(t)
+        ''',
+        {'rows': list(venues.values())}
+    ))
+
+    return statements
+
+
+def create_venue_nodes(nodes: list, database_url: str, database_name: str) -> None:
+    '''
+    Create nodes for each venue and venue type in the dataset with UNWIND statements.
+    Same behaviour as 'load_by_model.create_venue_nodes': the venue is connected to its
+    venue type only when the venue is created.
+
+    Parameters
+    ----------
+    nodes : list
+        A list of dictionaries containing the venue's information.
+        Required fields:
+            - venue: dict (required)
+                Venue information.
+                - id: int (required)
+                    Venue ID.
+                - raw: str (required)
+                    Venue name.
+                - type: str (optional)
+                    Venue type.
+    database_url : str
+        URL of the database.
+    database_name : str
+        Name of the database.
+    '''
+    run_statements(venue_statements(nodes), database_url, database_name)
+
+    gc.collect()
+
+
+def author_org_statements(nodes: list) -> List[Tuple[str, dict]]:
+    '''
+    Build the statements of 'create_author_org_nodes'.
+
+    Parameters
+    ----------
+    nodes : list
+        A list of dictionaries containing the author's and organization's information.
+
+    Returns
+    -------
+    List[Tuple[str, dict]]
+        Statements as (query, parameters), empty if there is nothing to write.
+    '''
+    authors = {}
+    organizations = {}
+    affiliations = {}
+    for obj in nodes:
+        for author in obj.get('authors', []):
+            author_id = author.get('id', None)
+            org_name = author.get('org', None)
+
+            if author_id is None:
+                continue
+
+            author_id = int(author_id)
+            if author_id not in authors:
+                authors[author_id] = {'author_id': author_id, 'name': author.get('name', None)}
+
+            if org_name:
+                if org_name not in organizations:
+                    organizations[org_name] = {'name': org_name, 'org_id': uuid4().hex}
+
+                if (author_id, org_name) not in affiliations:
+                    affiliations[(author_id, org_name)] = {'author_id': author_id, 'org': org_name, 'author_org_id': uuid4().hex}
+
+    if not authors:
+        return []
+
+    statements = [(
+        '''
+        UNWIND $rows AS row
+        MERGE (a:Author {author_id: row.author_id})
+        ON CREATE SET a.name = row.name
+        ''',
+        {'rows': list(authors.values())}
+    )]
+
+    if organizations:
+        statements.append((
+            '''
+            UNWIND $rows AS row
+            MERGE (o:Organization {name: row.name})
+            ON CREATE SET o.org_id = row.org_id
+            ''',
+            {'rows': list(organizations.values())}
+        ))
+
+        statements.append((
+            '''
+            UNWIND $rows AS row
+            MATCH (a:Author {author_id: row.author_id})
+            MATCH (o:Organization {name: row.org})
+            MERGE (a)-[r:AFFILIATED_WITH]->(o)
+            ON CREATE SET r.author_org_id = row.author_org_id
+            ''',
+            {'rows': list(affiliations.values())}
+        ))
+
+    return statements
+
+
+def create_author_org_nodes(nodes: list, database_url: str, database_name: str) -> None:
+    '''
+    Create nodes for each author and organization in the dataset with UNWIND statements.
+    Same behaviour as 'load_by_model.create_author_org_nodes': authors are merged by id,
+    organizations by name, and each author is connected to its organization.
+
+    Parameters
+    ----------
+    nodes : list
+        A list of dictionaries containing the author's and organization's information.
+        Required fields:
+            - authors: list (required)
+                List of authors.
+                - id: int (required)
+                    Author ID.
+                - name: str (required)
+                    Author name.
+                - org: str
+                    Organization name.
+    database_url : str
+        URL of the database.
+    database_name : str
+        Name of the database.
+    '''
+    run_statements(author_org_statements(nodes), database_url, database_name)
+
+    gc.collect()
+
+
+def fos_statements(nodes: list) -> List[Tuple[str, dict]]:
+    '''
+    Build the statements of 'create_fos_nodes'.
+
+    Parameters
+    ----------
+    nodes : list
+        A list of dictionaries containing the field of study's information.
+
+    Returns
+    -------
+    List[Tuple[str, dict]]
+        Statements as (query, parameters), empty if there is nothing to write.
+    '''
+    fos_names = {normalize_fos_name(fos['name']) for obj in nodes for fos in obj.get('fos', []) if fos.get('name', None)}
+    rows = [{'name': fos_name, 'fos_id': uuid4().hex} for fos_name in fos_names]
+
+    if not rows:
+        return []
+
+    return [(
+        '''
+        UNWIND $rows AS row
+        MERGE (n:FieldOfStudy {name: row.name})
+        ON CREATE SET n.fos_id = row.fos_id
+        ''',
+        {'rows': rows}
+    )]
+
+
+def create_fos_nodes(nodes: list, database_url: str, database_name: str) -> None:
+    '''
+    Create nodes for each field of study in the dataset with a single UNWIND statement.
+    Same behaviour as 'load_by_model.create_fos_nodes', names are normalized with 'normalize_fos_name'.
+
+    Parameters
+    ----------
+    nodes : list
+        A list of dictionaries containing the field of study's information.
+        Required fields:
+            - fos: list (required)
+                List of field of study.
+                Required fields:
+                    - name: str (required)
+                        Field of study name.
+    database_url : str
+        URL of the database.
+    database_name : str
+        Name of the database.
+    '''
+    run_statements(fos_statements(nodes), database_url, database_name)
+
+    gc.collect()
+
+
+
+
+def paper_columns(nodes: list) -> Dict[str, list]:
+    '''
+    Build the columnar UNWIND parameters of the Paper nodes of a batch of dataset records.
+    Fields are cleaned with 'clean_paper_batch' and deflated the same way neomodel stores them,
+    one list per property ('paper_parameter_columns'), no dictionary is built per paper.
+    When a paper id is repeated, the first record is kept.
+
+    Parameters
+    ----------
+    nodes : list
+        A list of dictionaries containing the papers information, as they come from the dataset.
+
+    Returns
+    -------
+    Dict[str, list]
+        Paper properties ready to be sent as query parameters, one list per property and one value per paper id.
+    '''
+    columns = clean_paper_batch(nodes)
+
+    paper_ids, first = np.unique(columns['paper_id'], return_index=True)
+    if len(paper_ids) < len(nodes):
+        first.sort()
+        columns = {field: values[first] for field, values in columns.items()}
+
+    return paper_parameter_columns(columns, year_type='str')
+
+
+def paper_statements(nodes: list) -> List[Tuple[str, dict]]:
+    '''
+    Build the statements of 'create_paper_nodes'.
+
+    Parameters
+    ----------
+    nodes : list
+        A list of dictionaries containing the papers information.
+
+    Returns
+    -------
+    List[Tuple[str, dict]]
+        Statements as (query, parameters), empty if there is nothing to write.
+    '''
+    columns = paper_columns(nodes)
+
+    if not columns['paper_id']:
+        return []
+
+    return [(
+        '''
+        UNWIND range(0, size($paper_id) - 1) AS i
+        MERGE (p:Paper {paper_id: $paper_id[i]})
+        ON CREATE SET p.title = $title[i],
+                      p.doi = $doi[i],
+                      p.year = $year[i],
+                      p.page_start = $page_start[i],
+                      p.page_end = $page_end[i],
+                      p.volume = $volume[i],
+                      p.issue = $issue[i],
+                      p.n_citation = $n_citation[i]
+        ''',
+        columns
+    )]
+
+
+def create_paper_nodes(nodes: list, database_url: str, database_name: str) -> None:
+    '''
+    Create nodes for each paper in the dataset with a single UNWIND statement.
+    Same behaviour as 'load_by_model.create_paper_nodes', papers already in the database are not modified.
+
+    Parameters
+    ----------
+    nodes : list
+        A list of dictionaries containing the papers information.
+        Required fields:
+            - id: int (required)
+                Paper ID.
+            - title: str (required)
+                Paper title.
+    database_url : str (required)
+        URL of the database.
+    database_name : str (required)
+        Name of the database.
+    '''
+    run_statements(paper_statements(nodes), database_url, database_name)
+
+    gc.collect()
+
+
+PAPER_CONNECTION_QUERIES = {
+    PaperApp.DOCUMENT_TYPE: '''
+        UNWIND $rows AS row
+        MATCH (p:Paper {paper_id: row.paper_id, title: row.title})
+        MATCH (d:DocumentType {type: row.doc_type})
+        MERGE (p)-[:OF_TYPE]->(d)
+        ''',
+    InstitutionApp.PUBLISHER: '''
+        UNWIND $rows AS row
+        MATCH (p:Paper {paper_id: row.paper_id, title: row.title})
+        MATCH (n:Publisher {name: row.publisher})
+        MERGE (p)-[:PUBLISHED_BY]->(n)
+        ''',
+    InstitutionApp.VENUE: '''
+        UNWIND $rows AS row
+        MATCH (p:Paper {paper_id: row.paper_id, title: row.title})
+        MATCH (v:Venue {name: row.venue})
+        MERGE (p)-[:PRESENTED_AT]->(v)
+        ''',
+    AuthorApp.AUTHOR: '''
+        UNWIND $rows AS row
+        MATCH (p:Paper {paper_id: row.paper_id, title: row.title})
+        MATCH (a:Author {author_id: row.author_id})
+        MERGE (p)-[:AUTHORED_BY]->(a)
+        ''',
+    PaperApp.FIELD_OF_STUDY: '''
+        UNWIND $rows AS row
+        MATCH (p:Paper {paper_id: row.paper_id, title: row.title})
+        MATCH (f:FieldOfStudy {name: row.fos})
+        MERGE (p)-[r:RELATED_TO]->(f)
+        ON CREATE SET r.weight = row.weight, r.paper_fos_id = row.paper_fos_id
+        ''',
+    PaperApp.PAPER_CITES_REL: '''
+        UNWIND $rows AS row
+        MATCH (p:Paper {paper_id: row.paper_id, title: row.title})
+        MATCH (ref:Paper {paper_id: row.ref_id})
+        MERGE (p)-[:CITES]->(ref)
+        ''',
+}
+
+
+def paper_connection_rows(nodes: list, models_list: List[Union[AuthorApp, InstitutionApp, PaperApp]]) -> dict:
+    '''
+    Build the UNWIND rows of every Paper relationship type in 'models_list'.
+
+    Parameters
+    ----------
+    nodes : list
+        A list of dictionaries containing the papers information.
+    models_list : list (required) - Options: AuthorApp, InstitutionApp, PaperApp
+        A list of models to connect to the Paper model.
+
+    Returns
+    -------
+    dict
+        Rows for each model in 'models_list', keyed by model. Models without rows are left out.
+    '''
+    connect_authors = AuthorApp.AUTHOR in models_list or InstitutionApp.ORGANIZATION in models_list
+    rows = {model: [] for model in PAPER_CONNECTION_QUERIES}
+
+    for obj in nodes:
+        paper = {'paper_id': int(obj['id']), 'title': obj['title']}
+
+        doc_type = obj.get('doc_type', None)
+        publisher = obj.get('publisher', None)
+        venue = obj.get('venue', None)
+
+        if doc_type and PaperApp.DOCUMENT_TYPE in models_list:
+            rows[PaperApp.DOCUMENT_TYPE].append({**paper, 'doc_type': doc_type})
+
+        if publisher and InstitutionApp.PUBLISHER in models_list:
+            rows[InstitutionApp.PUBLISHER].append({**paper, 'publisher': publisher})
+
+        if venue and venue.get('raw', None) and InstitutionApp.VENUE in models_list:
+            rows[InstitutionApp.VENUE].append({**paper, 'venue': venue['raw']})
+
+        if connect_authors:
+            for author in obj.get('authors', []):
+                if author.get('id', None) is not None:
+                    rows[AuthorApp.AUTHOR].append({**paper, 'author_id': int(author['id'])})
+
+        if PaperApp.FIELD_OF_STUDY in models_list:
+            for fos in obj.get('fos', []):
+                rows[PaperApp.FIELD_OF_STUDY].append({**paper,
+                                                      'fos': normalize_fos_name(fos['name']),
+                                                      'weight': float(fos.get('w', 0.0)),
+                                                      'paper_fos_id': uuid4().hex})
+
+        if PaperApp.PAPER_CITES_REL in models_list:
+            for ref_id in set(obj.get('references', [])):
+                rows[PaperApp.PAPER_CITES_REL].append({**paper, 'ref_id': int(ref_id)})
+
+    return {model: model_rows for model, model_rows in rows.items() if model_rows}
+
+
+def paper_connection_statements(nodes: list, models_list: List[Union[AuthorApp, InstitutionApp, PaperApp]]) -> List[Tuple[str, dict]]:
+    '''
+    Build the statements of 'create_paper_connections'.
+
+    Parameters
+    ----------
+    nodes : list
+        A list of dictionaries containing the papers information.
+    models_list : list (required) - Options: AuthorApp, InstitutionApp, PaperApp
+        A list of models to connect to the Paper model.
+
+    Returns
+    -------
+    List[Tuple[str, dict]]
+        Statements as (query, parameters), one per relationship type with rows.
+    '''
+    return [(PAPER_CONNECTION_QUERIES[model], {'rows': model_rows})
+            for model, model_rows in paper_connection_rows(nodes, models_list).items()]
+
+
+def create_paper_connections(nodes: list, database_url: str, database_name: str,
+                             models_list: List[Union[AuthorApp, InstitutionApp, PaperApp]]) -> None:
+    '''
+    Create relationships for each paper in the dataset with one UNWIND statement per relationship type.
+    Same requirements as 'load_by_model.create_paper_connections': the Paper nodes and the nodes
+    of every model in 'models_list' need to be created before calling this function.
+
+    Parameters
+    ----------
+    nodes : list
+        A list of dictionaries containing the papers information.
+    database_url : str (required)
+        URL of the database.
+    database_name : str (required)
+        Name of the database.
+    models_list : list (required) - Options: AuthorApp, InstitutionApp, PaperApp
+        A list of models to connect to the Paper model. It is necessary to have the models nodes created before calling this function.
+    '''
+    run_statements(paper_connection_statements(nodes, models_list), database_url, database_name)
+
+    gc.collect()
+
+
+# Statements builder of the nodes of each model.
+NODE_STATEMENTS = {
+    PaperApp.DOCUMENT_TYPE: document_type_statements,
+    InstitutionApp.PUBLISHER: publisher_statements,
+    InstitutionApp.VENUE: venue_statements,
+    AuthorApp.AUTHOR: author_org_statements,
+    InstitutionApp.ORGANIZATION: author_org_statements,
+    PaperApp.FIELD_OF_STUDY: fos_statements,
+    PaperApp.PAPER: paper_statements,
+}
@@ -0,0 +1,320 @@
+import os
+import gc
+import csv
+import gzip
+from os.path import join
+from uuid import uuid4
+from typing import Dict, Iterable, Iterator, List, Tuple
+
+import dotenv
+from tqdm import tqdm
+
+from core.funcs import detect_encoding, normalize_fos_name, clean_paper_batch, paper_field_rows
+from dataset.utils.dataset_reader import iter_dataset
+from dataset.utils.projection import CONNECTION_FIELDS, MODEL_FIELDS, get_projection
+
+
+# Headers of the node files. The ':ID(<space>)' column is only used to match relationships and is not stored,
+# the key properties of the models are written in their own columns.
+NODE_HEADERS = {
+    'Paper': [':ID(Paper)', 'paper_id:long', 'title', 'doi', 'year', 'page_start:long', 'page_end:long',
+              'volume:long', 'issue:long', 'n_citation:long'],
+    'Author': [':ID(Author)', 'author_id:long', 'name'],
+    'Organization': [':ID(Organization)', 'org_id', 'name'],
+    'Publisher': [':ID(Publisher)', 'pub_id', 'name'],
+    'Venue': [':ID(Venue)', 'venue_id', 'name'],
+    'VenueType': [':ID(VenueType)', 'venue_type_id', 'type'],
+    'DocumentType': [':ID(DocumentType)', 'type_id', 'type'],
+    'FieldOfStudy': [':ID(FieldOfStudy)', 'fos_id', 'name'],
+}
+
+# Relationship files: file name -> (relationship type, header)
+RELATIONSHIP_HEADERS = {
+    'Paper_AUTHORED_BY': ('AUTHORED_BY', [':START_ID(Paper)', ':END_ID(Author)']),
+    'Author_AFFILIATED_WITH': ('AFFILIATED_WITH', [':START_ID(Author)', ':END_ID(Organization)', 'author_org_id']),
+    'Paper_PUBLISHED_BY': ('PUBLISHED_BY', [':START_ID(Paper)', ':END_ID(Publisher)']),
+    'Paper_PRESENTED_AT': ('PRESENTED_AT', [':START_ID(Paper)', ':END_ID(Venue)']),
+    'Paper_OF_TYPE': ('OF_TYPE', [':START_ID(Paper)', ':END_ID(DocumentType)']),
+    'Venue_OF_TYPE': ('OF_TYPE', [':START_ID(Venue)', ':END_ID(VenueType)']),
+    'Paper_RELATED_TO': ('RELATED_TO', [':START_ID(Paper)', ':END_ID(FieldOfStudy)', 'paper_fos_id', 'weight:double']),
+    'Paper_CITES': ('CITES', [':START_ID(Paper)', ':END_ID(Paper)']),
+}
+
+
+
+class ChunkedCsvWriter:
+    '''
+    Write CSV rows to gzip-compressed chunk files, with the header in its own file.
+    Files are named '<name>-header.csv' and '<name>-00000.csv.gz', '<name>-00001.csv.gz', ...
+
+    Parameters
+    ----------
+    directory : str
+        Output directory.
+    name : str
+        File name prefix.
+    header : List[str]
+        Header row.
+    rows_per_chunk : int
+        Rows per chunk file. Default is 1,000,000.
+    '''
+    def __init__(self, directory: str, name: str, header: List[str], rows_per_chunk: int = 1000000) -> None:
+        self.directory = directory
+        self.name = name
+        self.rows_per_chunk = rows_per_chunk
+        self.rows = 0
+        self.files = []
+
+        self._file = None
+        self._writer = None
+
+        os.makedirs(directory, exist_ok=True)
+        self.header_file = join(directory, f'{name}-header.csv')
+
+        with open(self.header_file, 'w', encoding='utf-8', newline='') as f:
+            csv.writer(f).writerow(header)
+
+    def _next_chunk(self) -> None:
+        self.close()
+
+        path = join(self.directory, f'{self.name}-{len(self.files):05d}.csv.gz')
+        self._file = gzip.open(path, 'wt', encoding='utf-8', newline='', compresslevel=1)
+        self._writer = csv.writer(self._file)
+        self.files.append(path)
+
+    def writerow(self, row: list) -> None:
+        '''
+        Write a row, starting a new chunk file when the current one is full.
+
+        Parameters
+        ----------
+        row : list
+            Row values. None is written as an empty field.
+        '''
+        if self._writer is None or self.rows % self.rows_per_chunk == 0:
+            self._next_chunk()
+
+        self._writer.writerow(row)
+        self.rows += 1
+
+    def close(self) -> None:
+        '''
+        Close the current chunk file.
+        '''
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+            self._writer = None
+
+    def import_argument(self, kind: str, label: str) -> str:
+        '''
+        Get the 'neo4j-admin database import' argument of the files written.
+
+        Parameters
+        ----------
+        kind : str
+            Options: 'nodes', 'relationships'.
+        label : str
+            Node label or relationship type.
+
+        Returns
+        -------
+        str
+            Argument, e.g. '--nodes=Paper=nodes/Paper-header.csv,nodes/Paper-00000.csv.gz'.
+        '''
+        files = [self.header_file] + self.files
+        return f'--{kind}={label}={",".join(files)}'
+
+
+def iter_paper_rows(records: Iterable[dict], batch_size: int = 10000) -> Iterator[Tuple[dict, dict]]:
+    '''
+    Pair each dataset record with its Paper properties, cleaned with 'clean_paper_batch' a batch at a time.
+
+    Parameters
+    ----------
+    records : Iterable[dict]
+        Dataset records.
+    batch_size : int
+        Records cleaned at a time. Default is 10000.
+
+    Yields
+    ------
+    Tuple[dict, dict]
+        The record and its Paper properties, with the year as a '%Y' string like the 'bulk' engine stores it.
+    '''
+    batch = []
+
+    for obj in records:
+        batch.append(obj)
+
+        if len(batch) >= batch_size:
+            yield from zip(batch, paper_field_rows(clean_paper_batch(batch), year_type='str'))
+            batch = []
+
+    if batch:
+        yield from zip(batch, paper_field_rows(clean_paper_batch(batch), year_type='str'))
+
+
+def export_admin_import(dataset_path: str, dataset_encoding: str, export_path: str,
+                        rows_per_chunk: int = 1000000, parse_workers: int = 1) -> Dict[str, int]:
+    '''
+    Export the dataset to node and relationship CSV files for 'neo4j-admin database import full'.
+    Records are streamed and written to compressed chunk files as they are read, and nodes
+    and relationships are deduplicated on the fly with the same rules as the loaders:
+        - Paper nodes by paper_id, Author nodes by author_id.
+        - Dimension nodes by name or type. Field of study names are normalized with 'normalize_fos_name'.
+        - Venues are connected to the venue type of their first occurrence.
+        - Repeated authors, fields of study and references of a paper are written once.
+    The keys kept to deduplicate are the only state that grows with the dataset.
+    CITES relationships to papers that are not in the dataset are skipped by the import ('--skip-bad-relationships').
+
+    An 'import.args' file with the arguments of the import is written to 'export_path'. Run it with:
+        neo4j-admin database import full <database> @<export_path>/import.args
+
+    Parameters
+    ----------
+    dataset_path : str
+        Path to the dataset.
+    dataset_encoding : str
+        Encoding of the dataset.
+    export_path : str
+        Output directory.
+    rows_per_chunk : int
+        Rows per chunk file. Default is 1,000,000.
+    parse_workers : int
+        Number of processes used to parse the dataset. Default is 1.
+
+    Returns
+    -------
+    Dict[str, int]
+        Rows written to each file.
+    '''
+    nodes = {label: ChunkedCsvWriter(join(export_path, 'nodes'), label, header, rows_per_chunk)
+             for label, header in NODE_HEADERS.items()}
+    relationships = {name: ChunkedCsvWriter(join(export_path, 'relationships'), name, header, rows_per_chunk)
+                     for name, (rel_type, header) in RELATIONSHIP_HEADERS.items()}
+
+    seen = {label: set() for label in NODE_HEADERS}
+    affiliations = set()
+
+    def write_node(label: str, key, row: list) -> None:
+        if key not in seen[label]:
+            seen[label].add(key)
+            nodes[label].writerow([key] + row)
+
+    # Every loaded field, most of the record: it is parsed whole and the abstract is dropped
+    fields = get_projection(MODEL_FIELDS, CONNECTION_FIELDS)
+    records = iter_dataset(dataset_path, dataset_encoding, workers=parse_workers, fields=fields)
+
+    for obj, paper in tqdm(iter_paper_rows(records), desc='Exporting dataset', unit=' papers'):
+        paper_id = paper['paper_id']
+
+        if paper_id in seen['Paper']:
+            continue
+
+        write_node('Paper', paper_id, [paper_id, paper['title'], paper['doi'], paper['year'], paper['page_start'],
+                                       paper['page_end'], paper['volume'], paper['issue'], paper['n_citation']])
+
+        doc_type = obj.get('doc_type', None)
+        if doc_type:
+            write_node('DocumentType', doc_type, [uuid4().hex, doc_type])
+            relationships['Paper_OF_TYPE'].writerow([paper_id, doc_type])
+
+        publisher = obj.get('publisher', None)
+        if publisher:
+            write_node('Publisher', publisher, [uuid4().hex, publisher])
+            relationships['Paper_PUBLISHED_BY'].writerow([paper_id, publisher])
+
+        venue = obj.get('venue', None)
+        if venue and venue.get('raw', None):
+            venue_name = venue['raw']
+            venue_type = venue.get('type', None)
+
+            if venue_name not in seen['Venue']:
+                write_node('Venue', venue_name, [uuid4().hex, venue_name])
+
+                if venue_type:
+                    write_node('VenueType', venue_type, [uuid4().hex, venue_type])
+                    relationships['Venue_OF_TYPE'].writerow([venue_name, venue_type])
+
+            relationships['Paper_PRESENTED_AT'].writerow([paper_id, venue_name])
+
+        paper_authors = set()
+        for author in obj.get('authors', []):
+            if author.get('id', None) is None:
+                continue
+
+            author_id = int(author['id'])
+            org_name = author.get('org', None)
+            write_node('Author', author_id, [author_id, author.get('name', None)])
+
+            if author_id not in paper_authors:
+                paper_authors.add(author_id)
+                relationships['Paper_AUTHORED_BY'].writerow([paper_id, author_id])
+
+            if org_name:
+                write_node('Organization', org_name, [uuid4().hex, org_name])
+
+                if (author_id, org_name) not in affiliations:
+                    affiliations.add((author_id, org_name))
+                    relationships['Author_AFFILIATED_WITH'].writerow([author_id, org_name, uuid4().hex])
+
+        paper_fos = set()
+        for fos in obj.get('fos', []):
+            fos_name = normalize_fos_name(fos['name'])
+            write_node('FieldOfStudy', fos_name, [uuid4().hex, fos_name])
+
+            if fos_name not in paper_fos:
+                paper_fos.add(fos_name)
+                relationships['Paper_RELATED_TO'].writerow([paper_id, fos_name, uuid4().hex, float(fos.get('w', 0.0))])
+
+        for ref_id in dict.fromkeys(obj.get('references', [])):
+            relationships['Paper_CITES'].writerow([paper_id, int(ref_id)])
+
+    for writer in list(nodes.values()) + list(relationships.values()):
+        writer.close()
+
+    arguments = [
+        '--overwrite-destination=true',
+        '--multiline-fields=true',
+        '--ignore-empty-strings=true',
+        '--skip-bad-relationships=true',
+        '--skip-duplicate-nodes=false',
+    ]
+    arguments += [writer.import_argument('nodes', label) for label, writer in nodes.items() if writer.rows]
+    arguments += [writer.import_argument('relationships', RELATIONSHIP_HEADERS[name][0])
+                  for name, writer in relationships.items() if writer.rows]
+
+    with open(join(export_path, 'import.args'), 'w', encoding='utf-8') as f:
+        f.write('\n'.join(arguments) + '\n')
+
+    gc.collect()
+
+    return {name: writer.rows for name, writer in {**nodes, **relationships}.items()}
+
+
+
+
+if __name__ == '__main__':
+    dotenv_path = join(os.path.dirname(__file__), '.env')
+    dotenv.load_dotenv(dotenv_path)
+
+    dataset_path = os.environ.get('DATASET_PATH', './dataset/dblp.v12.json')
+    dataset_encoding = detect_encoding(dataset_path)
+    export_path = os.environ.get('EXPORT_PATH', './dataset/neo4j-import')
+    parse_workers = int(os.environ.get('PARSE_WORKERS', 1))
+
+    print('===================================')
+    print(' Export Dataset for neo4j-admin')
+    print('===================================')
+    print(f'Dataset: {dataset_path}')
+    print(f'Export path: {export_path}')
+
+    rows = export_admin_import(dataset_path, dataset_encoding, export_path, parse_workers=parse_workers)
+
+    print('\nRows exported:')
+    for name, count in rows.items():
+        print(f'{name}: {count}')
+
+    print('\nStop the database and run the import with:')
+    print(f'neo4j-admin database import full <database> @{join(export_path, "import.args")}')
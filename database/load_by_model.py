@@ -1,10 +1,14 @@
 import gc
-from datetime import datetime
-from typing import Union, List
+from uuid import uuid4
+from contextlib import nullcontext
+from typing import Union, List, Optional, Tuple
 
-from neomodel import config, db
+from neomodel import db
 
 from core.enums.app_enums import AuthorApp, InstitutionApp, PaperApp
+from core.funcs import normalize_fos_name, clean_paper_batch, paper_field_rows
+from database.utils.entity_cache import EntityCache
+from database.utils.connection_manager import use_database
 
 from apps.author.models import Author
 from apps.institution.models import Organization, Publisher, Venue, VenueType
@@ -12,7 +16,129 @@ from apps.paper.models import Paper, FieldOfStudy, DocumentType
 
 
 
-def create_document_type_nodes(nodes: list, database_url: str, database_name: str) -> None:
+def get_or_create_node_id(model, key_property: str, key, cache: Optional[EntityCache] = None,
+                          **properties) -> Tuple[str, bool]:
+    '''
+    Get the element id of a node by its key property, creating the node if it does not exist.
+    When a cache is given, the node is only looked up in the database if it is not cached.
+
+    Parameters
+    ----------
+    model : StructuredNode
+        Model of the node.
+    key_property : str
+        Key property of the node.
+    key : Any
+        Value of the key property.
+    cache : Optional[EntityCache]
+        Cache of node element ids, by default None.
+    **properties
+        Other properties to set when the node is created.
+
+    Returns
+    -------
+    Tuple[str, bool]
+        element_id : str
+            Element id of the node.
+        created : bool
+            True if the node was created.
+    '''
+    if cache is not None:
+        element_id = cache.get(model.__label__, key)
+        if element_id:
+            return element_id, False
+
+    created = False
+    node = model.nodes.get_or_none(**{key_property: key})
+
+    if not node:
+        node = model(**{key_property: key}, **properties).save()
+        created = True
+
+    if cache is not None:
+        cache.put(model.__label__, key, node.element_id)
+
+    return node.element_id, created
+
+
+def get_node_id(model, key_property: str, key, cache: Optional[EntityCache] = None,
+                required: bool = True) -> Optional[str]:
+    '''
+    Get the element id of an existing node by its key property.
+    When a cache is given, the node is only looked up in the database if it is not cached.
+
+    Parameters
+    ----------
+    model : StructuredNode
+        Model of the node.
+    key_property : str
+        Key property of the node.
+    key : Any
+        Value of the key property.
+    cache : Optional[EntityCache]
+        Cache of node element ids, by default None.
+    required : bool
+        Raise 'DoesNotExist' if the node does not exist, otherwise return None. Default is True.
+
+    Returns
+    -------
+    Optional[str]
+        Element id of the node.
+    '''
+    if cache is not None:
+        element_id = cache.get(model.__label__, key)
+        if element_id:
+            return element_id
+
+    if required:
+        node = model.nodes.get(**{key_property: key})
+    else:
+        node = model.nodes.get_or_none(**{key_property: key})
+
+    if not node:
+        return None
+
+    if cache is not None:
+        cache.put(model.__label__, key, node.element_id)
+
+    return node.element_id
+
+
+def cache_transaction(cache: Optional[EntityCache]):
+    '''
+    Stage the entries of a cache until the transaction is committed ('EntityCache.transaction'), nothing without a cache.
+    '''
+    return cache.transaction() if cache is not None else nullcontext()
+
+
+def connect_node_ids(start_id: str, rel_type: str, end_id: str, properties: Optional[dict] = None) -> None:
+    '''
+    Connect two nodes by their element ids, if they are not connected yet.
+    Same as 'is_connected' + 'connect' of a neomodel relationship, in a single query.
+
+    Parameters
+    ----------
+    start_id : str
+        Element id of the start node.
+    rel_type : str
+        Relationship type.
+    end_id : str
+        Element id of the end node.
+    properties : Optional[dict]
+        Properties to set when the relationship is created, by default None.
+    '''
+    db.cypher_query(
+        f'''
+        MATCH (a) WHERE elementId(a) = $start_id
+        MATCH (b) WHERE elementId(b) = $end_id
+        MERGE (a)-[r:{rel_type}]->(b)
+        ON CREATE SET r += $properties
+        ''',
+        {'start_id': start_id, 'end_id': end_id, 'properties': properties or {}}
+    )
+
+
+def create_document_type_nodes(nodes: list, database_url: str, database_name: str, cache: Optional[EntityCache] = None) -> None:
     '''
     Create nodes for each document type in the dataset with neomodel.
     Using the DocumentType model.
@@ -28,24 +154,22 @@ def create_document_type_nodes(nodes: list, database_url: str, database_name: st
         URL of the database.
     database_name : str
         Name of the database.
+    cache : Optional[EntityCache]
+        Cache of node element ids shared across batches, by default None.
     '''
-    config.DATABASE_URL = database_url
-    config.DATABASE_NAME = database_name
+    use_database(database_url, database_name)
 
-    with db.transaction:
+    with cache_transaction(cache), db.transaction:
         for obj in nodes:
             doc_type = obj.get('doc_type', None)
 
             if doc_type:
-                doc_type_node = DocumentType.nodes.get_or_none(type=doc_type)
-
-                if not doc_type_node:
-                    doc_type_node = DocumentType(type=doc_type).save()
+                get_or_create_node_id(DocumentType, 'type', doc_type, cache)
 
     gc.collect()
 
 
-def create_publisher_nodes(nodes: list, database_url: str, database_name: str) -> None:
+def create_publisher_nodes(nodes: list, database_url: str, database_name: str, cache: Optional[EntityCache] = None) -> None:
     '''
     Create nodes for each publisher in the dataset with neomodel.
     Using the Publisher model.
@@ -61,24 +185,22 @@ def create_publisher_nodes(nodes: list, database_url: str, database_name: str) -
         URL of the database.
     database_name : str
         Name of the database.
+    cache : Optional[EntityCache]
+        Cache of node element ids shared across batches, by default None.
     '''
-    config.DATABASE_URL = database_url
-    config.DATABASE_NAME = database_name
+    use_database(database_url, database_name)
 
-    with db.transaction:
+    with cache_transaction(cache), db.transaction:
         for obj in nodes:
             publisher = obj.get('publisher', None)
 
             if publisher:
-                publisher_node = Publisher.nodes.get_or_none(name=publisher)
-
-                if not publisher_node:
-                    publisher_node = Publisher(name=publisher).save()
+                get_or_create_node_id(Publisher, 'name', publisher, cache)
 
     gc.collect()
 
 
-def create_venue_nodes(nodes: list, database_url: str, database_name: str) -> None:
+def create_venue_nodes(nodes: list, database_url: str, database_name: str, cache: Optional[EntityCache] = None) -> None:
     '''
     Create nodes for each venue and venue type in the dataset with neomodel.
     Using the Venue model and VenueType model.
@@ -100,11 +222,12 @@ def create_venue_nodes(nodes: list, database_url: str, database_name: str) -> No
         URL of the database.
     database_name : str
         Name of the database.
+    cache : Optional[EntityCache]
+        Cache of node element ids shared across batches, by default None.
     '''
-    config.DATABASE_URL = database_url
-    config.DATABASE_NAME = database_name
+    use_database(database_url, database_name)
 
-    with db.transaction:
+    with cache_transaction(cache), db.transaction:
         for obj in nodes:
             venue = obj.get('venue', None)
 
@@ -112,24 +235,16 @@ def create_venue_nodes(nodes: list, database_url: str, database_name: str) -> No
                 venue_name = venue.get('raw', None)
                 venue_type = venue.get('type', None)
 
-                venue_node = Venue.nodes.get_or_none(name=venue_name)
-
-                if not venue_node:
-                    venue_node = Venue(name=venue_name).save()
-
-                    if venue_type:
-                        venue_type_node = VenueType.nodes.get_or_none(type=venue_type)
+                venue_node_id, venue_created = get_or_create_node_id(Venue, 'name', venue_name, cache)
 
-                        if not venue_type_node:
-                            venue_type_node = VenueType(type=venue_type).save()
-
-                        if not venue_node.type.is_connected(venue_type_node):
-                            venue_node.type.connect(venue_type_node)
+                if venue_created and venue_type:
+                    venue_type_node_id, _ = get_or_create_node_id(VenueType, 'type', venue_type, cache)
+                    connect_node_ids(venue_node_id, 'OF_TYPE', venue_type_node_id)
 
     gc.collect()
 
 
-def create_author_org_nodes(nodes: list, database_url: str, database_name: str) -> None:
+def create_author_org_nodes(nodes: list, database_url: str, database_name: str, cache: Optional[EntityCache] = None) -> None:
     '''
     Create nodes for each author and organization in the dataset with neomodel.
     Using the Author model and Organization model.
@@ -151,11 +266,12 @@ def create_author_org_nodes(nodes: list, database_url: str, database_name: str)
         URL of the database.
     database_name : str
         Name of the database.
+    cache : Optional[EntityCache]
+        Cache of node element ids shared across batches, by default None.
     '''
-    config.DATABASE_URL = database_url
-    config.DATABASE_NAME = database_name
+    use_database(database_url, database_name)
 
-    with db.transaction:
+    with cache_transaction(cache), db.transaction:
         for obj in nodes:
             authors = obj.get('authors', [])
 
@@ -164,24 +280,16 @@ def create_author_org_nodes(nodes: list, database_url: str, database_name: str)
                 author_name = author.get('name', None)
                 org_name = author.get('org', None)
 
-                author_node = Author.nodes.get_or_none(author_id=author_id)
-
-                if not author_node:
-                    author_node = Author(author_id=author_id, name=author_name).save()
+                author_node_id, _ = get_or_create_node_id(Author, 'author_id', author_id, cache, name=author_name)
 
                 if org_name:
-                    organization_node = Organization.nodes.get_or_none(name=org_name)
-
-                    if not organization_node:
-                        organization_node = Organization(name=org_name).save()
-
-                    if not author_node.organization.is_connected(organization_node):
-                        author_node.organization.connect(organization_node)
+                    organization_node_id, _ = get_or_create_node_id(Organization, 'name', org_name, cache)
+                    connect_node_ids(author_node_id, 'AFFILIATED_WITH', organization_node_id, {'author_org_id': uuid4().hex})
 
     gc.collect()
 
 
-def create_fos_nodes(nodes: list, database_url: str, database_name: str) -> None:
+def create_fos_nodes(nodes: list, database_url: str, database_name: str, cache: Optional[EntityCache] = None) -> None:
     '''
     Create nodes for each field of study in the dataset with neomodel.
     Using the FieldOfStudy model.
@@ -201,23 +309,19 @@ def create_fos_nodes(nodes: list, database_url: str, database_name: str) -> None
         URL of the database.
     database_name : str
         Name of the database.
+    cache : Optional[EntityCache]
+        Cache of node element ids shared across batches, by default None.
     '''
-    config.DATABASE_URL = database_url
-    config.DATABASE_NAME = database_name
+    use_database(database_url, database_name)
 
-    with db.transaction:
+    with cache_transaction(cache), db.transaction:
         for obj in nodes:
             fields_of_study = obj.get('fos', [])
 
             for fos in fields_of_study:
-                fos_name = fos.get('name', None)
-                fos_name = fos_name.replace(' ', '_')
-                fos_name = fos_name.lower()
-
-                fos_node = FieldOfStudy.nodes.get_or_none(name=fos_name)
+                fos_name = normalize_fos_name(fos.get('name', None))
 
-                if not fos_node:
-                    fos_node = FieldOfStudy(name=fos_name).save()
+                get_or_create_node_id(FieldOfStudy, 'name', fos_name, cache)
 
     gc.collect()
 
@@ -242,57 +346,21 @@ def create_paper_nodes(nodes: list, database_url: str, database_name: str) -> No
     database_name : str (required)
         Name of the database.
     '''
-    config.DATABASE_URL = database_url
-    config.DATABASE_NAME = database_name
+    use_database(database_url, database_name)
 
     with db.transaction:
-        for obj in nodes:
-            paper_id = int(obj['id'])
-            title = obj['title']
-            doi = obj.get('doi', None)
-            year = obj.get('year', None)
-            page_start = obj.get('page_start', None)
-            page_end = obj.get('page_end', None)
-            volume = obj.get('volume', None)
-            issue = obj.get('issue', None)
-            n_citation = obj.get('n_citation', 0)
-
-            # Clean up paper data
-            if doi == '':
-                doi = None
-            if year:
-                year = datetime.strptime(str(year), '%Y')
-            if page_start:
-                page_start = int(page_start) if page_start.isdigit() else None
-            if page_end:
-                page_end = int(page_end) if page_end.isdigit() else None
-            if volume:
-                volume = int(volume) if volume.isdigit() else None
-            if issue:
-                issue = int(issue) if issue.isdigit() else None
-
-
-            paper_node = Paper.nodes.get_or_none(paper_id=paper_id, title=title)
+        for paper_fields in paper_field_rows(clean_paper_batch(nodes)):
+            paper_node = Paper.nodes.get_or_none(paper_id=paper_fields['paper_id'], title=paper_fields['title'])
 
             if not paper_node:
-
-                paper = Paper(
-                    paper_id=paper_id,
-                    title=title,
-                    doi=doi,
-                    year=year if year else None,
-                    page_start=int(page_start) if page_start else None,
-                    page_end=int(page_end) if page_end else None,
-                    volume=int(volume) if volume else None,
-                    issue=int(issue) if issue else None,
-                    n_citation=n_citation
-                ).save()
+                paper = Paper(**paper_fields).save()
 
     gc.collect()
 
 
 def create_paper_connections(nodes: list, database_url: str, database_name: str,
-                             models_list: List[Union[AuthorApp, InstitutionApp, PaperApp]]) -> None:
+                             models_list: List[Union[AuthorApp, InstitutionApp, PaperApp]],
+                             cache: Optional[EntityCache] = None) -> None:
     '''
     Create relationships for each paper in the dataset with neomodel.
     It is necessary to have the Paper nodes created before calling this function.
@@ -314,11 +382,12 @@ def create_paper_connections(nodes: list, database_url: str, database_name: str,
         Name of the database.
     models_list : list (required) - Options: AuthorApp, InstitutionApp, PaperApp
         A list of models to connect to the Paper model. It is necessary to have the models nodes created before calling this function.
+    cache : Optional[EntityCache]
+        Cache of node element ids shared across batches, by default None.
     '''
-    config.DATABASE_URL = database_url
-    config.DATABASE_NAME = database_name
+    use_database(database_url, database_name)
 
-    with db.transaction:
+    with cache_transaction(cache), db.transaction:
         for obj in nodes:
             paper_id = obj['id']
             paper_title = obj['title']
@@ -334,57 +403,46 @@ def create_paper_connections(nodes: list, database_url: str, database_name: str,
             paper = Paper.nodes.get_or_none(paper_id=paper_id, title=paper_title)
 
             if paper:
-                if doc_type and PaperApp.DOCUMENT_TYPE in models_list:
-                    doc_type_node = DocumentType.nodes.get(type=doc_type)
+                paper_node_id = paper.element_id
 
-                    if not paper.type.is_connected(doc_type_node):
-                        paper.type.connect(doc_type_node)
+                if doc_type and PaperApp.DOCUMENT_TYPE in models_list:
+                    doc_type_node_id = get_node_id(DocumentType, 'type', doc_type, cache)
+                    connect_node_ids(paper_node_id, 'OF_TYPE', doc_type_node_id)
 
 
                 if publisher and InstitutionApp.PUBLISHER in models_list:
-                    publisher_node = Publisher.nodes.get(name=publisher)
-
-                    if not paper.publisher.is_connected(publisher_node):
-                        paper.publisher.connect(publisher_node)
+                    publisher_node_id = get_node_id(Publisher, 'name', publisher, cache)
+                    connect_node_ids(paper_node_id, 'PUBLISHED_BY', publisher_node_id)
 
 
                 if venue and InstitutionApp.VENUE in models_list:
                     venue_name = venue.get('raw', None)
-                    venue_node = Venue.nodes.get(name=venue_name)
-
-                    if not paper.venue.is_connected(venue_node):
-                        paper.venue.connect(venue_node)
+                    venue_node_id = get_node_id(Venue, 'name', venue_name, cache)
+                    connect_node_ids(paper_node_id, 'PRESENTED_AT', venue_node_id)
 
 
                 if AuthorApp.AUTHOR in models_list or InstitutionApp.ORGANIZATION in models_list:
                     for author in authors:
                         author_id = author.get('id', None)
-                        author_node = Author.nodes.get(author_id=author_id)
-
-                        if not paper.author.is_connected(author_node):
-                            paper.author.connect(author_node)
+                        author_node_id = get_node_id(Author, 'author_id', author_id, cache)
+                        connect_node_ids(paper_node_id, 'AUTHORED_BY', author_node_id)
 
 
                 if PaperApp.FIELD_OF_STUDY in models_list:
                     for fos in fields_of_study:
-                        fos_name = fos.get('name', None)
-                        fos_name = fos_name.replace(' ', '_')
-                        fos_name = fos_name.lower()
+                        fos_name = normalize_fos_name(fos.get('name', None))
                         fos_weight = fos.get('w', 0.0)
 
-                        fos_node = FieldOfStudy.nodes.get(name=fos_name)
-
-                        if not paper.field_of_study.is_connected(fos_node):
-                            paper.field_of_study.connect(fos_node, {'weight': fos_weight})
+                        fos_node_id = get_node_id(FieldOfStudy, 'name', fos_name, cache)
+                        connect_node_ids(paper_node_id, 'RELATED_TO', fos_node_id, {'paper_fos_id': uuid4().hex, 'weight': float(fos_weight)})
 
 
                 if PaperApp.PAPER_CITES_REL in models_list:
                     for ref_id in references:
                         ref_id = int(ref_id)
-                        ref_node = Paper.nodes.get_or_none(paper_id=ref_id)
+                        ref_node_id = get_node_id(Paper, 'paper_id', ref_id, cache, required=False)
 
-                        if ref_node:
-                            if not paper.reference.is_connected(ref_node):
-                                paper.reference.connect(ref_node)
+                        if ref_node_id:
+                            connect_node_ids(paper_node_id, 'CITES', ref_node_id)
 
     gc.collect()
\ No newline at end of file
@@ -0,0 +1,322 @@
+import gc
+import time
+from array import array
+from contextlib import nullcontext
+from typing import Iterator, Optional, Tuple
+
+import numpy as np
+from tqdm import tqdm
+from neomodel import db
+
+from dataset.utils.columnar_cache import get_cache_dir, is_cache_valid, read_table
+from dataset.utils.dataset_reader import iter_dataset
+
+from database.utils.connection_manager import session, use_database
+from database.utils.batch_sizer import AdaptiveBatchSizer
+from database.utils.metrics import get_active_metrics
+
+
+# Key of the CITES transactions in the adaptive batch sizer.
+CITES_BATCH_KEY = 'BATCH_SIZE_CITES_TRANSACTION'
+
+# Key of the CITES batches in the load metrics.
+CITES_METRICS_KEY = 'PaperCitesRel'
+
+
+
+class PaperNodeIndex:
+    '''
+    Map of 'paper_id' to element id of every Paper node in the database.
+    Both arrays are sorted by 'paper_id', so a whole batch of ids is resolved with one 'np.searchsorted'.
+    Paper ids are int64 and element ids are ASCII bytes of fixed width: 4.9M papers take about 260 MB.
+
+    Parameters
+    ----------
+    paper_ids : np.ndarray
+        Paper ids.
+    node_ids : np.ndarray
+        Element ids of the nodes ('elementId'), in the same order as 'paper_ids'.
+    '''
+    def __init__(self, paper_ids: np.ndarray, node_ids: np.ndarray) -> None:
+        order = np.argsort(paper_ids, kind='stable')
+        self.paper_ids = np.ascontiguousarray(np.asarray(paper_ids, dtype=np.int64)[order])
+        self.node_ids = np.ascontiguousarray(np.asarray(node_ids)[order].astype(np.bytes_))
+
+    def __len__(self) -> int:
+        return len(self.paper_ids)
+
+    def resolve(self, paper_ids: np.ndarray) -> np.ndarray:
+        '''
+        Get the element ids of a batch of paper ids.
+
+        Parameters
+        ----------
+        paper_ids : np.ndarray
+            Paper ids to resolve.
+
+        Returns
+        -------
+        np.ndarray
+            Element id of each paper id (bytes), or b'' if there is no Paper node with that id.
+        '''
+        paper_ids = np.asarray(paper_ids, dtype=np.int64)
+
+        if not len(self.paper_ids):
+            return np.full(len(paper_ids), b'', dtype=np.bytes_)
+
+        positions = np.searchsorted(self.paper_ids, paper_ids)
+        positions = np.minimum(positions, len(self.paper_ids) - 1)
+        found = self.paper_ids[positions] == paper_ids
+
+        return np.where(found, self.node_ids[positions], b'')
+
+
+def load_paper_node_index(database_url: str, database_name: str, fetch_size: int = 100000) -> PaperNodeIndex:
+    '''
+    Load the 'paper_id' and element id of every Paper node.
+    The result is streamed from the driver into compact arrays, one chunk of 'fetch_size' records at a time,
+    it is never held as a list of records.
+
+    Parameters
+    ----------
+    database_url : str
+        URL of the database.
+    database_name : str
+        Name of the database.
+    fetch_size : int
+        Records fetched from the server at a time. Default is 100000.
+
+    Returns
+    -------
+    PaperNodeIndex
+        Index of the Paper nodes.
+    '''
+    paper_ids = array('q')
+    node_ids = []
+    chunk = []
+
+    with session(database_url, database_name, fetch_size=fetch_size) as driver_session:
+        result = driver_session.run('MATCH (p:Paper) RETURN p.paper_id AS paper_id, elementId(p) AS node_id')
+
+        for record in tqdm(result, desc='Loading Paper node ids', unit=' papers'):
+            paper_ids.append(record['paper_id'])
+            chunk.append(record['node_id'])
+
+            if len(chunk) == fetch_size:
+                node_ids.append(np.array(chunk, dtype=np.bytes_))
+                chunk = []
+
+    node_ids.append(np.array(chunk, dtype=np.bytes_))
+
+    return PaperNodeIndex(np.frombuffer(paper_ids, dtype=np.int64), np.concatenate(node_ids))
+
+
+def iter_reference_pairs(dataset_path: str, dataset_encoding: str,
+                         batch_size: int = 100000, parse_workers: int = 1) -> Iterator[Tuple[np.ndarray, np.ndarray]]:
+    '''
+    Iterate over the references of the dataset as (citing paper_id, cited paper_id) arrays.
+    When the columnar cache is up to date, the 'references' table is read directly without building records.
+    The references of a paper are never split across two batches, so duplicated references are removed
+    by 'create_citation_edges'.
+
+    Parameters
+    ----------
+    dataset_path : str
+        Path to the dataset.
+    dataset_encoding : str
+        Encoding of the dataset.
+    batch_size : int
+        Approximate number of pairs per batch. Default is 100000.
+    parse_workers : int
+        Number of processes used to parse the dataset. Default is 1.
+
+    Yields
+    ------
+    Tuple[np.ndarray, np.ndarray]
+        Citing and cited paper ids.
+    '''
+    if is_cache_valid(dataset_path):
+        for batch in read_table('references', get_cache_dir()).to_batches():
+            if batch.num_rows:
+                yield batch.column('paper_id').to_numpy(), batch.column('ref_id').to_numpy()
+        return
+
+    src = array('q')
+    dst = array('q')
+
+    for obj in iter_dataset(dataset_path, dataset_encoding, workers=parse_workers, fields=frozenset(['id', 'references'])):
+        references = obj.get('references', None)
+
+        if references:
+            src.extend([int(obj['id'])] * len(references))
+            dst.extend(int(ref_id) for ref_id in references)
+
+            if len(src) >= batch_size:
+                yield np.array(src, dtype=np.int64), np.array(dst, dtype=np.int64)
+                src = array('q')
+                dst = array('q')
+
+    if src:
+        yield np.array(src, dtype=np.int64), np.array(dst, dtype=np.int64)
+
+
+def iter_spooled_pairs(file, batch_size: int = 100000) -> Iterator[Tuple[np.ndarray, np.ndarray]]:
+    '''
+    Iterate over (citing paper_id, cited paper_id) pairs written to a binary file as interleaved int64 values.
+
+    Parameters
+    ----------
+    file : BinaryIO
+        File positioned at the first pair.
+    batch_size : int
+        Pairs per batch. Default is 100000.
+
+    Yields
+    ------
+    Tuple[np.ndarray, np.ndarray]
+        Citing and cited paper ids.
+    '''
+    while True:
+        values = np.fromfile(file, dtype=np.int64, count=2 * batch_size)
+
+        if not len(values):
+            break
+
+        pairs = values.reshape(-1, 2)
+        yield pairs[:, 0], pairs[:, 1]
+
+
+def create_citation_edges(src: np.ndarray, dst: np.ndarray, index: PaperNodeIndex,
+                          database_url: str, database_name: str,
+                          transaction_size: int = 20000, merge: bool = False,
+                          batch_sizer: Optional[AdaptiveBatchSizer] = None) -> dict:
+    '''
+    Create the CITES relationships of a batch of (citing paper_id, cited paper_id) pairs.
+    Duplicated pairs are removed client-side, paper ids are resolved to element ids with the index
+    and pairs with an unknown paper are dropped before sending them to the database.
+    Relationships are created by element id with one UNWIND statement per transaction.
+
+    Parameters
+    ----------
+    src : np.ndarray
+        Citing paper ids.
+    dst : np.ndarray
+        Cited paper ids.
+    index : PaperNodeIndex
+        Index of the Paper nodes.
+    database_url : str
+        URL of the database.
+    database_name : str
+        Name of the database.
+    transaction_size : int
+        Relationships per transaction. Default is 20000.
+    merge : bool
+        Use MERGE instead of CREATE, so relationships created by a previous run are not duplicated.
+        Slower, only needed when the database already has CITES relationships. Default is False.
+    batch_sizer : Optional[AdaptiveBatchSizer]
+        Controller of the transaction size ('CITES_BATCH_KEY'), by default None ('transaction_size' is used).
+
+    Returns
+    -------
+    dict
+        Number of relationships sent ('created'), distinct pairs dropped because a paper was not found ('missing')
+        and duplicated pairs removed ('duplicates').
+    '''
+    use_database(database_url, database_name)
+
+    # Paper ids map to one node each, so the pairs are deduplicated on the ids before they are resolved
+    pairs = np.stack([np.asarray(src, dtype=np.int64), np.asarray(dst, dtype=np.int64)], axis=1)
+    unique_ids = np.unique(pairs, axis=0) if len(pairs) else pairs
+
+    src_nodes = index.resolve(unique_ids[:, 0])
+    dst_nodes = index.resolve(unique_ids[:, 1])
+
+    found = (src_nodes != b'') & (dst_nodes != b'')
+    unique_pairs = np.stack([src_nodes[found], dst_nodes[found]], axis=1).astype(str)
+
+    operation = 'MERGE' if merge else 'CREATE'
+    query = f'''
+        UNWIND $pairs AS pair
+        MATCH (a) WHERE elementId(a) = pair[0]
+        MATCH (b) WHERE elementId(b) = pair[1]
+        {operation} (a)-[:CITES]->(b)
+        '''
+
+    metrics = get_active_metrics()
+
+    def write(batch: np.ndarray) -> None:
+        time_start = time.perf_counter()
+
+        with db.transaction:
+            db.cypher_query(query, {'pairs': batch.tolist()})
+            time_write = time.perf_counter()
+
+        if metrics is not None:
+            metrics.observe('write', time_write - time_start, len(batch))
+            metrics.observe('commit', time.perf_counter() - time_write)
+
+    if batch_sizer is not None:
+        batch_sizer.add(CITES_BATCH_KEY, transaction_size)
+        batch_sizer.run(CITES_BATCH_KEY, unique_pairs, write)
+    else:
+        for start in range(0, len(unique_pairs), transaction_size):
+            write(unique_pairs[start:start + transaction_size])
+
+    return {
+        'created': len(unique_pairs),
+        'missing': int(len(unique_ids) - found.sum()),
+        'duplicates': len(pairs) - len(unique_ids),
+    }
+
+
+def create_citations(pairs: Iterator[Tuple[np.ndarray, np.ndarray]], database_url: str, database_name: str,
+                     index: Optional[PaperNodeIndex] = None, transaction_size: int = 20000,
+                     merge: Optional[bool] = None, batch_sizer: Optional[AdaptiveBatchSizer] = None) -> dict:
+    '''
+    Create the CITES relationships of every batch of (citing paper_id, cited paper_id) pairs.
+    The Paper nodes need to be created before calling this function.
+
+    Parameters
+    ----------
+    pairs : Iterator[Tuple[np.ndarray, np.ndarray]]
+        Batches of citing and cited paper ids, e.g. from 'iter_reference_pairs'.
+    database_url : str
+        URL of the database.
+    database_name : str
+        Name of the database.
+    index : Optional[PaperNodeIndex]
+        Index of the Paper nodes, loaded from the database if not provided.
+    transaction_size : int
+        Relationships per transaction. Default is 20000.
+    merge : Optional[bool]
+        Use MERGE instead of CREATE. By default MERGE is only used if the database already has CITES relationships.
+    batch_sizer : Optional[AdaptiveBatchSizer]
+        Controller of the transaction size, by default None ('transaction_size' is used).
+
+    Returns
+    -------
+    dict
+        Totals of 'created', 'missing' and 'duplicates' pairs.
+    '''
+    use_database(database_url, database_name)
+
+    if merge is None:
+        results, meta = db.cypher_query('MATCH ()-[r:CITES]->() RETURN count(r)')
+        merge = results[0][0] > 0
+
+    index = index or load_paper_node_index(database_url, database_name)
+    totals = {'created': 0, 'missing': 0, 'duplicates': 0}
+    metrics = get_active_metrics()
+
+    with tqdm(desc='Creating CITES relationships', unit=' refs') as progress:
+        for src, dst in pairs:
+            with metrics.batch(CITES_METRICS_KEY, len(src)) if metrics is not None else nullcontext():
+                stats = create_citation_edges(src, dst, index, database_url, database_name, transaction_size, merge, batch_sizer)
+
+            for key, value in stats.items():
+                totals[key] += value
+            progress.update(len(src))
+
+    gc.collect()
+
+    return totals
@@ -0,0 +1,453 @@
+import os
+from os.path import join, dirname
+import gc
+import tempfile
+from array import array
+from itertools import chain
+from typing import List, Tuple
+
+import time
+import dotenv
+import numpy as np
+from tqdm import tqdm
+
+from core.enums.app_enums import AuthorApp, InstitutionApp, PaperApp
+from core.enums.db_enums import DatabaseType
+from core.funcs import detect_encoding
+
+from dataset.utils.dataset_reader import iter_dataset
+
+from database.bulk_load_by_model import (PAPER_CONNECTION_QUERIES, author_org_statements, document_type_statements,
+                                         fos_statements, paper_columns, paper_connection_rows, publisher_statements,
+                                         run_statements, venue_statements)
+from database.load_citations import create_citations, iter_spooled_pairs
+from database.utils.db_connection import neomodel_connect
+from database.utils.manifest import MANIFEST_FIELDS, MANIFEST_PARTS, Manifest, ManifestBuilder, get_manifest_path, hash_records
+
+
+# Papers are created or updated: unlike 'bulk_load_by_model.paper_statements', every property is set,
+# so the properties that changed in the new release are overwritten (and removed when they are empty).
+PAPER_UPSERT_QUERY = '''
+    UNWIND range(0, size($paper_id) - 1) AS i
+    MERGE (p:Paper {paper_id: $paper_id[i]})
+    SET p.title = $title[i],
+        p.doi = $doi[i],
+        p.year = $year[i],
+        p.page_start = $page_start[i],
+        p.page_end = $page_end[i],
+        p.volume = $volume[i],
+        p.issue = $issue[i],
+        p.n_citation = $n_citation[i]
+    '''
+
+AUTHOR_NAME_QUERY = '''
+    UNWIND $rows AS row
+    MATCH (a:Author {author_id: row.author_id})
+    SET a.name = row.name
+    '''
+
+# Same as the PaperFieldOfStudyRel connection query, but the weight of an existing relationship is updated.
+FOS_UPSERT_QUERY = '''
+    UNWIND $rows AS row
+    MATCH (p:Paper {paper_id: row.paper_id, title: row.title})
+    MATCH (f:FieldOfStudy {name: row.fos})
+    MERGE (p)-[r:RELATED_TO]->(f)
+    ON CREATE SET r.paper_fos_id = row.paper_fos_id
+    SET r.weight = row.weight
+    '''
+
+# Relationships of each part of a paper, as (relationship type, end node label, end node key property).
+# When a part changes, the relationships of the paper to end nodes that are no longer in the record are deleted.
+PART_RELATIONSHIPS = {
+    'links': [('OF_TYPE', 'DocumentType', 'type'), ('PUBLISHED_BY', 'Publisher', 'name'), ('PRESENTED_AT', 'Venue', 'name')],
+    'authors': [('AUTHORED_BY', 'Author', 'author_id')],
+    'fos': [('RELATED_TO', 'FieldOfStudy', 'name')],
+    'references': [('CITES', 'Paper', 'paper_id')],
+}
+
+REMOVE_PAPERS_QUERY = '''
+    UNWIND $rows AS paper_id
+    MATCH (p:Paper {paper_id: paper_id})
+    DETACH DELETE p
+    '''
+
+
+
+def stale_relationships_query(rel_type: str, label: str, key: str) -> str:
+    '''
+    Build the query that deletes the relationships of a type from each Paper to the end nodes not in 'row.keys'.
+    '''
+    return f'''
+        UNWIND $rows AS row
+        MATCH (p:Paper {{paper_id: row.paper_id}})-[r:{rel_type}]->(n:{label})
+        WHERE NOT n.{key} IN row.keys
+        DELETE r
+        '''
+
+
+def part_keys(obj: dict, rel_type: str) -> list:
+    '''
+    Get the key properties of the end nodes of a relationship type in a record, see 'PART_RELATIONSHIPS'.
+    '''
+    rows = paper_connection_rows([obj], {
+        'OF_TYPE': [PaperApp.DOCUMENT_TYPE],
+        'PUBLISHED_BY': [InstitutionApp.PUBLISHER],
+        'PRESENTED_AT': [InstitutionApp.VENUE],
+        'AUTHORED_BY': [AuthorApp.AUTHOR],
+        'RELATED_TO': [PaperApp.FIELD_OF_STUDY],
+        'CITES': [PaperApp.PAPER_CITES_REL],
+    }[rel_type])
+    end_keys = {'OF_TYPE': 'doc_type', 'PUBLISHED_BY': 'publisher', 'PRESENTED_AT': 'venue',
+                'AUTHORED_BY': 'author_id', 'RELATED_TO': 'fos', 'CITES': 'ref_id'}
+
+    return sorted({row[end_keys[rel_type]] for model_rows in rows.values() for row in model_rows})
+
+
+def delta_statements(nodes: list, new: np.ndarray, changed: np.ndarray) -> List[Tuple[str, dict]]:
+    '''
+    Build the statements that write the changes of a batch of papers.
+
+    Parameters
+    ----------
+    nodes : list
+        A list of dictionaries containing the papers information.
+    new : np.ndarray
+        True for the papers that are not in the manifest.
+    changed : np.ndarray
+        One row per paper and one column per part of 'MANIFEST_PARTS', True where the part is new or changed.
+
+    Returns
+    -------
+    List[Tuple[str, dict]]
+        Statements as (query, parameters), in order: Paper nodes, the other nodes, the stale relationships
+        of the changed papers, and the relationships of the new and changed parts.
+        The references are not included, they are loaded after the whole dataset is read.
+    '''
+    parts = {part: [obj for obj, is_changed in zip(nodes, changed[:, column]) if is_changed]
+             for column, part in enumerate(MANIFEST_PARTS)}
+    updated = {part: [obj for obj, is_changed, is_new in zip(nodes, changed[:, column], new) if is_changed and not is_new]
+               for column, part in enumerate(MANIFEST_PARTS)}
+    statements = []
+
+    if parts['paper']:
+        statements.append((PAPER_UPSERT_QUERY, paper_columns(parts['paper'])))
+
+    statements.extend(document_type_statements(parts['links']))
+    statements.extend(publisher_statements(parts['links']))
+    statements.extend(venue_statements(parts['links']))
+    statements.extend(author_org_statements(parts['authors']))
+    statements.extend(fos_statements(parts['fos']))
+
+    author_names = {int(author['id']): author.get('name', None)
+                    for obj in updated['authors'] for author in obj.get('authors', []) if author.get('id', None) is not None}
+    if author_names:
+        statements.append((AUTHOR_NAME_QUERY, {'rows': [{'author_id': author_id, 'name': name}
+                                                        for author_id, name in author_names.items()]}))
+
+    for part, relationships in PART_RELATIONSHIPS.items():
+        for rel_type, label, key in relationships:
+            rows = [{'paper_id': int(obj['id']), 'keys': part_keys(obj, rel_type)} for obj in updated[part]]
+
+            if rows:
+                statements.append((stale_relationships_query(rel_type, label, key), {'rows': rows}))
+
+    connection_rows = {
+        **paper_connection_rows(parts['links'], [PaperApp.DOCUMENT_TYPE, InstitutionApp.PUBLISHER, InstitutionApp.VENUE]),
+        **paper_connection_rows(parts['authors'], [AuthorApp.AUTHOR]),
+        **paper_connection_rows(parts['fos'], [PaperApp.FIELD_OF_STUDY]),
+    }
+
+    for model, rows in connection_rows.items():
+        query = FOS_UPSERT_QUERY if model == PaperApp.FIELD_OF_STUDY else PAPER_CONNECTION_QUERIES[model]
+        statements.append((query, {'rows': rows}))
+
+    return statements
+
+
+def build_manifest(dataset_path: str, dataset_encoding: str, manifest_path: str, parse_workers: int = 1) -> int:
+    '''
+    Build the manifest of a dataset without writing to the database.
+    Use it once for a database loaded with 'populate_db_batches.py', so the next release is loaded with 'load_delta'.
+
+    Parameters
+    ----------
+    dataset_path : str
+        Path to the dataset that is loaded in the database.
+    dataset_encoding : str
+        Encoding of the dataset.
+    manifest_path : str
+        Path to the manifest file, e.g. from 'get_manifest_path'.
+    parse_workers : int
+        Number of processes used to parse the dataset. Default is 1.
+
+    Returns
+    -------
+    int
+        Number of papers in the manifest.
+    '''
+    builder = ManifestBuilder()
+    batch = []
+
+    for obj in tqdm(iter_dataset(dataset_path, dataset_encoding, workers=parse_workers, fields=MANIFEST_FIELDS),
+                    desc='Hashing dataset', unit=' papers'):
+        batch.append(obj)
+
+        if len(batch) >= 10000:
+            builder.extend(np.array([int(obj['id']) for obj in batch], dtype=np.int64), hash_records(batch))
+            batch = []
+
+    if batch:
+        builder.extend(np.array([int(obj['id']) for obj in batch], dtype=np.int64), hash_records(batch))
+
+    manifest = builder.build()
+    manifest.save(manifest_path)
+
+    gc.collect()
+
+    return len(manifest)
+
+
+def load_delta(dataset_path: str, dataset_encoding: str, database_url: str, database_name: str, manifest_path: str,
+               batch_size: int = 5000, delete_batch_size: int = 10000, parse_workers: int = 1,
+               citations_batch_size: int = 100000, citations_transaction_size: int = 20000,
+               remove_papers: bool = True, dry_run: bool = False) -> dict:
+    '''
+    Load a new release of the dataset into a database that has the previous one, writing only what changed.
+    The manifest has the content hashes of every paper of the loaded release, by part ('MANIFEST_PARTS').
+    The new dataset is read once, and each batch of papers is compared with the manifest:
+        - new papers are written whole: the Paper node, its DocumentType, Publisher, Venue, Author, Organization and
+          FieldOfStudy nodes, and its relationships.
+        - for changed papers, only the changed parts are written. The relationships of a changed part that are
+          no longer in the record (e.g. a removed author or reference) are deleted, and the field of study
+          weights are updated.
+        - unchanged papers are skipped.
+    Each batch is written in a single transaction. The references of the new and changed papers are kept in a
+    temporary file and loaded after the whole dataset is read, with 'database/load_citations.py' (MERGE).
+    The other references to papers that are not in the manifest are kept too: the previous load dropped them,
+    and they are created when the cited paper is added by the new release.
+    Papers of the manifest that are not in the new release are then deleted with their relationships,
+    in transactions of 'delete_batch_size' papers. Nodes left without relationships (e.g. an author of
+    a removed paper) are kept.
+
+    The new manifest replaces the old one when the load finishes. An interrupted load is run again from the
+    start: the statements are idempotent, so the papers written before the interruption are written again.
+
+    Parameters
+    ----------
+    dataset_path : str
+        Path to the new dataset.
+    dataset_encoding : str
+        Encoding of the dataset.
+    database_url : str
+        URL of the database.
+    database_name : str
+        Name of the database.
+    manifest_path : str
+        Path to the manifest file, e.g. from 'get_manifest_path'. Without a manifest every paper is new.
+    batch_size : int
+        Papers compared and written at a time. Default is 5000.
+    delete_batch_size : int
+        Removed papers deleted per transaction. Default is 10000.
+    parse_workers : int
+        Number of processes used to parse the dataset. Default is 1.
+    citations_batch_size : int
+        References resolved and deduplicated at a time. Default is 100000.
+    citations_transaction_size : int
+        CITES relationships per transaction. Default is 20000.
+    remove_papers : bool
+        Delete the papers that are not in the new release. Default is True.
+    dry_run : bool
+        Only compare the dataset with the manifest: nothing is written and the manifest is not replaced.
+        Default is False.
+
+    Returns
+    -------
+    dict
+        Number of papers read, 'new', 'changed', 'unchanged' and 'removed', the papers changed by part ('parts'),
+        and the PaperCitesRel loader totals ('citations').
+    '''
+    manifest = Manifest.load(manifest_path)
+    builder = ManifestBuilder()
+    seen = np.zeros(len(manifest), dtype=bool)
+
+    stats = {'papers': 0, 'new': 0, 'changed': 0, 'unchanged': 0, 'removed': 0,
+             'parts': {part: 0 for part in MANIFEST_PARTS}, 'citations': None}
+
+    if not len(manifest):
+        print(f'\nThere is no manifest in {manifest_path}, every paper is new.')
+
+    def process(batch):
+        paper_ids = np.array([int(obj['id']) for obj in batch], dtype=np.int64)
+        hashes = hash_records(batch)
+        builder.extend(paper_ids, hashes)
+
+        positions, found = manifest.lookup(paper_ids)
+        seen[positions[found]] = True
+
+        changed = np.ones(hashes.shape, dtype=bool)
+        if found.any():
+            changed[found] = manifest.hashes[positions[found]] != hashes[found]
+
+        is_changed = changed.any(axis=1)
+        stats['papers'] += len(batch)
+        stats['new'] += int((~found).sum())
+        stats['changed'] += int((found & is_changed).sum())
+        stats['unchanged'] += int((found & ~is_changed).sum())
+        for column, part in enumerate(MANIFEST_PARTS):
+            stats['parts'][part] += int((found & changed[:, column]).sum())
+
+        if dry_run:
+            return
+
+        new_ids.extend(paper_ids[~found].tolist())
+        references_column = MANIFEST_PARTS.index('references')
+
+        # References of unchanged parts to papers missing from the old release were dropped by the last load,
+        # they are kept aside in case the cited paper is added by this release
+        for obj, reference_changed in zip(batch, changed[:, references_column]):
+            if not reference_changed and obj.get('references', None):
+                paper_id = int(obj['id'])
+                ref_ids = np.array([int(ref_id) for ref_id in dict.fromkeys(obj['references'])], dtype=np.int64)
+                for ref_id in ref_ids[~manifest.lookup(ref_ids)[1]].tolist():
+                    pending_buffer.extend((paper_id, ref_id))
+
+        if len(pending_buffer) >= 2 * citations_batch_size:
+            pending_buffer.tofile(pending_file)
+            del pending_buffer[:]
+
+        if not is_changed.any():
+            return
+
+        nodes = [obj for obj, keep in zip(batch, is_changed) if keep]
+        run_statements(delta_statements(nodes, ~found[is_changed], changed[is_changed]), database_url, database_name)
+
+        for obj, reference_changed in zip(nodes, changed[is_changed][:, references_column]):
+            if reference_changed:
+                paper_id = int(obj['id'])
+                for ref_id in dict.fromkeys(obj.get('references', None) or []):
+                    references_buffer.extend((paper_id, int(ref_id)))
+
+        if len(references_buffer) >= 2 * citations_batch_size:
+            references_buffer.tofile(references_file)
+            del references_buffer[:]
+
+    def iter_pending_pairs():
+        # Pairs of unchanged references whose cited paper is new in this release
+        added_ids = np.frombuffer(new_ids, dtype=np.int64)
+
+        for src, dst in iter_spooled_pairs(pending_file, citations_batch_size):
+            keep = np.isin(dst, added_ids)
+
+            if keep.any():
+                yield src[keep], dst[keep]
+
+    with tempfile.TemporaryFile() as references_file, tempfile.TemporaryFile() as pending_file:
+        references_buffer = array('q')
+        pending_buffer = array('q')
+        new_ids = array('q')
+        batch = []
+
+        for obj in tqdm(iter_dataset(dataset_path, dataset_encoding, workers=parse_workers, fields=MANIFEST_FIELDS),
+                        desc='Comparing dataset', unit=' papers'):
+            batch.append(obj)
+
+            if len(batch) >= batch_size:
+                process(batch)
+                batch = []
+
+        if batch:
+            process(batch)
+
+        if not dry_run:
+            references_buffer.tofile(references_file)
+            pending_buffer.tofile(pending_file)
+
+        if not dry_run and (references_file.tell() or pending_file.tell()):
+            references_file.seek(0)
+            pending_file.seek(0)
+
+            pairs = chain(iter_spooled_pairs(references_file, citations_batch_size), iter_pending_pairs())
+            stats['citations'] = create_citations(pairs, database_url, database_name,
+                                                  transaction_size=citations_transaction_size,
+                                                  merge=True if len(manifest) else None)
+
+    removed_ids = manifest.paper_ids[~seen] if remove_papers else np.empty(0, dtype=np.int64)
+    stats['removed'] = len(removed_ids)
+
+    if not dry_run:
+        for start in tqdm(range(0, len(removed_ids), delete_batch_size), desc='Removing papers', unit=' batches'):
+            run_statements([(REMOVE_PAPERS_QUERY, {'rows': removed_ids[start:start + delete_batch_size].tolist()})],
+                           database_url, database_name)
+
+        builder.build().save(manifest_path)
+
+    gc.collect()
+
+    return stats
+
+
+
+
+if __name__ == '__main__':
+    dotenv_path = join(dirname(__file__), '.env')
+    dotenv.load_dotenv(dotenv_path)
+
+    dataset_path = os.environ.get('DATASET_PATH', './dataset/dblp.v12.json')
+    dataset_encoding = detect_encoding(dataset_path)
+
+    BATCH_SIZE_DELTA = int(os.environ.get('BATCH_SIZE_DELTA', 5000))
+    BATCH_SIZE_DELETE = int(os.environ.get('BATCH_SIZE_DELETE', 10000))
+    BATCH_SIZE_CITATIONS = int(os.environ.get('BATCH_SIZE_CITATIONS', 100000))
+    BATCH_SIZE_CITES_TRANSACTION = int(os.environ.get('BATCH_SIZE_CITES_TRANSACTION', 20000))
+    PARSE_WORKERS = int(os.environ.get('PARSE_WORKERS', 1))
+
+
+
+    print('==============================')
+    print(' Incremental Dataset Load')
+    print('==============================')
+    print('Choose Database:')
+    print(f'1. {DatabaseType.PRODUCTION.value}')
+    print(f'2. {DatabaseType.TEST.value}')
+
+    db_option = None
+    while db_option not in [DatabaseType.PRODUCTION.value, DatabaseType.TEST.value]:
+        db_option = input('\nDatabase: ')
+
+        if db_option not in [DatabaseType.PRODUCTION.value, DatabaseType.TEST.value]:
+            print(f'Invalid Database. Please choose between \'{DatabaseType.PRODUCTION.value}\' and \'{DatabaseType.TEST.value}\'.')
+
+    db_option = DatabaseType(db_option)
+    database_url, database_name = neomodel_connect(db_option)
+    manifest_path = get_manifest_path(database_name)
+
+    print(f'Database: {database_name}')
+    print(f'Dataset: {dataset_path}')
+    print(f'Manifest: {manifest_path}')
+
+    print('\nSelect an option:')
+    print('1. Build the manifest of the dataset already loaded (nothing is written to the database)')
+    print('2. Show the changes of the dataset (nothing is written to the database)')
+    print('3. Load the changes of the dataset')
+
+    option = None
+    while option not in ['1', '2', '3']:
+        option = input('\nOption: ')
+
+    time_start = time.time()
+
+    if option == '1':
+        papers = build_manifest(dataset_path, dataset_encoding, manifest_path, PARSE_WORKERS)
+        print(f'\nManifest of {papers} papers saved to {manifest_path}')
+
+    else:
+        stats = load_delta(dataset_path, dataset_encoding, database_url, database_name, manifest_path,
+                           BATCH_SIZE_DELTA, BATCH_SIZE_DELETE, PARSE_WORKERS, BATCH_SIZE_CITATIONS,
+                           BATCH_SIZE_CITES_TRANSACTION, dry_run=option == '2')
+
+        print('\nChanges:')
+        for name, value in stats.items():
+            print(f'{name}: {value}')
+
+    time_elapsed = time.time() - time_start
+    print(f'\nTime Elapsed: {time_elapsed // 3600:.0f} hours {time_elapsed % 3600 // 60:.0f} minutes')
@@ -0,0 +1,218 @@
+import os
+import gc
+import time
+import random
+from multiprocessing import Pool
+from typing import Dict, List, Tuple, Union
+
+from neo4j.exceptions import ServiceUnavailable, SessionExpired, TransientError
+from neomodel import db
+
+from core.enums.app_enums import AuthorApp, InstitutionApp, PaperApp
+from database.bulk_load_by_model import PAPER_CONNECTION_QUERIES, paper_connection_rows, run_statements
+from database.utils.connection_manager import get_driver, use_database
+from database.utils.metrics import get_active_metrics, observe_stage
+
+
+# Errors worth retrying: deadlocks and lock timeouts are TransientError, the others are lost connections.
+RETRYABLE_ERRORS = (TransientError, ServiceUnavailable, SessionExpired)
+
+# Key of the end node of each relationship type in the rows of 'paper_connection_rows'.
+END_NODE_KEYS = {
+    PaperApp.DOCUMENT_TYPE: 'doc_type',
+    InstitutionApp.PUBLISHER: 'publisher',
+    InstitutionApp.VENUE: 'venue',
+    AuthorApp.AUTHOR: 'author_id',
+    PaperApp.FIELD_OF_STUDY: 'fos',
+}
+
+
+
+def _init_worker(database_url: str, database_name: str) -> None:
+    '''
+    Pool initializer. Every worker process gets its own driver from the connection manager,
+    a driver inherited from the parent cannot be shared.
+    '''
+    use_database(database_url, database_name)
+
+
+def _write_rows_task(task: Tuple[Union[AuthorApp, InstitutionApp, PaperApp], list, int, int, float]) -> dict:
+    '''
+    Pool task. Write the rows of one grid cell in transactions of 'transaction_size' rows,
+    retrying failed transactions with exponential backoff and jitter.
+    '''
+    model, rows, transaction_size, max_retries, backoff = task
+    query = PAPER_CONNECTION_QUERIES[model]
+    retries = 0
+    time_start = time.perf_counter()
+
+    for start in range(0, len(rows), transaction_size):
+        attempt = 0
+
+        while True:
+            try:
+                with db.transaction:
+                    db.cypher_query(query, {'rows': rows[start:start + transaction_size]})
+                break
+
+            except RETRYABLE_ERRORS:
+                if attempt >= max_retries:
+                    raise
+
+                time.sleep(backoff * 2 ** attempt * (1 + random.random()))
+                attempt += 1
+                retries += 1
+
+    return {'pid': os.getpid(), 'rows': len(rows), 'seconds': time.perf_counter() - time_start, 'retries': retries}
+
+
+def partition_rows(rows: list, end_key: str, workers: int) -> Dict[Tuple[int, int], list]:
+    '''
+    Split the rows of a relationship type into a grid of cells by start node (Paper) and end node.
+
+    Parameters
+    ----------
+    rows : list
+        Rows of one relationship type, as built by 'paper_connection_rows'.
+    end_key : str
+        Key of the end node in the rows.
+    workers : int
+        Number of partitions of each side.
+
+    Returns
+    -------
+    Dict[Tuple[int, int], list]
+        Rows of each (start partition, end partition) cell. Empty cells are left out.
+    '''
+    cells = {}
+
+    for row in rows:
+        cell = (row['paper_id'] % workers, hash(row[end_key]) % workers)
+        cells.setdefault(cell, []).append(row)
+
+    return cells
+
+
+
+class ParallelConnectionLoader:
+    '''
+    Create the Paper relationships of the 'bulk' engine with a pool of worker processes.
+
+    MERGE locks both nodes of a relationship, so concurrent transactions that share a node wait on each other,
+    and can deadlock when they lock two shared nodes in opposite order. Popular fields of study, venues and
+    publishers are shared by a large part of any batch. To avoid it, the rows of each relationship type are
+    split into a 'workers' x 'workers' grid by start node and end node ('partition_rows'), and the grid is written
+    in 'workers' rounds. In round r, worker k writes the cell (k, (k + r) % workers), so no two cells written at the
+    same time have a start or end node in common: a hub node is only written by one transaction at a time.
+    Rounds are separated by a barrier. Deadlocks and transient errors that still happen (e.g. with other clients)
+    are retried with exponential backoff.
+
+    Use it as a context manager, the pool is closed on exit.
+
+    Parameters
+    ----------
+    database_url : str
+        URL of the database.
+    database_name : str
+        Name of the database.
+    workers : int
+        Number of worker processes.
+    transaction_size : int
+        Rows per transaction. Default is 5000.
+    max_retries : int
+        Maximum retries of a transaction. Default is 5.
+    backoff : float
+        Initial backoff in seconds, doubled on each retry. Default is 0.2.
+    '''
+    def __init__(self, database_url: str, database_name: str, workers: int,
+                 transaction_size: int = 5000, max_retries: int = 5, backoff: float = 0.2) -> None:
+        self.database_url = database_url
+        self.database_name = database_name
+        self.workers = workers
+        self.transaction_size = transaction_size
+        self.max_retries = max_retries
+        self.backoff = backoff
+
+        self.worker_stats = {}
+        self._pool = None
+
+    def __enter__(self) -> 'ParallelConnectionLoader':
+        # Fail here on an invalid URL, a failing pool initializer would restart the workers forever
+        get_driver(self.database_url)
+
+        self._pool = Pool(self.workers, initializer=_init_worker, initargs=(self.database_url, self.database_name))
+        return self
+
+    def __exit__(self, *args) -> None:
+        self._pool.close()
+        self._pool.join()
+        self._pool = None
+
+    def _write_grid(self, model: Union[AuthorApp, InstitutionApp, PaperApp], cells: Dict[Tuple[int, int], list]) -> None:
+        for round_number in range(self.workers):
+            tasks = []
+
+            for worker in range(self.workers):
+                rows = cells.get((worker, (worker + round_number) % self.workers), None)
+
+                if rows:
+                    tasks.append((model, rows, self.transaction_size, self.max_retries, self.backoff))
+
+            # Wall time of the round, the workers write at the same time
+            with observe_stage('write', sum(len(task[1]) for task in tasks)):
+                results = self._pool.map(_write_rows_task, tasks, chunksize=1)
+
+            metrics = get_active_metrics()
+            for result in results:
+                if metrics is not None:
+                    metrics.add_retries(model.value, result['retries'])
+
+                stats = self.worker_stats.setdefault(result['pid'], {'rows': 0, 'seconds': 0.0, 'retries': 0})
+                stats['rows'] += result['rows']
+                stats['seconds'] += result['seconds']
+                stats['retries'] += result['retries']
+
+    def create_paper_connections(self, nodes: list, database_url: str, database_name: str,
+                                 models_list: List[Union[AuthorApp, InstitutionApp, PaperApp]]) -> None:
+        '''
+        Create relationships for each paper in the dataset. Drop-in replacement of
+        'bulk_load_by_model.create_paper_connections', with the same requirements.
+        PaperCitesRel connections are written by the parent process, they are loaded with 'database/load_citations.py'
+        by 'populate_db_single_pass' and both ends are Paper nodes, which the grid does not separate.
+
+        Parameters
+        ----------
+        nodes : list
+            A list of dictionaries containing the papers information.
+        database_url : str (required)
+            URL of the database. The workers use the one given to the constructor.
+        database_name : str (required)
+            Name of the database. The workers use the one given to the constructor.
+        models_list : list (required) - Options: AuthorApp, InstitutionApp, PaperApp
+            A list of models to connect to the Paper model.
+        '''
+        rows = paper_connection_rows(nodes, models_list)
+
+        for model, model_rows in rows.items():
+            if model in END_NODE_KEYS:
+                self._write_grid(model, partition_rows(model_rows, END_NODE_KEYS[model], self.workers))
+
+            else:
+                run_statements([(PAPER_CONNECTION_QUERIES[model], {'rows': model_rows})], database_url, database_name)
+
+        gc.collect()
+
+    def stats(self) -> Dict[int, dict]:
+        '''
+        Get the throughput of each worker.
+
+        Returns
+        -------
+        Dict[int, dict]
+            rows, seconds (time spent writing), rows_per_second and retries of each worker process, keyed by pid.
+        '''
+        return {
+            pid: {**stats, 'seconds': round(stats['seconds'], 2),
+                  'rows_per_second': round(stats['rows'] / stats['seconds'], 1) if stats['seconds'] else 0.0}
+            for pid, stats in self.worker_stats.items()
+        }
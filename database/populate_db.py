@@ -1,17 +1,15 @@
 import os
 from os.path import join, dirname
 
-from datetime import datetime
-
 import dotenv
 import ijson
 from tqdm import tqdm
 
-from neomodel import config
 
-from core.funcs import detect_encoding
+from core.funcs import detect_encoding, clean_paper_fields
 from core.enums.db_enums import DatabaseType
 from database.utils.db_connection import neomodel_connect
+from database.utils.connection_manager import use_database
 
 from apps.author.models import Author
 from apps.institution.models import Organization, Publisher, Venue, VenueType
@@ -23,6 +21,8 @@ def create_nodes(obj: dict):
     '''
     Create nodes for each paper in the dataset.
     Then connect the nodes to their respective relationships.
+    The Paper fields are cleaned with 'clean_paper_fields', like every other loader: page, volume and issue
+    values that are not digit-only (e.g. '12a', 'e123') are not stored.
 
     Parameters
     ----------
@@ -61,16 +61,6 @@ def create_nodes(obj: dict):
             - venue: dict
                 Venue information. Fields: id (int), raw (str), type (str).
     '''
-    paper_id = int(obj['id']) # Int
-    title = obj['title'] # String
-    doi = obj.get('doi', None) # String
-    year = obj.get('year', None) # Int Date Format Y
-    page_start = obj.get('page_start', None) # Int
-    page_end = obj.get('page_end', None) # Int
-    volume = obj.get('volume', None) # Int
-    issue = obj.get('issue', None) # Int
-    n_citation = obj.get('n_citation', 0) # Int
-
     doc_type = obj.get('doc_type', None)
     publisher = obj.get('publisher', None)
     venue = obj.get('venue', None)
@@ -80,33 +70,15 @@ def create_nodes(obj: dict):
 
 
     # Clean up paper data
-    if year:
-        year = datetime.strptime(str(year), '%Y')
-    if page_start:
-        page_start = int(''.join(filter(str.isdigit, page_start)))
-    if page_end:
-        page_end = int(''.join(filter(str.isdigit, page_end)))
-    if volume:
-        volume = int(''.join(filter(str.isdigit, volume)))
-    if issue:
-        issue = int(''.join(filter(str.isdigit, issue)))
+    paper_fields = clean_paper_fields(obj)
+    title = paper_fields['title']
 
 
     paper_node = Paper.nodes.get_or_none(title=title)
 
     if not paper_node:
 
-        paper = Paper(
-            paper_id=paper_id,
-            title=title,
-            doi=doi if (doi is not None and doi != '') else None,
-            year=year,
-            page_start=int(page_start) if page_start else None,
-            page_end=int(page_end) if page_end else None,
-            volume=int(volume) if volume else None,
-            issue=int(issue) if issue else None,
-            n_citation=n_citation
-        ).save()
+        paper = Paper(**paper_fields).save()
 
 
         if doc_type:
@@ -204,8 +176,7 @@ if __name__ == '__main__':
     db_option = DatabaseType(db_option)
     database_url, database_name = neomodel_connect(db_option)
 
-    config.DATABASE_URL = database_url
-    config.DATABASE_NAME = database_name
+    use_database(database_url, database_name)
 
 
 
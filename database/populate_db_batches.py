@@ -1,143 +1,437 @@
 import os
 from os.path import join, dirname
 import gc
+import asyncio
+import tempfile
+from contextlib import nullcontext
+from array import array
 
-from typing import Union
+from functools import partial
+from typing import Union, Callable, Dict, List, Optional
 
 import time
 import dotenv
-import ijson
 from tqdm import tqdm
 
 from core.enums.app_enums import AuthorApp, InstitutionApp, PaperApp
 from core.enums.db_enums import DatabaseType
 from core.funcs import detect_encoding
 
+from dataset.utils.dataset_reader import iter_dataset_positions
+from dataset.utils.projection import get_projection
+
 from database.utils import querys
 from database.utils.db_connection import neomodel_connect
+from database.utils.entity_cache import EntityCache
+from database.utils.checkpoints import CheckpointStore, get_checkpoint_path
+from database.utils.batch_sizer import AdaptiveBatchSizer, CONNECTIONS_BATCH_KEY, get_node_batch_key
+from database.utils.metrics import LoadMetrics, get_active_metrics, get_metrics_path
+from database.utils.schema import apply_constraints, apply_indexes, uncovered_lookups
 
-from database.load_by_model import (create_document_type_nodes,
-                                    create_publisher_nodes,
-                                    create_venue_nodes,
-                                    create_author_org_nodes,
-                                    create_fos_nodes,
-                                    create_paper_nodes,
-                                    create_paper_connections)
+from database import load_by_model, bulk_load_by_model
+from database.load_citations import create_citations, iter_reference_pairs, iter_spooled_pairs
+from database.parallel_connections import ParallelConnectionLoader
+from database.async_pipeline import populate_db_async
 
 
 
-def populate_db(model: Union[AuthorApp, InstitutionApp, PaperApp],
-                dataset_path: str, dataset_encoding: str, batch_size: int,
-                database_url: str, database_name: str) -> None:
+# Loaders used by each engine. 'bulk' sends one UNWIND statement per label and relationship type,
+# 'neomodel' checks and saves every record with the OGM.
+# The 'async' engine sends the 'bulk' statements from a pipeline, see 'database/async_pipeline.py'.
+LOAD_ENGINES = {
+    'bulk': bulk_load_by_model,
+    'neomodel': load_by_model,
+}
+
+
+def get_node_loader(model: Union[AuthorApp, InstitutionApp, PaperApp], engine: str = 'bulk') -> Callable[[list, str, str], None]:
     '''
-    Populate the database with the nodes of the selected model.
+    Get the function that creates the nodes of the selected model.
 
     Parameters
     ----------
     model : Union[AuthorApp, InstitutionApp, PaperApp]
         Model to populate.
+    engine : str
+        Loader engine. Options: 'bulk', 'neomodel'. Default is 'bulk'.
+
+    Returns
+    -------
+    Callable[[list, str, str], None]
+        Function that receives the batch, the database URL and the database name.
+
+    Raises
+    ------
+    ValueError
+        If the engine or the model is not supported.
+    '''
+    if engine not in LOAD_ENGINES:
+        raise ValueError(f'Invalid load engine \'{engine}\'. Options: {", ".join(LOAD_ENGINES)}.')
+
+    loader = LOAD_ENGINES[engine]
+    node_loaders = {
+        PaperApp.DOCUMENT_TYPE: loader.create_document_type_nodes,
+        InstitutionApp.PUBLISHER: loader.create_publisher_nodes,
+        InstitutionApp.VENUE: loader.create_venue_nodes,
+        AuthorApp.AUTHOR: loader.create_author_org_nodes,
+        InstitutionApp.ORGANIZATION: loader.create_author_org_nodes,
+        PaperApp.FIELD_OF_STUDY: loader.create_fos_nodes,
+        PaperApp.PAPER: loader.create_paper_nodes,
+    }
+
+    if model not in node_loaders:
+        raise ValueError(f'There is no node loader for {model.value}.')
+
+    return node_loaders[model]
+
+
+def populate_db_single_pass(models: List[Union[AuthorApp, InstitutionApp, PaperApp]],
+                            dataset_path: str, dataset_encoding: str,
+                            batch_sizes: Dict[Union[AuthorApp, InstitutionApp, PaperApp], int],
+                            database_url: str, database_name: str, engine: str = 'bulk',
+                            connection_models: Optional[List[Union[AuthorApp, InstitutionApp, PaperApp]]] = None,
+                            connections_batch_size: int = 5000, parse_workers: int = 1,
+                            cache: Optional[EntityCache] = None, citations_batch_size: int = 100000,
+                            connection_workers: int = 1, write_concurrency: int = 4,
+                            checkpoints: Optional[CheckpointStore] = None,
+                            batch_sizer: Optional[AdaptiveBatchSizer] = None,
+                            citations_transaction_size: int = 20000) -> None:
+    '''
+    Populate the database with the nodes of every selected model, and optionally the Paper connections,
+    reading the dataset only once (from the columnar cache when it is up to date).
+    Each record is added to the batch of every selected model, and each batch is loaded when it reaches its own size.
+    Records only hold the fields read by the selected models ('dataset/utils/projection.py'). The other fields
+    (e.g. the abstract) are skipped by the parser when few models are selected, and parsed and dropped one
+    record at a time when the selection reads most of the record ('projection.is_low_memory_parse').
+
+    Dependency ordering:
+        - Before loading a batch of connections, the pending batches of every model are loaded,
+          so the Paper and dimension nodes of those records already exist.
+        - Paper references can point to papers further ahead in the dataset, so the
+          PaperCitesRel connections are kept in a temporary file as paper id pairs, and loaded after
+          the whole dataset is read with the dedicated loader in 'database/load_citations.py'.
+
+    Metrics:
+        Inside a 'with LoadMetrics()' block, the time spent parsing, transforming, writing and committing
+        every batch of each model is recorded, see 'database/utils/metrics.py'.
+
+    Checkpoints:
+        With a checkpoint store, the position of the first paper not committed is saved for each model nodes and
+        each connection type after every batch is loaded. A load interrupted at any point is resumed by calling
+        this function again with the same store: the dataset is read from the earliest checkpoint of the selected
+        keys, each key only gets the papers after its own checkpoint, and finished keys are skipped.
+        The in-pass connection types are loaded together, so they start from the earliest of their checkpoints
+        (MERGE does not duplicate the relationships of the papers loaded twice). PaperCitesRel is only marked
+        as finished once every reference is loaded. The checkpoints are removed when the whole load finishes.
+
+    Parameters
+    ----------
+    models : List[Union[AuthorApp, InstitutionApp, PaperApp]]
+        Models to populate. AuthorApp.AUTHOR and InstitutionApp.ORGANIZATION are loaded together.
     dataset_path : str
         Path to the dataset.
     dataset_encoding : str
         Encoding of the dataset.
-    batch_size : int
-        Batch size to load the nodes.
+    batch_sizes : Dict[Union[AuthorApp, InstitutionApp, PaperApp], int]
+        Batch size of each model.
     database_url : str
         URL of the database.
     database_name : str
         Name of the database.
+    engine : str
+        Loader engine. Options: 'bulk', 'neomodel', 'async'. Default is 'bulk'.
+    connection_models : Optional[List[Union[AuthorApp, InstitutionApp, PaperApp]]]
+        Models to connect to the Paper model, by default None (no connections are created).
+    connections_batch_size : int
+        Batch size to load the Paper connections. Default is 5000.
+    parse_workers : int
+        Number of processes used to parse the dataset. Default is 1.
+    cache : Optional[EntityCache]
+        Cache of node element ids shared across batches, by default None.
+        Only used by the 'neomodel' engine, the 'bulk' engine does not look up nodes.
+    citations_batch_size : int
+        References resolved and deduplicated at a time by the PaperCitesRel loader. Default is 100000.
+    connection_workers : int
+        Number of processes used to create the Paper connections, see 'database/parallel_connections.py'.
+        Only supported by the 'bulk' engine. Default is 1.
+    write_concurrency : int
+        Maximum number of write transactions in flight with the 'async' engine. Default is 4.
+    checkpoints : Optional[CheckpointStore]
+        Store to save and resume the load from, by default None (the load is not resumable).
+        Not supported by the 'async' engine, several batches are in flight at a time.
+    batch_sizer : Optional[AdaptiveBatchSizer]
+        Controller that adapts the batch size of each model, of the connections and of the CITES transactions
+        to the commit latency and memory, by default None (the sizes are fixed). 'batch_sizes' and
+        'connections_batch_size' are the initial sizes.
+    citations_transaction_size : int
+        CITES relationships per transaction (initial size with a batch sizer). Default is 20000.
+
+    Raises
+    ------
+    ValueError
+        If 'connection_workers' is greater than 1 with the 'neomodel' engine, or 'checkpoints' is given
+        with the 'async' engine.
     '''
-    batch = []
-
-    print(f'\nCreating {model.value} nodes')
-
-    with open(dataset_path, 'r', encoding=dataset_encoding) as f:
-        objects = ijson.items(f, 'item')
-
-        for obj in tqdm(objects, desc=f'Creating {model.value} nodes', unit=' papers'):
-            batch.append(obj)
-
-            if len(batch) >= batch_size:
-                if model == PaperApp.DOCUMENT_TYPE:
-                    create_document_type_nodes(batch, database_url, database_name)
+    if checkpoints is not None and engine == 'async':
+        raise ValueError('Resumable loads are not supported by the \'async\' engine.')
+
+    models = list(dict.fromkeys(AuthorApp.AUTHOR if model == InstitutionApp.ORGANIZATION else model for model in models))
+    connection_models = connection_models or []
+    in_pass_connection_models = [model for model in connection_models if model != PaperApp.PAPER_CITES_REL]
+    all_checkpoint_keys = [('nodes', model) for model in models] + [('connections', model) for model in connection_models]
+
+    if checkpoints is not None:
+        models = [model for model in models if not checkpoints.is_done('nodes', model)]
+        connection_models = [model for model in connection_models if not checkpoints.is_done('connections', model)]
+        in_pass_connection_models = [model for model in connection_models if model != PaperApp.PAPER_CITES_REL]
+
+    defer_references = PaperApp.PAPER_CITES_REL in connection_models
+    checkpoint_keys = [('nodes', model) for model in models] + [('connections', model) for model in connection_models]
+
+    def save_checkpoint(kind, model, position):
+        if checkpoints is not None:
+            checkpoints.set(kind, model, position)
+
+    def finish_checkpoints():
+        if checkpoints is not None:
+            checkpoints.remove(all_checkpoint_keys)
+
+    if not checkpoint_keys:
+        print('\nEvery selected model is already loaded.')
+        finish_checkpoints()
+        return
+
+    if defer_references and not (models or in_pass_connection_models) \
+       and (checkpoints is None or checkpoints.get('connections', PaperApp.PAPER_CITES_REL) is None):
+        # Only references are loaded, they are read directly as paper id pairs
+        stats = create_citations(iter_reference_pairs(dataset_path, dataset_encoding, citations_batch_size, parse_workers),
+                                 database_url, database_name, transaction_size=citations_transaction_size,
+                                 batch_sizer=batch_sizer)
+        print(f'\n{PaperApp.PAPER_CITES_REL.value} connections: {stats}')
+        finish_checkpoints()
+        return
+
+    def print_loaded():
+        for model in models:
+            print(f'\n{model.value} nodes loaded to {database_name} database.')
+        if connection_models:
+            print(f'\n{PaperApp.PAPER.value} relationships loaded to {database_name} database.')
+
+    if engine == 'async':
+        stats = asyncio.run(populate_db_async(models, dataset_path, dataset_encoding, batch_sizes,
+                                              database_url, database_name, connection_models, connections_batch_size,
+                                              parse_workers, citations_batch_size, write_concurrency,
+                                              batch_sizer=batch_sizer,
+                                              citations_transaction_size=citations_transaction_size))
+        print(f'\nPipeline: {stats}')
+        print_loaded()
+        return
+
+    node_loaders = {model: get_node_loader(model, engine) for model in models}
+    create_paper_connections = LOAD_ENGINES[engine].create_paper_connections
+
+    if cache is not None and engine == 'neomodel':
+        node_loaders = {model: partial(loader, cache=cache) for model, loader in node_loaders.items()}
+        create_paper_connections = partial(create_paper_connections, cache=cache)
+
+    parallel_loader = None
+    if connection_workers > 1 and in_pass_connection_models:
+        if engine != 'bulk':
+            raise ValueError(f'Parallel connection loading is not supported by the \'{engine}\' engine.')
+
+        parallel_loader = ParallelConnectionLoader(database_url, database_name, connection_workers)
+        create_paper_connections = parallel_loader.create_paper_connections
+
+    batches = {model: [] for model in models}
+    connections_batch = []
+
+    if batch_sizer is not None:
+        for model in models:
+            batch_sizer.add(get_node_batch_key(model), batch_sizes[model])
+        if in_pass_connection_models:
+            batch_sizer.add(CONNECTIONS_BATCH_KEY, connections_batch_size)
+
+    metrics = get_active_metrics()
+
+    def batch_size(key, size):
+        return batch_sizer.size(key) if batch_sizer is not None else size
+
+    def run_batch(key, metrics_key, rows, load):
+        with metrics.batch(metrics_key, len(rows)) if metrics is not None else nullcontext():
+            if batch_sizer is not None:
+                batch_sizer.run(key, rows, load)
+            else:
+                load(rows)
+
+    # The PaperCitesRel pairs are kept in a spool file next to the checkpoints when the load is resumable
+    if checkpoints is not None and defer_references:
+        references_file = checkpoints.open_spool('connections', PaperApp.PAPER_CITES_REL)
+    else:
+        references_file = tempfile.TemporaryFile()
+
+    # Position of the paper after the last one added to each batch, by model and 'connections'
+    batch_positions = {}
+
+    def load_nodes(model):
+        if batches[model]:
+            run_batch(get_node_batch_key(model), model.value, batches[model],
+                      lambda rows: node_loaders[model](rows, database_url, database_name))
+            batches[model] = []
+            save_checkpoint('nodes', model, batch_positions[model])
+
+    def load_connections():
+        if connections_batch:
+            for model in models:
+                load_nodes(model)
+
+            run_batch(CONNECTIONS_BATCH_KEY, 'connections', connections_batch,
+                      lambda rows: create_paper_connections(rows, database_url, database_name, in_pass_connection_models))
+            connections_batch.clear()
+
+            for model in in_pass_connection_models:
+                save_checkpoint('connections', model, batch_positions['connections'])
+
+    start = checkpoints.start_position(checkpoint_keys) if checkpoints is not None else None
+    first_index = {key: (checkpoints.get(*key) or {}).get('index', 0) if checkpoints is not None else 0
+                   for key in checkpoint_keys}
+    connections_first_index = min([first_index[('connections', model)] for model in in_pass_connection_models], default=0)
+    references_first_index = first_index.get(('connections', PaperApp.PAPER_CITES_REL), 0)
+
+    if start is not None:
+        print(f'\nResuming from paper {start["index"]}')
+
+    if models:
+        print(f'\nCreating {", ".join([model.value for model in models])} nodes')
+    if connection_models:
+        print(f'Creating {PaperApp.PAPER.value} connections: {", ".join([model.value for model in connection_models])}')
+
+    with references_file, parallel_loader or nullcontext():
+        references_buffer = array('q')
+        objects = iter_dataset_positions(dataset_path, dataset_encoding, start, workers=parse_workers,
+                                         fields=get_projection(models, connection_models))
+
+        if metrics is not None:
+            objects = metrics.timed_records(objects)
+
+        for position, obj in tqdm(objects, desc='Loading dataset', unit=' papers', initial=start['index'] if start else 0):
+            index = position['index']
+            next_position = {'index': index + 1, 'offset': position['offset'], 'skip': position['skip'] + 1}
+
+            for model in models:
+                if index < first_index[('nodes', model)]:
+                    continue
+
+                batches[model].append(obj)
+                batch_positions[model] = next_position
+
+                if len(batches[model]) >= batch_size(get_node_batch_key(model), batch_sizes[model]):
+                    load_nodes(model)
 
-                elif model == InstitutionApp.PUBLISHER:
-                    create_publisher_nodes(batch, database_url, database_name)
+            if in_pass_connection_models and index >= connections_first_index:
+                connections_batch.append(obj)
+                batch_positions['connections'] = next_position
+
+                if len(connections_batch) >= batch_size(CONNECTIONS_BATCH_KEY, connections_batch_size):
+                    load_connections()
 
-                elif model == InstitutionApp.VENUE:
-                    create_venue_nodes(batch, database_url, database_name)
+            if defer_references and index >= references_first_index and obj.get('references', None):
+                paper_id = int(obj['id'])
+                for ref_id in dict.fromkeys(obj['references']):
+                    references_buffer.extend((paper_id, int(ref_id)))
 
-                elif model in (AuthorApp.AUTHOR, InstitutionApp.ORGANIZATION):
-                    create_author_org_nodes(batch, database_url, database_name)
+                if len(references_buffer) >= 2 * citations_batch_size:
+                    references_buffer.tofile(references_file)
+                    references_buffer = array('q')
+
+                    if checkpoints is not None:
+                        references_file.flush()
+                        os.fsync(references_file.fileno())
+                        save_checkpoint('connections', PaperApp.PAPER_CITES_REL,
+                                        {**next_position, 'spool_bytes': references_file.tell()})
+
+        for model in models:
+            load_nodes(model)
+        load_connections()
+
+        if checkpoints is not None:
+            checkpoints.mark_done([key for key in checkpoint_keys if key != ('connections', PaperApp.PAPER_CITES_REL)])
+
+        if defer_references:
+            references_buffer.tofile(references_file)
+            references_file.seek(0)
+
+            stats = create_citations(iter_spooled_pairs(references_file, citations_batch_size), database_url, database_name,
+                                     transaction_size=citations_transaction_size, batch_sizer=batch_sizer)
+            print(f'\n{PaperApp.PAPER_CITES_REL.value} connections: {stats}')
+
+    if parallel_loader is not None:
+        print('\nConnection workers:')
+        for pid, stats in parallel_loader.stats().items():
+            print(f'Worker {pid}: {stats}')
 
-                elif model == PaperApp.FIELD_OF_STUDY:
-                    create_fos_nodes(batch, database_url, database_name)
-
-                elif model == PaperApp.PAPER:
-                    create_paper_nodes(batch, database_url, database_name)
-
-                batch = []
-
-        if batch:
-            if model == PaperApp.DOCUMENT_TYPE:
-                create_document_type_nodes(batch, database_url, database_name)
-
-            elif model == InstitutionApp.PUBLISHER:
-                create_publisher_nodes(batch, database_url, database_name)
-
-            elif model == InstitutionApp.VENUE:
-                create_venue_nodes(batch, database_url, database_name)
-
-            elif model in (AuthorApp.AUTHOR, InstitutionApp.ORGANIZATION):
-                create_author_org_nodes(batch, database_url, database_name)
-
-            elif model == PaperApp.FIELD_OF_STUDY:
-                create_fos_nodes(batch, database_url, database_name)
-
-            elif model == PaperApp.PAPER:
-                create_paper_nodes(batch, database_url, database_name)
-
-    print(f'\n{model.value} nodes loaded to {database_name} database.')
+    finish_checkpoints()
+    print_loaded()
 
     gc.collect()
 
 
-def menu_create_models_nodes(database_url: str, database_name: str,
-                             dataset_path: str, dataset_encoding: str, batch_size: int,
-                             model: Union[AuthorApp, InstitutionApp, PaperApp]) -> None:
+def populate_db(model: Union[AuthorApp, InstitutionApp, PaperApp],
+                dataset_path: str, dataset_encoding: str, batch_size: int,
+                database_url: str, database_name: str, engine: str = 'bulk') -> None:
     '''
-    Menu to create the nodes of the selected model.
+    Populate the database with the nodes of the selected model.
 
     Parameters
     ----------
-    database_url : str
-        URL of the database.
-    database_name : str
-        Name of the database.
+    model : Union[AuthorApp, InstitutionApp, PaperApp]
+        Model to populate.
     dataset_path : str
         Path to the dataset.
     dataset_encoding : str
         Encoding of the dataset.
     batch_size : int
         Batch size to load the nodes.
-    model : Union[AuthorApp, InstitutionApp, PaperApp]
-        Model to populate.
+    database_url : str
+        URL of the database.
+    database_name : str
+        Name of the database.
+    engine : str
+        Loader engine. Options: 'bulk', 'neomodel', 'async'. Default is 'bulk'.
+    '''
+    populate_db_single_pass([model], dataset_path, dataset_encoding, {model: batch_size},
+                            database_url, database_name, engine)
+
+
+def confirm_create_nodes(database_url: str, database_name: str,
+                         models: List[Union[AuthorApp, InstitutionApp, PaperApp]]) -> bool:
+    '''
+    Ask for confirmation before creating the nodes of models that already have nodes in the database.
+
+    Parameters
+    ----------
+    database_url : str
+        URL of the database.
+    database_name : str
+        Name of the database.
+    models : List[Union[AuthorApp, InstitutionApp, PaperApp]]
+        Models whose nodes are going to be created together.
+
+    Returns
+    -------
+    bool
+        True if the nodes should be created.
     '''
     create_nodes = 'y'
-    count_nodes = querys.count_nodes(database_url, database_name, model)
+    counts = querys.count_model_nodes(database_url, database_name, models)
 
-    if count_nodes > 0:
-        print(f'\n{model.value} has {count_nodes} nodes created.')
+    if any(count > 0 for count in counts.values()):
+        print(f'\n{" and ".join([f"{model.value} has {count} nodes" for model, count in counts.items()])} created.')
 
         create_nodes = None
         while create_nodes not in ['y', 'n']:
-            create_nodes = input(f'Do you still want to create {model.value} nodes? (y/n): ')
+            create_nodes = input(f'Do you still want to create {" and ".join([model.value for model in models])} nodes? (y/n): ')
 
-    if create_nodes.lower() == 'y':
-        populate_db(model, dataset_path, dataset_encoding, batch_size, database_url, database_name)
-
-        count_nodes = querys.count_nodes(database_url, database_name, model)
-        print(f'Total {model.value} Nodes: {count_nodes}')
+    return create_nodes.lower() == 'y'
 
 
 
@@ -155,7 +449,24 @@ if __name__ == '__main__':
 
     BATCH_SIZE_REQUIRED_NODES = int(os.environ.get('BATCH_SIZE_REQUIRED_NODES', 10000))
     BATCH_SIZE_PAPER_NODES = int(os.environ.get('BATCH_SIZE_PAPER_NODES', 5000))
-    paper_nodes_batch = []
+    BATCH_SIZE_CITATIONS = int(os.environ.get('BATCH_SIZE_CITATIONS', 100000))
+    BATCH_SIZE_CONNECTIONS = int(os.environ.get('BATCH_SIZE_CONNECTIONS', BATCH_SIZE_PAPER_NODES))
+    BATCH_SIZE_CITES_TRANSACTION = int(os.environ.get('BATCH_SIZE_CITES_TRANSACTION', 20000))
+    ADAPTIVE_BATCH_SIZE = os.environ.get('ADAPTIVE_BATCH_SIZE', 'false').lower() in ['1', 'true', 'yes']
+    BATCH_TARGET_SECONDS = float(os.environ.get('BATCH_TARGET_SECONDS', 2))
+    BATCH_SIZE_MIN = int(os.environ.get('BATCH_SIZE_MIN', 100))
+    BATCH_SIZE_MAX = int(os.environ.get('BATCH_SIZE_MAX', 100000))
+    BATCH_MAX_RSS_MB = os.environ.get('BATCH_MAX_RSS_MB', None)
+    METRICS_PORT = int(os.environ.get('METRICS_PORT', 0))
+    METRICS_EXPORT_INTERVAL = float(os.environ.get('METRICS_EXPORT_INTERVAL', 60))
+    LOAD_ENGINE = os.environ.get('LOAD_ENGINE', 'bulk')
+    PARSE_WORKERS = int(os.environ.get('PARSE_WORKERS', 1))
+    PARALLEL_WORKERS = int(os.environ.get('PARALLEL_WORKERS', 1))
+    WRITE_CONCURRENCY = int(os.environ.get('WRITE_CONCURRENCY', 4))
+    ENTITY_CACHE_MAX_ENTRIES = int(os.environ.get('ENTITY_CACHE_MAX_ENTRIES', 2000000))
+    ENTITY_CACHE_MAX_MB = float(os.environ.get('ENTITY_CACHE_MAX_MB', 512))
+    APPLY_SCHEMA = os.environ.get('APPLY_SCHEMA', 'true').lower() in ['1', 'true', 'yes']
+    SCHEMA_TIMEOUT = float(os.environ.get('SCHEMA_TIMEOUT', 3600))
 
 
 
@@ -177,6 +488,9 @@ if __name__ == '__main__':
     database_url, database_name = neomodel_connect(db_option)
 
     print(f'Database: {database_name}')
+    print(f'Load engine: {LOAD_ENGINE}')
+    print(f'Parallel workers: {PARALLEL_WORKERS}')
+    print(f'Adaptive batch size: {ADAPTIVE_BATCH_SIZE}')
 
 
 
@@ -210,7 +524,7 @@ if __name__ == '__main__':
         print('\n=============================================')
         print(f' Create {PaperApp.PAPER.value} connections')
         print('=============================================')
-        print(f'Batch size: {BATCH_SIZE_PAPER_NODES}')
+        print(f'Batch size: {BATCH_SIZE_CONNECTIONS}')
         print(f'Select the {PaperApp.PAPER.value} connections to create:')
         print(f'1. {PaperApp.DOCUMENT_TYPE.value}')
         print(f'2. {InstitutionApp.PUBLISHER.value}')
@@ -247,63 +561,121 @@ if __name__ == '__main__':
 
 
 
-    time_start = time.time()
+    models_nodes = {
+        1: [PaperApp.DOCUMENT_TYPE],
+        2: [InstitutionApp.PUBLISHER],
+        3: [InstitutionApp.VENUE],
+        4: [AuthorApp.AUTHOR, InstitutionApp.ORGANIZATION],
+        5: [PaperApp.FIELD_OF_STUDY],
+        6: [PaperApp.PAPER],
+    }
+    models_selected = []
 
-    if 1 in model_options or 8 in model_options:
-        menu_create_models_nodes(database_url, database_name, dataset_path, dataset_encoding, BATCH_SIZE_REQUIRED_NODES, PaperApp.DOCUMENT_TYPE)
+    checkpoints = CheckpointStore(get_checkpoint_path(database_name), dataset_path)
+    resume = False
 
-    if 2 in model_options or 8 in model_options:
-        menu_create_models_nodes(database_url, database_name, dataset_path, dataset_encoding, BATCH_SIZE_REQUIRED_NODES, InstitutionApp.PUBLISHER)
+    if checkpoints.checkpoints and LOAD_ENGINE == 'async':
+        # Several batches are in flight at a time, so the async engine neither saves nor resumes checkpoints
+        print('\nAn interrupted load was found, but the async engine cannot resume it. '
+              'It is discarded and the selected models are loaded from the beginning.')
+        checkpoints.clear()
 
-    if 3 in model_options or 8 in model_options:
-        menu_create_models_nodes(database_url, database_name, dataset_path, dataset_encoding, BATCH_SIZE_REQUIRED_NODES, InstitutionApp.VENUE)
+    elif checkpoints.checkpoints:
+        print('\nAn interrupted load was found:')
+        for key, checkpoint in checkpoints.checkpoints.items():
+            status = 'finished' if checkpoint.get('done', False) else f'from paper {checkpoint["index"]}'
+            print(f'{key}: {status}')
 
-    if 4 in model_options or 8 in model_options:
-        create_nodes = 'y'
+        resume = None
+        while resume not in ['y', 'n']:
+            resume = input('Do you want to resume it? (y/n): ').lower()
 
-        count_author_nodes = querys.count_nodes(database_url, database_name, AuthorApp.AUTHOR)
-        count_org_nodes = querys.count_nodes(database_url, database_name, InstitutionApp.ORGANIZATION)
-        if count_author_nodes > 0 or count_org_nodes > 0:
-            print(f'\n{AuthorApp.AUTHOR.value} has {count_author_nodes} nodes and {InstitutionApp.ORGANIZATION.value} has {count_org_nodes} nodes created.')
+        resume = resume == 'y'
+        if not resume:
+            checkpoints.clear()
 
-            create_nodes = None
-            while create_nodes not in ['y', 'n']:
-                create_nodes = input(f'Do you still want to create {AuthorApp.AUTHOR.value} and {InstitutionApp.ORGANIZATION.value} nodes? (y/n): ')
+    for option, models in models_nodes.items():
+        if option in model_options or 8 in model_options:
+            if (resume and checkpoints.get('nodes', models[0]) is not None) \
+               or confirm_create_nodes(database_url, database_name, models):
+                models_selected.append(models[0])
 
-        if create_nodes.lower() == 'y':
-            populate_db(AuthorApp.AUTHOR, dataset_path, dataset_encoding, BATCH_SIZE_REQUIRED_NODES, database_url, database_name)
+    if not (7 in model_options or 8 in model_options):
+        paper_connections_models_selected = []
 
-            count_author_nodes = querys.count_nodes(database_url, database_name, AuthorApp.AUTHOR)
-            count_organization_nodes = querys.count_nodes(database_url, database_name, InstitutionApp.ORGANIZATION)
-            print(f'Total {AuthorApp.AUTHOR.value} Nodes: {count_author_nodes}')
-            print(f'Total {InstitutionApp.ORGANIZATION.value} Nodes: {count_organization_nodes}')
+    # Each model batch size can be pinned with its own variable, e.g. BATCH_SIZE_FIELD_OF_STUDY_NODES
+    batch_sizes = {model: int(os.environ.get(get_node_batch_key(model),
+                                             BATCH_SIZE_PAPER_NODES if model == PaperApp.PAPER else BATCH_SIZE_REQUIRED_NODES))
+                   for model in models_selected}
 
-    if 5 in model_options or 8 in model_options:
-        menu_create_models_nodes(database_url, database_name, dataset_path, dataset_encoding, BATCH_SIZE_REQUIRED_NODES, PaperApp.FIELD_OF_STUDY)
 
-    if 6 in model_options or 8 in model_options:
-        menu_create_models_nodes(database_url, database_name, dataset_path, dataset_encoding, BATCH_SIZE_REQUIRED_NODES, PaperApp.PAPER)
 
-    if 7 in model_options or 8 in model_options:
-        paper_nodes_batch = []
+    time_start = time.time()
+
+    # Constraints before the MERGE of the nodes. The secondary indexes are created after the nodes are loaded,
+    # unless the Paper connections are loaded in the same pass and need them for their lookups
+    indexes_before_load = bool(paper_connections_models_selected)
+    if APPLY_SCHEMA:
+        print('\nApplying constraints...')
+        apply_constraints(database_url, database_name, timeout=SCHEMA_TIMEOUT)
+
+        if indexes_before_load:
+            print('\nApplying indexes...')
+            apply_indexes(database_url, database_name, timeout=SCHEMA_TIMEOUT)
+
+    entity_cache = None
+    if LOAD_ENGINE == 'neomodel':
+        entity_cache = EntityCache(ENTITY_CACHE_MAX_ENTRIES, ENTITY_CACHE_MAX_MB)
+        print(f'\nWarming entity cache: {entity_cache.warm(database_url, database_name)} nodes loaded')
+
+    batch_sizer = None
+    if ADAPTIVE_BATCH_SIZE:
+        batch_sizer = AdaptiveBatchSizer(BATCH_TARGET_SECONDS, BATCH_SIZE_MIN, BATCH_SIZE_MAX,
+                                         float(BATCH_MAX_RSS_MB) if BATCH_MAX_RSS_MB else None)
+
+    metrics_path = get_metrics_path(database_name)
+    metrics = LoadMetrics(metrics_path, METRICS_EXPORT_INTERVAL)
+
+    if METRICS_PORT:
+        metrics.serve(METRICS_PORT)
+        print(f'\nServing metrics on port {METRICS_PORT}')
+
+    with metrics:
+        populate_db_single_pass(models_selected, dataset_path, dataset_encoding, batch_sizes,
+                                database_url, database_name, LOAD_ENGINE,
+                                paper_connections_models_selected, BATCH_SIZE_CONNECTIONS, PARSE_WORKERS,
+                                entity_cache, BATCH_SIZE_CITATIONS, PARALLEL_WORKERS, WRITE_CONCURRENCY,
+                                checkpoints if LOAD_ENGINE != 'async' else None, batch_sizer,
+                                BATCH_SIZE_CITES_TRANSACTION)
+
+    if APPLY_SCHEMA and not indexes_before_load:
+        print('\nApplying indexes...')
+        apply_indexes(database_url, database_name, timeout=SCHEMA_TIMEOUT)
 
-        print(f'\nCreating {PaperApp.PAPER.value} connections')
-        print(f'Models selected: {", ".join([model.value for model in paper_connections_models_selected])}')
+    if APPLY_SCHEMA:
+        for label, properties in uncovered_lookups(database_url, database_name):
+            print(f'Lookup not covered by any index: {label} ({", ".join(properties)})')
 
-        with open(dataset_path, 'r', encoding=dataset_encoding) as f:
-            objects = ijson.items(f, 'item')
+    metrics_summary = metrics.summary()
+    print(f'\nMetrics written to {metrics_path}.prom and {metrics_path}.json')
+    print(f'Records: {metrics_summary["records"]} ({metrics_summary["records_per_second"]} records/s), '
+          f'peak RSS: {metrics_summary["peak_rss_mb"]} MB')
 
-            for obj in tqdm(objects, desc=f'Creating {PaperApp.PAPER.value} connections', unit=' papers'):
-                paper_nodes_batch.append(obj)
+    for key, stages in metrics_summary['stages'].items():
+        for stage, stats in stages.items():
+            print(f'{key} {stage}: {stats}')
 
-                if len(paper_nodes_batch) >= BATCH_SIZE_PAPER_NODES:
-                    create_paper_connections(paper_nodes_batch, database_url, database_name, paper_connections_models_selected)
-                    paper_nodes_batch = []
+    if batch_sizer is not None:
+        print('\nAdaptive batch sizes (set these variables to pin them):')
+        for key, stats in batch_sizer.stats().items():
+            print(f'{key}={stats["size"]}  {stats}')
 
-            if paper_nodes_batch:
-                create_paper_connections(paper_nodes_batch, database_url, database_name, paper_connections_models_selected)
+    if entity_cache is not None:
+        print(f'Entity cache: {entity_cache.stats()}')
 
-        print(f'\n{PaperApp.PAPER.value} relationships loaded to {database_name} database.')
+    # Every count of the summary, in a single query
+    graph_stats = querys.get_graph_stats(database_url, database_name, refresh=True)
+    count_nodes = {model: graph_stats['labels'].get(model.value, 0) for model in list(AuthorApp) + list(InstitutionApp) + list(PaperApp)}
 
 
 
@@ -317,43 +689,43 @@ if __name__ == '__main__':
     print('==============================')
     print(f'Database: {database_name}')
     print(f'Time Elapsed: {time_elapsed_hours:.0f} hours {time_elapsed % 3600:.0f} minutes')
-    print(f'Total Nodes in Database: {querys.count_nodes(database_url, database_name)}')
-    # print(f'Total Relationships in Database: {querys.count_relationships(database_url, database_name)}')
+    print(f'Total Nodes in Database: {graph_stats["nodes"]}')
+    print(f'Total Relationships in Database: {graph_stats["relationships"]}')
 
     if any([option in model_options for option in [1, 5, 6, 7, 8]]):
         print('\nPaper App Nodes:')
         if 8 in model_options:
-            print(f'\n{PaperApp.PAPER.value} Nodes: {querys.count_nodes(database_url, database_name, PaperApp.PAPER)}')
-            print(f'{PaperApp.DOCUMENT_TYPE.value} Nodes: {querys.count_nodes(database_url, database_name, PaperApp.DOCUMENT_TYPE)}')
-            print(f'{PaperApp.FIELD_OF_STUDY.value} Nodes: {querys.count_nodes(database_url, database_name, PaperApp.FIELD_OF_STUDY)}')
+            print(f'\n{PaperApp.PAPER.value} Nodes: {count_nodes[PaperApp.PAPER]}')
+            print(f'{PaperApp.DOCUMENT_TYPE.value} Nodes: {count_nodes[PaperApp.DOCUMENT_TYPE]}')
+            print(f'{PaperApp.FIELD_OF_STUDY.value} Nodes: {count_nodes[PaperApp.FIELD_OF_STUDY]}')
 
         elif 6 in model_options:
-            print(f'\n{PaperApp.PAPER.value} Nodes: {querys.count_nodes(database_url, database_name, PaperApp.PAPER)}')
+            print(f'\n{PaperApp.PAPER.value} Nodes: {count_nodes[PaperApp.PAPER]}')
 
         elif 1 in model_options:
-            print(f'\n{PaperApp.DOCUMENT_TYPE.value} Nodes: {querys.count_nodes(database_url, database_name, PaperApp.DOCUMENT_TYPE)}')
+            print(f'\n{PaperApp.DOCUMENT_TYPE.value} Nodes: {count_nodes[PaperApp.DOCUMENT_TYPE]}')
 
         elif 5 in model_options:
-            print(f'\n{PaperApp.FIELD_OF_STUDY.value} Nodes: {querys.count_nodes(database_url, database_name, PaperApp.FIELD_OF_STUDY)}')
+            print(f'\n{PaperApp.FIELD_OF_STUDY.value} Nodes: {count_nodes[PaperApp.FIELD_OF_STUDY]}')
 
 
     if any([option in model_options for option in [4, 8]]):
         print('\nAuthor App Nodes:')
-        print(f'\n{AuthorApp.AUTHOR.value} Nodes: {count_author_nodes}')
+        print(f'\n{AuthorApp.AUTHOR.value} Nodes: {count_nodes[AuthorApp.AUTHOR]}')
 
 
     if any([option in model_options for option in [2, 3, 4, 8]]):
         print('\nInstitution App Nodes:')
         if 8 in model_options:
-            print(f'\n{InstitutionApp.ORGANIZATION.value} Nodes: {count_organization_nodes}')
-            print(f'{InstitutionApp.PUBLISHER.value} Nodes: {querys.count_nodes(database_url, database_name, InstitutionApp.PUBLISHER)}')
-            print(f'{InstitutionApp.VENUE.value} Nodes: {querys.count_nodes(database_url, database_name, InstitutionApp.VENUE)}')
+            print(f'\n{InstitutionApp.ORGANIZATION.value} Nodes: {count_nodes[InstitutionApp.ORGANIZATION]}')
+            print(f'{InstitutionApp.PUBLISHER.value} Nodes: {count_nodes[InstitutionApp.PUBLISHER]}')
+            print(f'{InstitutionApp.VENUE.value} Nodes: {count_nodes[InstitutionApp.VENUE]}')
 
         elif 4 in model_options:
-            print(f'\n{InstitutionApp.ORGANIZATION.value} Nodes: {count_organization_nodes}')
+            print(f'\n{InstitutionApp.ORGANIZATION.value} Nodes: {count_nodes[InstitutionApp.ORGANIZATION]}')
 
         elif 2 in model_options:
-            print(f'\n{InstitutionApp.PUBLISHER.value} Nodes: {querys.count_nodes(database_url, database_name, InstitutionApp.PUBLISHER)}')
+            print(f'\n{InstitutionApp.PUBLISHER.value} Nodes: {count_nodes[InstitutionApp.PUBLISHER]}')
 
         elif 3 in model_options:
-            print(f'\n{InstitutionApp.VENUE.value} Nodes: {querys.count_nodes(database_url, database_name, InstitutionApp.VENUE)}')
+            print(f'\n{InstitutionApp.VENUE.value} Nodes: {count_nodes[InstitutionApp.VENUE]}')
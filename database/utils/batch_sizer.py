@@ -0,0 +1,269 @@
+import os
+import sys
+import time
+from typing import Callable, Dict, Optional, Sequence, Union
+
+from tqdm import tqdm
+from neo4j.exceptions import Neo4jError
+
+from core.enums.app_enums import AuthorApp, InstitutionApp, PaperApp
+
+
+# Parts of the status codes of the server errors raised when a transaction runs out of memory,
+# e.g. 'Neo.TransientError.General.MemoryPoolOutOfMemoryError' or 'Neo.TransientError.General.TransactionMemoryLimit'.
+MEMORY_ERROR_CODES = ('OutOfMemory', 'MemoryLimit', 'MemoryPool')
+
+# Weight of the last batch in the moving average of the seconds per row.
+SMOOTHING = 0.3
+
+# Changes smaller than this fraction of the size are ignored, so the size does not flap between close values.
+DEAD_BAND = 0.1
+
+# After a memory error, the size of the key never grows over this fraction of the batch that failed.
+MEMORY_CEILING = 0.9
+
+# Key of the in-pass Paper connections batches.
+CONNECTIONS_BATCH_KEY = 'BATCH_SIZE_CONNECTIONS'
+
+
+
+def get_rss_mb() -> Optional[float]:
+    '''
+    Get the resident memory of this process, in MB.
+
+    Returns
+    -------
+    Optional[float]
+        Current RSS read from '/proc' on Linux, the peak RSS on other Unix systems, or None on Windows.
+    '''
+    try:
+        with open('/proc/self/statm', 'r') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / (1024 * 1024)
+
+    except (OSError, ValueError, IndexError):
+        pass
+
+    try:
+        import resource
+    except ImportError:
+        return None
+
+    # ru_maxrss is in bytes on macOS and in KB on the other systems
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return max_rss / (1024 * 1024) if sys.platform == 'darwin' else max_rss / 1024
+
+
+def get_node_batch_key(model: Union[AuthorApp, InstitutionApp, PaperApp]) -> str:
+    '''
+    Get the key of the node batches of a model, the environment variable that pins its size (e.g. 'BATCH_SIZE_PAPER_NODES').
+    '''
+    return f'BATCH_SIZE_{model.name}_NODES'
+
+
+def is_memory_error(error: BaseException) -> bool:
+    '''
+    Check if an error means the transaction was too big: a server out of memory error or a client MemoryError.
+    '''
+    if isinstance(error, MemoryError):
+        return True
+
+    return isinstance(error, Neo4jError) and any(code in (error.code or '') for code in MEMORY_ERROR_CODES)
+
+
+
+class AdaptiveBatchSizer:
+    '''
+    Controller of the batch size of each load key (a model nodes, the Paper connections, the CITES transactions).
+    Every key starts at its configured size and is adjusted after each batch is committed:
+        - latency: the size moves towards the number of rows committed in 'target_seconds', estimated with a
+          moving average of the seconds per row. It grows at most by 'growth' and shrinks at most by half per batch.
+        - memory errors: when a transaction runs out of memory ('is_memory_error') the size is halved and the
+          rows not committed yet are retried in smaller batches, see 'run'. The size of the key is then kept
+          under the size that failed.
+        - client memory: when the RSS of the process is over 'max_rss_mb' the size is halved.
+    Sizes stay between 'min_size' and 'max_size'. Every change is logged, and 'stats' gives the final sizes
+    so they can be pinned with the BATCH_SIZE_* environment variables.
+
+    Parameters
+    ----------
+    target_seconds : float
+        Commit latency to aim for. Default is 2.
+    min_size : int
+        Minimum batch size. Default is 100.
+    max_size : int
+        Maximum batch size. Default is 100,000.
+    max_rss_mb : Optional[float]
+        RSS of the process over which batches are shrunk, in MB. Default is None (not checked).
+    growth : float
+        Maximum growth factor per batch. Default is 1.5.
+    verbose : bool
+        Log every size change. Default is True.
+    '''
+    def __init__(self, target_seconds: float = 2.0, min_size: int = 100, max_size: int = 100000,
+                 max_rss_mb: Optional[float] = None, growth: float = 1.5, verbose: bool = True) -> None:
+        if min_size < 1 or min_size > max_size:
+            raise ValueError(f'Invalid batch size bounds: {min_size} - {max_size}.')
+
+        self.target_seconds = target_seconds
+        self.min_size = min_size
+        self.max_size = max_size
+        self.max_rss_mb = max_rss_mb
+        self.growth = growth
+        self.verbose = verbose
+
+        self.sizes = {}
+        self.seconds_per_row = {}
+        self.ceilings = {}
+        self.key_stats = {}
+
+    def _clamp(self, size: float, key: Optional[str] = None) -> int:
+        return int(max(self.min_size, min(self.ceilings.get(key, self.max_size), size)))
+
+    def add(self, key: str, size: int) -> None:
+        '''
+        Register a key with its initial batch size. Keys already registered keep their current size.
+
+        Parameters
+        ----------
+        key : str
+            Name of the key, e.g. the environment variable that sets its size.
+        size : int
+            Initial batch size.
+        '''
+        if key not in self.sizes:
+            self.sizes[key] = self._clamp(size)
+            self.key_stats[key] = {'initial': self.sizes[key], 'batches': 0, 'rows': 0, 'seconds': 0.0,
+                                   'memory_errors': 0, 'changes': 0, 'smallest': self.sizes[key], 'largest': self.sizes[key]}
+
+    def size(self, key: str) -> int:
+        '''
+        Get the current batch size of a key.
+        '''
+        return self.sizes[key]
+
+    def _set_size(self, key: str, size: int, reason: str) -> None:
+        old_size = self.sizes[key]
+        stats = self.key_stats[key]
+
+        if size == old_size:
+            return
+
+        self.sizes[key] = size
+        stats['changes'] += 1
+        stats['smallest'] = min(stats['smallest'], size)
+        stats['largest'] = max(stats['largest'], size)
+
+        if self.verbose:
+            tqdm.write(f'Batch size of {key}: {old_size} -> {size} ({reason})')
+
+    def record(self, key: str, rows: int, seconds: float) -> None:
+        '''
+        Adjust the batch size of a key after a batch was committed.
+
+        Parameters
+        ----------
+        key : str
+            Name of the key.
+        rows : int
+            Rows of the batch.
+        seconds : float
+            Time taken to commit the batch.
+        '''
+        if rows <= 0:
+            return
+
+        stats = self.key_stats[key]
+        stats['batches'] += 1
+        stats['rows'] += rows
+        stats['seconds'] += seconds
+
+        rss = get_rss_mb() if self.max_rss_mb is not None else None
+        if rss is not None and rss > self.max_rss_mb:
+            self._set_size(key, self._clamp(self.sizes[key] // 2, key), f'RSS {rss:.0f} MB')
+            return
+
+        seconds_per_row = seconds / rows
+        if key in self.seconds_per_row:
+            seconds_per_row = SMOOTHING * seconds_per_row + (1 - SMOOTHING) * self.seconds_per_row[key]
+        self.seconds_per_row[key] = seconds_per_row
+
+        size = self.sizes[key]
+        target = self.target_seconds / seconds_per_row if seconds_per_row > 0 else size * self.growth
+        target = self._clamp(min(size * self.growth, max(size / 2, target)), key)
+
+        if abs(target - size) > DEAD_BAND * size or target in [self.min_size, self.ceilings.get(key, self.max_size)]:
+            self._set_size(key, target, f'{seconds:.2f}s for {rows} rows')
+
+    def memory_error(self, key: str, rows: int) -> bool:
+        '''
+        Halve the batch size of a key after a transaction of 'rows' rows ran out of memory.
+
+        Returns
+        -------
+        bool
+            False if the size was already the minimum, so there is nothing left to try.
+        '''
+        self.key_stats[key]['memory_errors'] += 1
+
+        if rows <= self.min_size:
+            return False
+
+        self.ceilings[key] = max(self.min_size, int(rows * MEMORY_CEILING))
+        self._set_size(key, self._clamp(rows // 2, key), f'out of memory with {rows} rows')
+        return True
+
+    def run(self, key: str, rows: Sequence, load: Callable[[Sequence], None]) -> None:
+        '''
+        Load rows in batches of the current size of a key, adjusting the size after each batch.
+        A batch that runs out of memory is retried in smaller batches, the batches already loaded are not repeated.
+        The load function is called with slices of the rows, so a failed slice must leave no trace in the
+        database or on the client: each slice runs in one transaction that is rolled back on error, with
+        MERGE or get-or-create writes. Client-side state is only updated after the commit: the neomodel
+        loaders stage their 'EntityCache' entries with 'EntityCache.transaction', so a retried slice
+        creates again the nodes of the failed one instead of reusing their element ids.
+
+        Parameters
+        ----------
+        key : str
+            Name of the key, registered with 'add'.
+        rows : Sequence
+            Rows to load (list or np.ndarray).
+        load : Callable[[Sequence], None]
+            Function that commits a batch of rows.
+
+        Raises
+        ------
+        Exception
+            Errors of the load function that are not memory errors, or memory errors at the minimum size.
+        '''
+        start = 0
+
+        while start < len(rows):
+            batch = rows[start:start + self.sizes[key]]
+            time_start = time.perf_counter()
+
+            try:
+                load(batch)
+
+            except Exception as e:
+                if is_memory_error(e) and self.memory_error(key, len(batch)):
+                    continue
+                raise
+
+            self.record(key, len(batch), time.perf_counter() - time_start)
+            start += len(batch)
+
+    def stats(self) -> Dict[str, dict]:
+        '''
+        Get the chosen batch size of each key.
+
+        Returns
+        -------
+        Dict[str, dict]
+            size (current), initial, smallest, largest, batches, rows, rows_per_second, memory_errors and changes of each key.
+        '''
+        return {
+            key: {'size': self.sizes[key], **{name: value for name, value in stats.items() if name != 'seconds'},
+                  'rows_per_second': round(stats['rows'] / stats['seconds'], 1) if stats['seconds'] else 0.0}
+            for key, stats in self.key_stats.items()
+        }
@@ -0,0 +1,250 @@
+import os
+import json
+from os.path import join, dirname
+from typing import BinaryIO, Iterable, Optional, Tuple, Union
+
+from core.enums.app_enums import AuthorApp, InstitutionApp, PaperApp
+from dataset.utils.columnar_cache import source_signature
+
+
+
+def get_checkpoint_path(database_name: str) -> str:
+    '''
+    Get the checkpoint file of a database, in the directory set by the 'CHECKPOINT_PATH'
+    environment variable (default './checkpoints').
+
+    Parameters
+    ----------
+    database_name : str
+        Name of the database.
+
+    Returns
+    -------
+    str
+        Path to the checkpoint file.
+    '''
+    return join(os.environ.get('CHECKPOINT_PATH', './checkpoints'), f'{database_name}.json')
+
+
+def write_json_atomic(path: str, data: dict) -> None:
+    '''
+    Write a JSON file atomically: the data is written and synced to a temporary file in the same directory,
+    which then replaces the file. A crash leaves either the old or the new file, never a partial one.
+
+    Parameters
+    ----------
+    path : str
+        Path to the file.
+    data : dict
+        Data to write.
+    '''
+    directory = dirname(path) or '.'
+    os.makedirs(directory, exist_ok=True)
+    tmp_path = f'{path}.tmp'
+
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(data, f)
+        f.flush()
+        os.fsync(f.fileno())
+
+    os.replace(tmp_path, path)
+
+    # Persist the rename. Directories cannot be opened on Windows.
+    if hasattr(os, 'O_DIRECTORY'):
+        fd = os.open(directory, os.O_RDONLY | os.O_DIRECTORY)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+
+
+class CheckpointStore:
+    '''
+    Durable checkpoints of a load, one per model nodes and per Paper connection type.
+    Each checkpoint is the dataset position ('dataset_reader.iter_dataset_positions') of the first paper
+    that is not committed yet, or 'done' when the load of that key finished, together with the 'kind'
+    and 'model' of its key.
+    Checkpoints of another version of the dataset (different size or modification time) are discarded.
+
+    Parameters
+    ----------
+    path : str
+        Path to the checkpoint file, e.g. from 'get_checkpoint_path'.
+    dataset_path : str
+        Path to the dataset being loaded.
+    '''
+    def __init__(self, path: str, dataset_path: str) -> None:
+        self.path = path
+        self.signature = source_signature(dataset_path)
+        self.checkpoints = {}
+
+        if os.path.exists(path):
+            with open(path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+
+            if data.get('dataset', None) == self.signature:
+                self.checkpoints = data.get('checkpoints', {})
+            else:
+                print(f'Checkpoints in {path} belong to another version of the dataset, they are discarded.')
+
+    @staticmethod
+    def key(kind: str, model: Union[AuthorApp, InstitutionApp, PaperApp]) -> str:
+        '''
+        Get the key of a checkpoint.
+
+        Parameters
+        ----------
+        kind : str
+            Options: 'nodes', 'connections'.
+        model : Union[AuthorApp, InstitutionApp, PaperApp]
+            Model of the nodes, or model connected to the Paper model.
+
+        Returns
+        -------
+        str
+            Checkpoint key, e.g. 'nodes:Paper'.
+        '''
+        return f'{kind}:{model.value}'
+
+    @staticmethod
+    def model_of(value: str) -> Union[AuthorApp, InstitutionApp, PaperApp]:
+        '''
+        Get the model of a checkpoint from the value stored with it.
+        '''
+        return next(model for model in list(AuthorApp) + list(InstitutionApp) + list(PaperApp) if model.value == value)
+
+    def _save(self) -> None:
+        write_json_atomic(self.path, {'dataset': self.signature, 'checkpoints': self.checkpoints})
+
+    def get(self, kind: str, model: Union[AuthorApp, InstitutionApp, PaperApp]) -> Optional[dict]:
+        '''
+        Get a checkpoint.
+
+        Returns
+        -------
+        Optional[dict]
+            Position of the first paper not committed, {'done': True} if the load finished, or None if there is no checkpoint.
+        '''
+        return self.checkpoints.get(self.key(kind, model), None)
+
+    def is_done(self, kind: str, model: Union[AuthorApp, InstitutionApp, PaperApp]) -> bool:
+        '''
+        Check if the load of a key finished.
+        '''
+        return (self.get(kind, model) or {}).get('done', False)
+
+    def set(self, kind: str, model: Union[AuthorApp, InstitutionApp, PaperApp], position: dict) -> None:
+        '''
+        Save the position of the first paper not committed of a key. Call it after the transaction commits.
+
+        Parameters
+        ----------
+        kind : str
+            Options: 'nodes', 'connections'.
+        model : Union[AuthorApp, InstitutionApp, PaperApp]
+            Model of the nodes, or model connected to the Paper model.
+        position : dict
+            Dataset position.
+        '''
+        self.checkpoints[self.key(kind, model)] = {**position, 'kind': kind, 'model': model.value}
+        self._save()
+
+    def mark_done(self, keys: Iterable[Tuple[str, Union[AuthorApp, InstitutionApp, PaperApp]]]) -> None:
+        '''
+        Mark the load of every (kind, model) key as finished.
+        '''
+        for kind, model in keys:
+            self.checkpoints[self.key(kind, model)] = {'done': True, 'kind': kind, 'model': model.value}
+        self._save()
+
+    def remove(self, keys: Iterable[Tuple[str, Union[AuthorApp, InstitutionApp, PaperApp]]]) -> None:
+        '''
+        Remove the checkpoints and spool files of every (kind, model) key, once the whole load finished.
+        '''
+        for kind, model in keys:
+            self.checkpoints.pop(self.key(kind, model), None)
+
+            if os.path.exists(self.spool_path(kind, model)):
+                os.remove(self.spool_path(kind, model))
+        self._save()
+
+    def clear(self) -> None:
+        '''
+        Remove every checkpoint and spool file.
+        '''
+        for checkpoint in self.checkpoints.values():
+            # Checkpoints written before the kind and model were stored are skipped, their spool file is
+            # truncated by 'open_spool' when the key is loaded again without a checkpoint
+            if 'model' not in checkpoint:
+                continue
+
+            spool_path = self.spool_path(checkpoint['kind'], self.model_of(checkpoint['model']))
+
+            if os.path.exists(spool_path):
+                os.remove(spool_path)
+
+        self.checkpoints = {}
+        self._save()
+
+    def spool_path(self, kind: str, model: Union[AuthorApp, InstitutionApp, PaperApp]) -> str:
+        '''
+        Get the path of the spool file of a key, next to the checkpoint file.
+        '''
+        return f'{self.path}.{kind}.{model.value}.spool'
+
+    def open_spool(self, kind: str, model: Union[AuthorApp, InstitutionApp, PaperApp]) -> BinaryIO:
+        '''
+        Open the spool file of a key, for data that is collected during the pass and loaded after it
+        (the PaperCitesRel pairs). The file is truncated to the size saved in the checkpoint ('spool_bytes'),
+        so the data written after the last checkpoint is discarded and written again on resume.
+        If the spool file was lost, the checkpoint of the key is removed and the key starts over.
+
+        Parameters
+        ----------
+        kind : str
+            Options: 'nodes', 'connections'.
+        model : Union[AuthorApp, InstitutionApp, PaperApp]
+            Model of the nodes, or model connected to the Paper model.
+
+        Returns
+        -------
+        BinaryIO
+            File positioned at the end of the committed data.
+        '''
+        path = self.spool_path(kind, model)
+        size = (self.get(kind, model) or {}).get('spool_bytes', 0)
+
+        if not os.path.exists(path) or os.path.getsize(path) < size:
+            if self.get(kind, model) is not None:
+                self.checkpoints.pop(self.key(kind, model))
+                self._save()
+            size = 0
+
+        os.makedirs(dirname(path) or '.', exist_ok=True)
+        f = open(path, 'r+b' if os.path.exists(path) else 'w+b')
+        f.truncate(size)
+        f.seek(size)
+
+        return f
+
+    def start_position(self, keys: Iterable[Tuple[str, Union[AuthorApp, InstitutionApp, PaperApp]]]) -> Optional[dict]:
+        '''
+        Get the position to resume a load of several keys from: the earliest checkpoint of the keys not finished.
+
+        Returns
+        -------
+        Optional[dict]
+            Dataset position, or None if any of the keys has no checkpoint (the load starts at the beginning).
+        '''
+        positions = []
+
+        for kind, model in keys:
+            checkpoint = self.get(kind, model)
+
+            if checkpoint is None:
+                return None
+            if not checkpoint.get('done', False):
+                positions.append(checkpoint)
+
+        return min(positions, key=lambda position: position['index']) if positions else None
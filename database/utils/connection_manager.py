@@ -0,0 +1,209 @@
+import os
+import atexit
+import asyncio
+import threading
+from contextlib import contextmanager, asynccontextmanager
+from typing import AsyncIterator, Iterator, Optional
+
+from neo4j import AsyncDriver, AsyncGraphDatabase, AsyncSession, Driver, GraphDatabase, Session
+from neomodel import config, db
+
+from database.utils.db_connection import split_database_url
+
+
+# Drivers are keyed by process, so a process started with fork never uses the connections of its parent.
+# Async drivers are also keyed by event loop, they can only be used from the loop they were created in.
+_drivers = {}
+_async_drivers = {}
+_lock = threading.Lock()
+
+
+
+def get_pool_settings() -> dict:
+    '''
+    Get the connection pool settings of the drivers from the environment variables:
+        - NEO4J_MAX_POOL_SIZE: maximum connections per driver. Default is 100.
+        - NEO4J_ACQUISITION_TIMEOUT: seconds to wait for a free connection of the pool. Default is 60.
+        - NEO4J_CONNECTION_TIMEOUT: seconds to wait to open a new connection. Default is 30.
+        - NEO4J_KEEP_ALIVE: enable TCP keep-alive on the connections. Default is true.
+        - NEO4J_MAX_CONNECTION_LIFETIME: seconds before a connection is replaced. Default is 3600.
+        - NEO4J_LIVENESS_CHECK_TIMEOUT: idle seconds after which a connection is checked before being used.
+          Default is None (never checked).
+
+    Returns
+    -------
+    dict
+        Driver configuration.
+    '''
+    liveness_check_timeout = os.environ.get('NEO4J_LIVENESS_CHECK_TIMEOUT', None)
+
+    return {
+        'max_connection_pool_size': int(os.environ.get('NEO4J_MAX_POOL_SIZE', 100)),
+        'connection_acquisition_timeout': float(os.environ.get('NEO4J_ACQUISITION_TIMEOUT', 60)),
+        'connection_timeout': float(os.environ.get('NEO4J_CONNECTION_TIMEOUT', 30)),
+        'keep_alive': os.environ.get('NEO4J_KEEP_ALIVE', 'true').lower() in ['1', 'true', 'yes'],
+        'max_connection_lifetime': float(os.environ.get('NEO4J_MAX_CONNECTION_LIFETIME', 3600)),
+        'liveness_check_timeout': float(liveness_check_timeout) if liveness_check_timeout else None,
+    }
+
+
+def _driver_key(database_url: str, auth: Optional[tuple]) -> tuple:
+    uri, url_auth = split_database_url(database_url)
+    return uri, tuple(auth) if auth else url_auth
+
+
+def get_driver(database_url: str, auth: Optional[tuple] = None) -> Driver:
+    '''
+    Get the shared pooled driver of a database, creating it on first use.
+    Drivers are thread-safe: every thread opens its own sessions from the same driver and pool.
+
+    Parameters
+    ----------
+    database_url : str
+        URL of the database, with the credentials ('neomodel_connect') or without them ('neo4j_connect').
+    auth : Optional[tuple]
+        Authentication tuple (username, password), required when the URL has no credentials.
+
+    Returns
+    -------
+    Driver
+        Driver of the database.
+    '''
+    uri, driver_auth = _driver_key(database_url, auth)
+    key = (os.getpid(), uri, driver_auth)
+
+    with _lock:
+        if key not in _drivers:
+            _drivers[key] = GraphDatabase.driver(uri, auth=driver_auth, **get_pool_settings())
+
+        return _drivers[key]
+
+
+def get_async_driver(database_url: str, auth: Optional[tuple] = None) -> AsyncDriver:
+    '''
+    Get the shared pooled async driver of a database for the running event loop, creating it on first use.
+    Every task opens its own sessions from the same driver and pool.
+    Close the drivers of the loop with 'close_async_drivers' before the loop ends.
+
+    Parameters
+    ----------
+    database_url : str
+        URL of the database, with the credentials ('neomodel_connect') or without them ('neo4j_connect').
+    auth : Optional[tuple]
+        Authentication tuple (username, password), required when the URL has no credentials.
+
+    Returns
+    -------
+    AsyncDriver
+        Async driver of the database.
+    '''
+    uri, driver_auth = _driver_key(database_url, auth)
+    key = (os.getpid(), id(asyncio.get_running_loop()), uri, driver_auth)
+
+    with _lock:
+        if key not in _async_drivers:
+            _async_drivers[key] = AsyncGraphDatabase.driver(uri, auth=driver_auth, **get_pool_settings())
+
+        return _async_drivers[key]
+
+
+@contextmanager
+def session(database_url: str, database_name: str, auth: Optional[tuple] = None, **kwargs) -> Iterator[Session]:
+    '''
+    Open a session on the shared driver of a database.
+    Sessions are cheap, they borrow connections from the pool, but they are not thread-safe:
+    open one per thread (or per unit of work) instead of sharing it.
+
+    Parameters
+    ----------
+    database_url : str
+        URL of the database.
+    database_name : str
+        Name of the database.
+    auth : Optional[tuple]
+        Authentication tuple (username, password), required when the URL has no credentials.
+    **kwargs
+        Session configuration, e.g. 'fetch_size'.
+
+    Yields
+    ------
+    Session
+        Session of the database.
+    '''
+    with get_driver(database_url, auth).session(database=database_name, **kwargs) as driver_session:
+        yield driver_session
+
+
+@asynccontextmanager
+async def async_session(database_url: str, database_name: str, auth: Optional[tuple] = None,
+                        **kwargs) -> AsyncIterator[AsyncSession]:
+    '''
+    Open an async session on the shared async driver of a database.
+    Async sessions cannot be shared between tasks, open one per task.
+
+    Parameters
+    ----------
+    database_url : str
+        URL of the database.
+    database_name : str
+        Name of the database.
+    auth : Optional[tuple]
+        Authentication tuple (username, password), required when the URL has no credentials.
+    **kwargs
+        Session configuration, e.g. 'fetch_size'.
+
+    Yields
+    ------
+    AsyncSession
+        Async session of the database.
+    '''
+    async with get_async_driver(database_url, auth).session(database=database_name, **kwargs) as driver_session:
+        yield driver_session
+
+
+def use_database(database_url: str, database_name: str) -> None:
+    '''
+    Point the neomodel connection ('neomodel.db') to the shared driver of a database.
+    Nothing is done if it already uses that driver and database, so it can be called before every query.
+    'neomodel.db' is thread-local (a 'threading.local' Database in neomodel 5.3): every thread starts without
+    a connection, so each thread that queries through neomodel (the async pipeline and parallel loader threads)
+    must call it itself. The threads share the driver and its connection pool. Calling it in one thread
+    does not set up the others.
+
+    Parameters
+    ----------
+    database_url : str
+        URL of the database.
+    database_name : str
+        Name of the database.
+    '''
+    driver = get_driver(database_url)
+
+    if db.driver is not driver or db._database_name != database_name:
+        config.DATABASE_NAME = database_name
+        db.set_connection(driver=driver)
+
+
+def close_drivers() -> None:
+    '''
+    Close the drivers of this process.
+    '''
+    with _lock:
+        for key in [key for key in _drivers if key[0] == os.getpid()]:
+            _drivers.pop(key).close()
+
+
+async def close_async_drivers() -> None:
+    '''
+    Close the async drivers of the running event loop.
+    '''
+    loop_key = (os.getpid(), id(asyncio.get_running_loop()))
+
+    with _lock:
+        drivers = [_async_drivers.pop(key) for key in list(_async_drivers) if key[:2] == loop_key]
+
+    for driver in drivers:
+        await driver.close()
+
+
+atexit.register(close_drivers)
@@ -0,0 +1,221 @@
+import sys
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Hashable, Iterator, Optional
+
+from neomodel import db
+
+from database.utils.connection_manager import use_database
+
+
+# Key property of every dimension node. Ordered from the smallest to the largest label,
+# so the hottest small labels are always warmed before the cache fills up.
+WARM_LABELS = {
+    'DocumentType': 'type',
+    'Publisher': 'name',
+    'VenueType': 'type',
+    'Venue': 'name',
+    'FieldOfStudy': 'name',
+    'Organization': 'name',
+    'Author': 'author_id',
+}
+
+# Approximate memory used by an OrderedDict entry besides its key and value.
+ENTRY_OVERHEAD = 120
+
+
+
+class EntityCache:
+    '''
+    Client-side cache of node element ids, keyed by label and key property value.
+    Used by the loaders in 'database/load_by_model.py' to avoid looking up the same nodes
+    (popular fields of study, big venues, prolific authors, ...) once per record.
+    Entries are evicted in least recently used order when the cache reaches 'max_entries' or 'max_memory_mb'.
+    Inside 'transaction', new entries are staged and only cached once the transaction is committed,
+    so a rolled back transaction never leaves the element id of a node that does not exist.
+
+    Parameters
+    ----------
+    max_entries : int
+        Maximum number of entries. Default is 2,000,000.
+    max_memory_mb : float
+        Maximum approximate memory used by the entries, in MB. Default is 512.
+    '''
+    def __init__(self, max_entries: int = 2000000, max_memory_mb: float = 512) -> None:
+        self.max_entries = max_entries
+        self.max_memory = int(max_memory_mb * 1024 * 1024)
+
+        self._entries = OrderedDict()
+        self._staged = None
+        self.memory = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    @staticmethod
+    def _entry_size(key: tuple, element_id: str) -> int:
+        return sys.getsizeof(key) + sys.getsizeof(key[0]) + sys.getsizeof(key[1]) + sys.getsizeof(element_id) + ENTRY_OVERHEAD
+
+    def is_full(self) -> bool:
+        '''
+        Check if the cache reached its entries or memory limit.
+        '''
+        return len(self._entries) >= self.max_entries or self.memory >= self.max_memory
+
+    def get(self, label: str, key: Hashable) -> Optional[str]:
+        '''
+        Get the element id of a node.
+
+        Parameters
+        ----------
+        label : str
+            Label of the node.
+        key : Hashable
+            Value of the key property of the node.
+
+        Returns
+        -------
+        Optional[str]
+            Element id of the node, or None if it is not cached.
+        '''
+        if self._staged is not None and (label, key) in self._staged:
+            self.hits += 1
+            return self._staged[(label, key)]
+
+        element_id = self._entries.get((label, key), None)
+
+        if element_id is None:
+            self.misses += 1
+            return None
+
+        self._entries.move_to_end((label, key))
+        self.hits += 1
+
+        return element_id
+
+    def put(self, label: str, key: Hashable, element_id: str) -> None:
+        '''
+        Cache the element id of a node, evicting the least recently used entries if the cache is full.
+
+        Parameters
+        ----------
+        label : str
+            Label of the node.
+        key : Hashable
+            Value of the key property of the node.
+        element_id : str
+            Element id of the node.
+        '''
+        cache_key = (label, key)
+
+        if cache_key in self._entries:
+            self._entries.move_to_end(cache_key)
+            return
+
+        if self._staged is not None:
+            self._staged[cache_key] = element_id
+            return
+
+        self._entries[cache_key] = element_id
+        self.memory += self._entry_size(cache_key, element_id)
+
+        while len(self._entries) > 1 and (len(self._entries) > self.max_entries or self.memory > self.max_memory):
+            old_key, old_element_id = self._entries.popitem(last=False)
+            self.memory -= self._entry_size(old_key, old_element_id)
+            self.evictions += 1
+
+    @contextmanager
+    def transaction(self) -> Iterator['EntityCache']:
+        '''
+        Stage the entries put during a database transaction. They are cached when the block ends without
+        an error and dropped if it raises, so open it outside the transaction, which is committed first:
+            with cache.transaction(), db.transaction:
+                ...
+        The staged entries are visible to 'get' inside the block. Nested blocks belong to the outer one.
+
+        Yields
+        ------
+        EntityCache
+            The cache.
+        '''
+        if self._staged is not None:
+            yield self
+            return
+
+        self._staged = OrderedDict()
+
+        try:
+            yield self
+        except BaseException:
+            self._staged = None
+            raise
+
+        staged, self._staged = self._staged, None
+        for (label, key), element_id in staged.items():
+            self.put(label, key, element_id)
+
+    def warm(self, database_url: str, database_name: str, labels: Optional[dict] = None) -> int:
+        '''
+        Load the element ids of the nodes already in the database, until the cache is full.
+
+        Parameters
+        ----------
+        database_url : str
+            URL of the database.
+        database_name : str
+            Name of the database.
+        labels : Optional[dict]
+            Key property of each label to load, by default 'WARM_LABELS'.
+
+        Returns
+        -------
+        int
+            Number of entries loaded.
+        '''
+        use_database(database_url, database_name)
+
+        labels = labels or WARM_LABELS
+        loaded = 0
+
+        for label, key_property in labels.items():
+            if self.is_full():
+                break
+
+            limit = self.max_entries - len(self._entries)
+            results, meta = db.cypher_query(
+                f'MATCH (n:{label}) WHERE n.{key_property} IS NOT NULL '
+                f'RETURN n.{key_property}, elementId(n) LIMIT $limit',
+                {'limit': limit}
+            )
+
+            for key, element_id in results:
+                if self.is_full():
+                    break
+
+                self.put(label, key, element_id)
+                loaded += 1
+
+        return loaded
+
+    def stats(self) -> dict:
+        '''
+        Get the cache counters.
+
+        Returns
+        -------
+        dict
+            entries, memory_mb, hits, misses, hit_rate and evictions.
+        '''
+        lookups = self.hits + self.misses
+
+        return {
+            'entries': len(self._entries),
+            'memory_mb': round(self.memory / (1024 * 1024), 2),
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': round(self.hits / lookups, 4) if lookups else 0.0,
+            'evictions': self.evictions,
+        }
@@ -0,0 +1,413 @@
+import os
+import time
+import threading
+from array import array
+from contextlib import contextmanager
+from contextvars import ContextVar
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from os.path import join, dirname
+from typing import Iterator, Optional
+
+import numpy as np
+
+from database.utils.batch_sizer import get_rss_mb
+from database.utils.checkpoints import write_json_atomic
+
+
+# Load stages. 'batch' is the whole load of a batch, 'transform' is the part of it not spent in
+# 'write' (running the statements) and 'commit'.
+STAGES = ['parse', 'transform', 'write', 'commit', 'batch']
+
+QUANTILES = [0.5, 0.95, 0.99]
+
+METRIC_PREFIX = 'citation_network_load'
+
+# Model (or connection type) of the batch being loaded, used to label the stages observed inside it.
+_current_key = ContextVar('current_key', default=None)
+
+# Collector of the running load, set by 'LoadMetrics.__enter__'.
+_active_metrics = None
+
+
+
+def get_metrics_path(database_name: str) -> str:
+    '''
+    Get the path prefix of the metrics files of a database, in the directory set by the 'METRICS_PATH'
+    environment variable (default './metrics'). '.prom' and '.json' are added to it.
+
+    Parameters
+    ----------
+    database_name : str
+        Name of the database.
+
+    Returns
+    -------
+    str
+        Path prefix of the metrics files.
+    '''
+    return join(os.environ.get('METRICS_PATH', './metrics'), database_name)
+
+
+def get_active_metrics() -> Optional['LoadMetrics']:
+    '''
+    Get the collector of the running load ('with LoadMetrics() as metrics:'), or None if the load is not instrumented.
+    '''
+    return _active_metrics
+
+
+@contextmanager
+def observe_stage(stage: str, rows: int = 0) -> Iterator[None]:
+    '''
+    Time a stage and report it to the active collector, labeled with the key of the current batch.
+    Nothing is recorded when there is no active collector.
+
+    Parameters
+    ----------
+    stage : str
+        Stage name. Options: 'STAGES'.
+    rows : int
+        Rows processed by the stage. Default is 0.
+    '''
+    metrics = _active_metrics
+    time_start = time.perf_counter()
+
+    yield
+
+    if metrics is not None:
+        metrics.observe(stage, time.perf_counter() - time_start, rows)
+
+
+
+class LoadMetrics:
+    '''
+    Throughput and latency of a load, by stage and by key (model nodes, connection type, ...).
+    Every observation is one batch or transaction. The collector keeps its duration,
+    so latency quantiles are exact, plus the rows, retries and the RSS of the process.
+
+    The loaders report to the active collector, the one of the enclosing 'with' block. A batch is wrapped in 'batch', which
+    labels the 'write' and 'commit' observations made inside it with its key and records the rest of its time
+    as 'transform'. Thread-safe, the stages of the 'async' engine are observed from the parser thread and the event loop.
+
+    Metrics are exported as a Prometheus text file ('write_prometheus', for the node exporter textfile collector),
+    from an HTTP endpoint ('serve') and as a JSON run summary ('write_json').
+
+    Parameters
+    ----------
+    path : Optional[str]
+        Path prefix of the metrics files ('get_metrics_path'). If set, the files are written every
+        'export_interval' seconds during the load and when the 'with' block exits. Default is None.
+    export_interval : float
+        Minimum seconds between two exports during the load. Default is 60.
+    '''
+    def __init__(self, path: Optional[str] = None, export_interval: float = 60) -> None:
+        self.path = path
+        self.export_interval = export_interval
+        self.time_start = time.time()
+        self.records = 0
+        self.parse_seconds = 0.0
+        self.latencies = {}
+        self.rows = {}
+        self.retries = {}
+        self.rss_mb = None
+        self.peak_rss_mb = None
+
+        self._lock = threading.Lock()
+        self._batch_stages = threading.local()
+        self._server = None
+        self._last_export = time.monotonic()
+        self._previous = None
+
+    def __enter__(self) -> 'LoadMetrics':
+        global _active_metrics
+        self._previous = _active_metrics
+        _active_metrics = self
+        return self
+
+    def __exit__(self, *args) -> None:
+        global _active_metrics
+        _active_metrics = self._previous
+        self._previous = None
+
+        if self.path is not None:
+            self.export(self.path)
+        self.close()
+
+    def _sample_rss(self) -> None:
+        self.rss_mb = get_rss_mb()
+
+        if self.rss_mb is not None:
+            self.peak_rss_mb = max(self.peak_rss_mb or 0.0, self.rss_mb)
+
+    def observe(self, stage: str, seconds: float, rows: int = 0, key: Optional[str] = None) -> None:
+        '''
+        Record one observation of a stage.
+
+        Parameters
+        ----------
+        stage : str
+            Stage name. Options: 'STAGES'.
+        seconds : float
+            Duration of the batch or transaction.
+        rows : int
+            Rows processed. Default is 0.
+        key : Optional[str]
+            Key of the observation, by default the key of the current batch.
+        '''
+        key = key or _current_key.get() or 'all'
+
+        with self._lock:
+            self.latencies.setdefault((stage, key), array('d')).append(seconds)
+            self.rows[(stage, key)] = self.rows.get((stage, key), 0) + rows
+
+        # Time of the current batch spent in the database, only observations labeled by the batch count
+        if stage in ['write', 'commit'] and getattr(self._batch_stages, 'seconds', None) is not None:
+            self._batch_stages.seconds += seconds
+
+    def add_records(self, records: int, seconds: float) -> None:
+        '''
+        Record parsed records and the time spent parsing them.
+        '''
+        with self._lock:
+            self.records += records
+            self.parse_seconds += seconds
+            self.latencies.setdefault(('parse', 'all'), array('d')).append(seconds)
+            self.rows[('parse', 'all')] = self.rows.get(('parse', 'all'), 0) + records
+
+    def add_retries(self, key: str, retries: int) -> None:
+        '''
+        Record retried transactions of a key.
+        '''
+        if retries:
+            with self._lock:
+                self.retries[key] = self.retries.get(key, 0) + retries
+
+    @contextmanager
+    def batch(self, key: str, rows: int) -> Iterator[None]:
+        '''
+        Time the load of a batch. The 'write' and 'commit' stages observed inside it are labeled with its key,
+        and the rest of its time is recorded as 'transform'.
+
+        Parameters
+        ----------
+        key : str
+            Key of the batch, e.g. the model name.
+        rows : int
+            Rows of the batch.
+        '''
+        token = _current_key.set(key)
+        self._batch_stages.seconds = 0.0
+        time_start = time.perf_counter()
+
+        try:
+            yield
+
+        finally:
+            seconds = time.perf_counter() - time_start
+            inner_seconds = self._batch_stages.seconds
+            self._batch_stages.seconds = None
+            _current_key.reset(token)
+
+        self.observe('batch', seconds, rows, key)
+        self.observe('transform', max(0.0, seconds - inner_seconds), rows, key)
+        self.maybe_export()
+
+    def maybe_export(self) -> None:
+        '''
+        Sample the RSS and write the metrics files if 'export_interval' seconds passed since the last export.
+        '''
+        with self._lock:
+            self._sample_rss()
+
+        if self.path is not None and time.monotonic() - self._last_export >= self.export_interval:
+            self._last_export = time.monotonic()
+            self.export(self.path)
+
+    def timed_records(self, records: Iterator, chunk_size: int = 1000) -> Iterator:
+        '''
+        Wrap an iterator of records, recording the time spent waiting for them as the 'parse' stage,
+        in chunks of 'chunk_size' records.
+        '''
+        count = 0
+        seconds = 0.0
+        time_start = time.perf_counter()
+
+        for record in records:
+            seconds += time.perf_counter() - time_start
+            count += 1
+
+            if count >= chunk_size:
+                self.add_records(count, seconds)
+                count = 0
+                seconds = 0.0
+
+            yield record
+            time_start = time.perf_counter()
+
+        seconds += time.perf_counter() - time_start
+        self.add_records(count, seconds)
+
+    def summary(self) -> dict:
+        '''
+        Get the run summary.
+
+        Returns
+        -------
+        dict
+            elapsed_seconds, records, records_per_second, rss_mb, peak_rss_mb, retries by key, and the stages
+            of each key with their batches, rows, seconds, rows_per_second and p50/p95/p99 latency in seconds.
+        '''
+        with self._lock:
+            self._sample_rss()
+            elapsed = time.time() - self.time_start
+            stages = {}
+
+            for (stage, key), latencies in sorted(self.latencies.items()):
+                values = np.frombuffer(latencies, dtype=np.float64) if len(latencies) else np.zeros(1)
+                seconds = float(values.sum())
+
+                stages.setdefault(key, {})[stage] = {
+                    'batches': len(latencies),
+                    'rows': self.rows[(stage, key)],
+                    'seconds': round(seconds, 3),
+                    'rows_per_second': round(self.rows[(stage, key)] / seconds, 1) if seconds else 0.0,
+                    **{f'p{int(quantile * 100)}': round(float(np.quantile(values, quantile)), 4) for quantile in QUANTILES},
+                }
+
+            return {
+                'elapsed_seconds': round(elapsed, 1),
+                'records': self.records,
+                'records_per_second': round(self.records / elapsed, 1) if elapsed else 0.0,
+                'rss_mb': round(self.rss_mb, 1) if self.rss_mb is not None else None,
+                'peak_rss_mb': round(self.peak_rss_mb, 1) if self.peak_rss_mb is not None else None,
+                'retries': dict(self.retries),
+                'stages': stages,
+            }
+
+    def prometheus_text(self) -> str:
+        '''
+        Get the metrics in the Prometheus text exposition format.
+
+        Returns
+        -------
+        str
+            Metrics text.
+        '''
+        summary = self.summary()
+        lines = []
+
+        def metric(name: str, metric_type: str, help_text: str) -> None:
+            lines.append(f'# HELP {METRIC_PREFIX}_{name} {help_text}')
+            lines.append(f'# TYPE {METRIC_PREFIX}_{name} {metric_type}')
+
+        metric('records_total', 'counter', 'Dataset records parsed.')
+        lines.append(f'{METRIC_PREFIX}_records_total {summary["records"]}')
+        metric('records_per_second', 'gauge', 'Dataset records parsed per second since the start of the load.')
+        lines.append(f'{METRIC_PREFIX}_records_per_second {summary["records_per_second"]}')
+        metric('elapsed_seconds', 'gauge', 'Seconds since the start of the load.')
+        lines.append(f'{METRIC_PREFIX}_elapsed_seconds {summary["elapsed_seconds"]}')
+
+        if summary['rss_mb'] is not None:
+            metric('rss_bytes', 'gauge', 'Resident memory of the loader process.')
+            lines.append(f'{METRIC_PREFIX}_rss_bytes {int(summary["rss_mb"] * 1024 * 1024)}')
+            metric('peak_rss_bytes', 'gauge', 'Peak resident memory of the loader process.')
+            lines.append(f'{METRIC_PREFIX}_peak_rss_bytes {int(summary["peak_rss_mb"] * 1024 * 1024)}')
+
+        metric('retries_total', 'counter', 'Retried transactions.')
+        for key, retries in summary['retries'].items():
+            lines.append(f'{METRIC_PREFIX}_retries_total{{key="{key}"}} {retries}')
+
+        metric('rows_total', 'counter', 'Rows processed by each stage.')
+        for key, stages in summary['stages'].items():
+            for stage, stats in stages.items():
+                lines.append(f'{METRIC_PREFIX}_rows_total{{stage="{stage}",key="{key}"}} {stats["rows"]}')
+
+        metric('stage_seconds', 'summary', 'Duration of the batches and transactions of each stage.')
+        for key, stages in summary['stages'].items():
+            for stage, stats in stages.items():
+                labels = f'stage="{stage}",key="{key}"'
+
+                for quantile in QUANTILES:
+                    lines.append(f'{METRIC_PREFIX}_stage_seconds{{{labels},quantile="{quantile}"}} {stats[f"p{int(quantile * 100)}"]}')
+                lines.append(f'{METRIC_PREFIX}_stage_seconds_sum{{{labels}}} {stats["seconds"]}')
+                lines.append(f'{METRIC_PREFIX}_stage_seconds_count{{{labels}}} {stats["batches"]}')
+
+        return '\n'.join(lines) + '\n'
+
+    def write_prometheus(self, path: str) -> None:
+        '''
+        Write the metrics to a Prometheus text file. The file is replaced atomically, so a scrape never reads a partial file.
+
+        Parameters
+        ----------
+        path : str
+            Path to the file, e.g. in the directory of the node exporter textfile collector.
+        '''
+        os.makedirs(dirname(path) or '.', exist_ok=True)
+        tmp_path = f'{path}.tmp'
+
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write(self.prometheus_text())
+
+        os.replace(tmp_path, path)
+
+    def write_json(self, path: str) -> None:
+        '''
+        Write the run summary to a JSON file.
+
+        Parameters
+        ----------
+        path : str
+            Path to the file.
+        '''
+        write_json_atomic(path, self.summary())
+
+    def export(self, path: str) -> None:
+        '''
+        Write the Prometheus text file ('<path>.prom') and the JSON summary ('<path>.json').
+
+        Parameters
+        ----------
+        path : str
+            Path prefix of the files, e.g. from 'get_metrics_path'.
+        '''
+        self.write_prometheus(f'{path}.prom')
+        self.write_json(f'{path}.json')
+
+    def serve(self, port: int, host: str = '') -> None:
+        '''
+        Serve the metrics in the Prometheus text format from a background thread, at any path of the port.
+        The server is stopped by 'close'.
+
+        Parameters
+        ----------
+        port : int
+            Port to listen on.
+        host : str
+            Address to listen on. Default is every address.
+        '''
+        metrics = self
+
+        class MetricsHandler(BaseHTTPRequestHandler):
+            def do_GET(self) -> None:
+                body = metrics.prometheus_text().encode('utf-8')
+
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args) -> None:
+                pass
+
+        self._server = ThreadingHTTPServer((host, port), MetricsHandler)
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+
+    def close(self) -> None:
+        '''
+        Stop the metrics server, if it was started.
+        '''
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
@@ -1,7 +1,65 @@
-from typing import Union, Optional
-from neomodel import config, db
+import gc
+import re
+import time
+from typing import Dict, Iterator, List, Union, Optional
+
+from neo4j import Query
+from neo4j.exceptions import Neo4jError
+from neomodel import db
 
 from core.enums.app_enums import AuthorApp, InstitutionApp, PaperApp
+from core.funcs import normalize_fos_name
+from database.utils.connection_manager import use_database, session
+from database.utils.schema import get_fulltext_index, get_models
+
+
+# Relationships followed by the path searches by default. RELATED_TO and OF_TYPE go through the FieldOfStudy,
+# DocumentType and VenueType hubs, where every pair of papers is two hops apart.
+PATH_RELATIONSHIP_TYPES = ['AUTHORED_BY', 'CITES', 'AFFILIATED_WITH', 'PRESENTED_AT', 'PUBLISHED_BY']
+
+# Labels of the supernodes that the path searches do not go through by default (they can still be endpoints).
+SUPERNODE_LABELS = ['FieldOfStudy', 'DocumentType', 'VenueType']
+
+PATH_DIRECTIONS = {'both': ('-', '-'), 'outgoing': ('-', '->'), 'incoming': ('<-', '-')}
+
+# Characters of the Lucene query syntax, escaped in the search text.
+LUCENE_SPECIAL_CHARACTERS = re.compile(r'([+\-&|!(){}\[\]^"~*?:\\/])')
+
+# Endpoints and node predicates of the path searches. The predicates are on every node of the path,
+# so they are checked while the search expands.
+PATH_ENDPOINTS = '''
+    MATCH (a) WHERE elementId(a) IN $source_ids
+    MATCH (b) WHERE elementId(b) IN $target_ids AND b <> a
+    '''
+
+PATH_NODE_FILTER = '''
+    all(n IN nodes(p) WHERE n = a OR n = b OR (
+        none(label IN labels(n) WHERE label IN $excluded_labels)
+        AND ($max_degree IS NULL OR COUNT { (n)--() } <= $max_degree)))
+    '''
+
+# Only simple paths, the same node is not visited twice. Checked in the query, so it is applied before LIMIT.
+PATH_SIMPLE_FILTER = '''
+    all(i IN range(0, size(nodes(p)) - 2) WHERE NOT nodes(p)[i] IN nodes(p)[i + 1..])
+    '''
+
+# Unique property of each label, the order of the keyset pagination of 'iter_nodes_by_name'.
+KEYSET_PROPERTIES = {
+    'Paper': 'paper_id',
+    'Author': 'author_id',
+    'Organization': 'name',
+    'Publisher': 'name',
+    'Venue': 'venue_id',
+    'FieldOfStudy': 'name',
+}
+
+CYPHER_NAME = re.compile(r'[A-Za-z_][A-Za-z0-9_]*')
+
+# Seconds the graph statistics are reused before they are queried again.
+STATS_TTL = 10.0
+
+# Graph statistics by (database_url, database_name): (time of the query, statistics).
+_stats_cache = {}
 
 
 def count_nodes(database_url: str, database_name: str,
@@ -25,8 +83,7 @@ def count_nodes(database_url: str, database_name: str,
     results[0][0] : int
         Number of nodes with the specified label in the database.
     '''
-    config.DATABASE_URL = database_url
-    config.DATABASE_NAME = database_name
+    use_database(database_url, database_name)
 
     if label:
         query = f"MATCH (n:{label.value}) RETURN count(n)"
@@ -63,8 +120,7 @@ def count_relationships(database_url: str, database_name: str,
     results[0][0] : int
         Number of relationships with the specified label in the database.
     '''
-    config.DATABASE_URL = database_url
-    config.DATABASE_NAME = database_name
+    use_database(database_url, database_name)
 
     if node_a and node_b:
         query = f"MATCH (n:{node_a.value})-[r]->(m:{node_b.value}) RETURN count(r)"
@@ -80,12 +136,246 @@ def count_relationships(database_url: str, database_name: str,
     return results[0][0]
 
 
+def stats_counts() -> List[tuple]:
+    '''
+    Get the counts of the graph statistics, from the labels and relationships of the neomodel models.
+    Every count is answered by the count store of the database: the nodes of a label, the relationships of a type,
+    and the relationships of a type that start at a label (e.g. OF_TYPE of Paper and of Venue).
+
+    Returns
+    -------
+    List[tuple]
+        (kind, label, relationship type, pattern) of each count, kind is 'nodes', 'relationships', 'label',
+        'type' or 'label_type'.
+    '''
+    counts = [('nodes', None, None, '(n)'), ('relationships', None, None, '()-[n]->()')]
+    labels = []
+    types = []
+
+    for model in get_models():
+        labels.append(model.__label__)
+
+        for rel in model.defined_properties(aliases=False, properties=False).values():
+            # Relationships declared from the other end (RelationshipFrom) are already declared by the start model
+            if rel.definition['direction'] == 1:
+                types.append((model.__label__, rel.definition['relation_type']))
+
+    counts += [('label', label, None, f'(n:{label})') for label in dict.fromkeys(labels)]
+    counts += [('type', None, rel_type, f'()-[n:{rel_type}]->()') for rel_type in dict.fromkeys(t for l, t in types)]
+    counts += [('label_type', label, rel_type, f'(:{label})-[n:{rel_type}]->()') for label, rel_type in dict.fromkeys(types)]
+
+    return counts
+
+
+def get_graph_stats(database_url: str, database_name: str, ttl: float = STATS_TTL, refresh: bool = False) -> dict:
+    '''
+    Get the number of nodes and relationships of the database, per label and per relationship type,
+    in a single query. The counts are branches of a UNION ALL that the database answers from its count store,
+    so the query takes the same time for an empty database and for the full dataset, unlike 'count_relationships'
+    with two labels, which expands every relationship.
+    The statistics are cached for 'ttl' seconds, so the CLI and dashboards can poll them.
+
+    Parameters
+    ----------
+    database_url : str
+        URL of the database.
+    database_name : str
+        Name of the database.
+    ttl : float
+        Seconds a cached result is reused. Default is 'STATS_TTL'.
+    refresh : bool
+        Query the database even if the cached result is recent, e.g. after a load. Default is False.
+
+    Returns
+    -------
+    dict
+        - nodes : int, total nodes.
+        - relationships : int, total relationships.
+        - labels : Dict[str, int], nodes of each label of the models.
+        - relationship_types : Dict[str, int], relationships of each type.
+        - outgoing : Dict[str, Dict[str, int]], relationships of each type by start label.
+        - time : float, time of the query.
+    '''
+    key = (database_url, database_name)
+    cached = _stats_cache.get(key, None)
+
+    if cached is not None and not refresh and time.time() - cached[0] < ttl:
+        return cached[1]
+
+    counts = stats_counts()
+    query = '\nUNION ALL\n'.join(
+        f"MATCH {pattern} RETURN '{kind}' AS kind, {repr(label) if label else 'null'} AS label, "
+        f"{repr(rel_type) if rel_type else 'null'} AS type, count(n) AS count"
+        for kind, label, rel_type, pattern in counts
+    )
+
+    use_database(database_url, database_name)
+
+    results, meta = db.cypher_query(query)
+
+    stats = {'nodes': 0, 'relationships': 0, 'labels': {}, 'relationship_types': {}, 'outgoing': {}}
+    for kind, label, rel_type, pattern in counts:
+        if kind == 'label':
+            stats['labels'][label] = 0
+        elif kind == 'type':
+            stats['relationship_types'][rel_type] = 0
+        elif kind == 'label_type':
+            stats['outgoing'].setdefault(label, {})[rel_type] = 0
+
+    for kind, label, rel_type, count in results:
+        if kind in ['nodes', 'relationships']:
+            stats[kind] = count
+        elif kind == 'label':
+            stats['labels'][label] = count
+        elif kind == 'type':
+            stats['relationship_types'][rel_type] = count
+        else:
+            stats['outgoing'][label][rel_type] = count
+
+    stats['time'] = time.time()
+    _stats_cache[key] = (stats['time'], stats)
+
+    return stats
+
+
+def count_model_nodes(database_url: str, database_name: str,
+                      models: List[Union[AuthorApp, InstitutionApp, PaperApp]], refresh: bool = True) -> Dict[Union[AuthorApp, InstitutionApp, PaperApp], int]:
+    '''
+    Count the nodes of several models with a single query ('get_graph_stats').
+
+    Parameters
+    ----------
+    database_url : str
+        URL of the database.
+    database_name : str
+        Name of the database.
+    models : List[Union[AuthorApp, InstitutionApp, PaperApp]]
+        Models to count.
+    refresh : bool
+        Query the database even if the cached statistics are recent. Default is True.
+
+    Returns
+    -------
+    Dict[Union[AuthorApp, InstitutionApp, PaperApp], int]
+        Number of nodes of each model.
+    '''
+    labels = get_graph_stats(database_url, database_name, refresh=refresh)['labels']
+
+    return {model: labels.get(model.value, 0) for model in models}
+
+
+def fulltext_query(text: str, prefix: bool = True) -> str:
+    '''
+    Build the Lucene query of a search text: the special characters are escaped and every word is required.
+
+    Parameters
+    ----------
+    text : str
+        Search text, e.g. 'geoffrey hint'.
+    prefix : bool
+        Also match the words that start with each word of the text (exact words score higher). Default is True.
+
+    Returns
+    -------
+    str
+        Lucene query, e.g. '+(geoffrey geoffrey*) +(hint hint*)'.
+    '''
+    terms = [LUCENE_SPECIAL_CHARACTERS.sub(r'\\\1', term.lower()) for term in text.split()]
+
+    if prefix:
+        return ' '.join(f'+({term} {term}*)' for term in terms)
+
+    return ' '.join(f'+{term}' for term in terms)
+
+
+def search_nodes(database_url: str, database_name: str,
+                 label: Union[AuthorApp.AUTHOR, PaperApp.PAPER, PaperApp.FIELD_OF_STUDY,
+                              InstitutionApp.ORGANIZATION, InstitutionApp.VENUE],
+                 text: str, limit: int = 25, cursor: Optional[dict] = None, fetch_size: int = 1000,
+                 prefix: bool = True) -> dict:
+    '''
+    Search nodes by name (title for papers) with the full-text index of their label, best matches first.
+    The query is parameterized, so its plan is cached and the text cannot change the query.
+    Pages are read with a cursor (the score and element id of the last result of the previous page),
+    so a page does not count the results of the previous ones like SKIP does.
+    The full-text indexes are created with 'database/utils/schema.py'.
+
+    Parameters
+    ----------
+    database_url : str
+        URL of the database.
+    database_name : str
+        Name of the database.
+    label : Union[AuthorApp.AUTHOR, PaperApp.PAPER, PaperApp.FIELD_OF_STUDY, InstitutionApp.ORGANIZATION, InstitutionApp.VENUE]
+        Label of the nodes to be searched.
+    text : str
+        Search text, see 'fulltext_query'. The words of field of study names can be separated by spaces or underscores.
+    limit : int
+        Results per page. Default is 25.
+    cursor : Optional[dict]
+        Cursor returned with the previous page, by default None (first page).
+    fetch_size : int
+        Records fetched from the server at a time. Default is 1000.
+    prefix : bool
+        Also match the words that start with the words of the text. Default is True.
+
+    Returns
+    -------
+    dict
+        results : list
+            One dict per node: element_id, properties and score.
+        cursor : Optional[dict]
+            Cursor of the next page, None if this is the last page.
+
+    Raises
+    ------
+    ValueError
+        If the label has no full-text index.
+    '''
+    index_name, prop = get_fulltext_index(label.value)
+
+    if label == PaperApp.FIELD_OF_STUDY:
+        text = text.replace('_', ' ')
+
+    query = '''
+        CALL db.index.fulltext.queryNodes($index_name, $search) YIELD node, score
+        WITH node, score, elementId(node) AS element_id
+        WHERE $after_score IS NULL
+           OR score < $after_score
+           OR (score = $after_score AND element_id > $after_element_id)
+        RETURN element_id, properties(node) AS properties, score
+        ORDER BY score DESC, element_id
+        LIMIT $limit
+        '''
+    parameters = {
+        'index_name': index_name,
+        'search': fulltext_query(text, prefix),
+        'after_score': cursor['score'] if cursor else None,
+        'after_element_id': cursor['element_id'] if cursor else None,
+        'limit': limit,
+    }
+
+    if not parameters['search']:
+        return {'results': [], 'cursor': None}
+
+    with session(database_url, database_name, fetch_size=fetch_size) as driver_session:
+        results = [record.data() for record in driver_session.run(query, parameters)]
+
+    next_cursor = None
+    if len(results) == limit:
+        next_cursor = {'score': results[-1]['score'], 'element_id': results[-1]['element_id']}
+
+    return {'results': results, 'cursor': next_cursor}
+
+
 def search_node_by_name(database_url: str, database_name: str,
                         label: Union[AuthorApp.AUTHOR, PaperApp.PAPER, PaperApp.FIELD_OF_STUDY,
                                      InstitutionApp.ORGANIZATION, InstitutionApp.PUBLISHER, InstitutionApp.VENUE],
-                        name: str) -> dict:
+                        name: str, limit: int = 100) -> list:
     '''
     Search for nodes with the specified name in the database.
+    Labels with a full-text index are searched with 'search_nodes', the others (Publisher) with
+    a parameterized CONTAINS.
     Using the neomodel library.
 
     Parameters
@@ -98,31 +388,274 @@ def search_node_by_name(database_url: str, database_name: str,
         Label of the node to be searched.
     name : str
         Name of the node to be searched.
+    limit : int
+        Maximum number of nodes. Default is 100.
 
     Returns
     -------
     results
-        Nodes with the specified name in the database.
+        Nodes with the specified name in the database, best matches first.
     '''
-    config.DATABASE_URL = database_url
-    config.DATABASE_NAME = database_name
+    use_database(database_url, database_name)
 
-    query = f"MATCH (n:{label.value}) WHERE n.name CONTAINS '{name}' RETURN n"
+    try:
+        index_name, prop = get_fulltext_index(label.value)
+    except ValueError:
+        index_name = None
 
-    results, meta = db.cypher_query(query)
+    if index_name:
+        if label == PaperApp.FIELD_OF_STUDY:
+            name = name.replace('_', ' ')
+
+        query = "CALL db.index.fulltext.queryNodes($index_name, $search) YIELD node RETURN node AS n LIMIT $limit"
+        parameters = {'index_name': index_name, 'search': fulltext_query(name), 'limit': limit}
+    else:
+        query = f"MATCH (n:{label.value}) WHERE n.name CONTAINS $name RETURN n LIMIT $limit"
+        parameters = {'name': name, 'limit': limit}
+
+    results, meta = db.cypher_query(query, parameters)
 
     return results
 
 
+def resolve_nodes(database_url: str, database_name: str,
+                  label: Union[AuthorApp.AUTHOR, PaperApp.PAPER, PaperApp.FIELD_OF_STUDY,
+                               InstitutionApp.ORGANIZATION, InstitutionApp.PUBLISHER, InstitutionApp.VENUE],
+                  name: str, limit: int = 5) -> List[str]:
+    '''
+    Find the nodes of a name (title for papers) through the indexes: nodes with the exact name first
+    (range index or uniqueness constraint), and if there are none, the best matches of the full-text index.
+
+    Parameters
+    ----------
+    database_url : str
+        URL of the database.
+    database_name : str
+        Name of the database.
+    label : Union[AuthorApp.AUTHOR, PaperApp.PAPER, PaperApp.FIELD_OF_STUDY, InstitutionApp.ORGANIZATION, InstitutionApp.PUBLISHER, InstitutionApp.VENUE]
+        Label of the nodes.
+    name : str
+        Name of the nodes.
+    limit : int
+        Maximum number of nodes. Default is 5.
+
+    Returns
+    -------
+    List[str]
+        Element ids of the nodes, empty if there is no match.
+    '''
+    use_database(database_url, database_name)
+
+    prop = 'title' if label == PaperApp.PAPER else 'name'
+    if label == PaperApp.FIELD_OF_STUDY:
+        name = normalize_fos_name(name)
+
+    results, meta = db.cypher_query(f"MATCH (n:{label.value}) WHERE n.{prop} = $name RETURN elementId(n) LIMIT $limit",
+                                    {'name': name, 'limit': limit})
+
+    if not results and label != InstitutionApp.PUBLISHER:
+        results = [[result['element_id']] for result in search_nodes(database_url, database_name, label, name, limit)['results']]
+
+    return [result[0] for result in results]
+
+
+def path_data(path) -> dict:
+    '''
+    Convert a path returned by the driver to a dictionary.
+    '''
+    return {
+        'length': len(path.relationships),
+        'nodes': [{'element_id': node.element_id, 'labels': sorted(node.labels), 'properties': dict(node)}
+                  for node in path.nodes],
+        'relationships': [{'type': rel.type, 'start': rel.start_node.element_id, 'end': rel.end_node.element_id}
+                          for rel in path.relationships],
+    }
+
+
+def path_query_parts(source_ids: List[str], target_ids: List[str], relationship_types: Optional[List[str]] = None,
+                     direction: str = 'both', excluded_labels: Optional[List[str]] = None,
+                     max_degree: Optional[int] = None) -> tuple:
+    '''
+    Validate the options of a path search and build the parts of its queries.
+
+    Returns
+    -------
+    tuple
+        Left and right ends of the relationship pattern, relationship types ('A|B') and query parameters.
+
+    Raises
+    ------
+    ValueError
+        If the direction or a relationship type is invalid.
+    '''
+    if direction not in PATH_DIRECTIONS:
+        raise ValueError(f'Invalid direction: {direction}. Options: {", ".join(PATH_DIRECTIONS)}.')
+
+    relationship_types = relationship_types or PATH_RELATIONSHIP_TYPES
+    for rel_type in relationship_types:
+        if not CYPHER_NAME.fullmatch(rel_type):
+            raise ValueError(f'Invalid relationship type: {rel_type}')
+
+    left, right = PATH_DIRECTIONS[direction]
+    parameters = {
+        'source_ids': source_ids,
+        'target_ids': target_ids,
+        'excluded_labels': SUPERNODE_LABELS if excluded_labels is None else excluded_labels,
+        'max_degree': max_degree,
+    }
+
+    return left, right, '|'.join(relationship_types), parameters
+
+
+def find_paths(database_url: str, database_name: str, source_ids: List[str], target_ids: List[str],
+               max_depth: int = 6, relationship_types: Optional[List[str]] = None, direction: str = 'both',
+               excluded_labels: Optional[List[str]] = None, max_degree: Optional[int] = None,
+               mode: str = 'shortest', k: int = 10, time_budget: float = 5.0, fetch_size: int = 1000) -> dict:
+    '''
+    Find paths between two sets of nodes with a bounded search.
+        - 'shortest': one shortest path. The endpoints are bound, so Neo4j runs a bidirectional
+          breadth-first search from both sides at once.
+        - 'all_shortest': every path of the shortest length.
+        - 'top_k': the 'k' shortest paths, as many as fit in the time budget. The paths of each length are listed
+          from the shortest length up to 'max_depth'.
+    Only the relationship types in 'relationship_types' are followed, and the search does not go through
+    nodes with an excluded label or with more than 'max_degree' relationships. The endpoints are not checked.
+    Every query runs with the time left in 'time_budget' as its transaction timeout. When it runs out,
+    the paths found so far are returned.
+
+    Parameters
+    ----------
+    database_url : str
+        URL of the database.
+    database_name : str
+        Name of the database.
+    source_ids : List[str]
+        Element ids of the start nodes, e.g. from 'resolve_nodes'.
+    target_ids : List[str]
+        Element ids of the end nodes.
+    max_depth : int
+        Maximum number of relationships of a path. Default is 6.
+    relationship_types : Optional[List[str]]
+        Relationship types followed, by default 'PATH_RELATIONSHIP_TYPES'.
+    direction : str - Options: 'both', 'outgoing', 'incoming'
+        Direction of the relationships from the start to the end nodes. Default is 'both'.
+    excluded_labels : Optional[List[str]]
+        Labels of the nodes the paths do not go through, by default 'SUPERNODE_LABELS'.
+    max_degree : Optional[int]
+        Maximum number of relationships of the nodes the paths go through, by default None (no limit).
+    mode : str - Options: 'shortest', 'all_shortest', 'top_k'
+        Paths returned. Default is 'shortest'.
+    k : int
+        Maximum number of paths of 'top_k'. Default is 10.
+    time_budget : float
+        Seconds for the whole search. Default is 5.
+    fetch_size : int
+        Records fetched from the server at a time. Default is 1000.
+
+    Returns
+    -------
+    dict
+        paths : list
+            Paths, shortest first, each with: length, nodes (element_id, labels, properties) and
+            relationships (type, start and end element ids).
+        complete : bool
+            False if the time budget ran out before the search finished.
+        elapsed : float
+            Seconds spent.
+
+    Raises
+    ------
+    ValueError
+        If the direction, the mode or a relationship type is invalid.
+    '''
+    if mode not in ['shortest', 'all_shortest', 'top_k']:
+        raise ValueError(f'Invalid mode: {mode}. Options: \'shortest\', \'all_shortest\', \'top_k\'.')
+
+    left, right, types, parameters = path_query_parts(source_ids, target_ids, relationship_types, direction,
+                                                      excluded_labels, max_degree)
+
+    time_start = time.time()
+    paths = []
+    complete = True
+
+    def run(query: str, extra: Optional[dict] = None) -> list:
+        remaining = time_budget - (time.time() - time_start)
+        if remaining <= 0:
+            raise TimeoutError
+
+        with session(database_url, database_name, fetch_size=fetch_size) as driver_session:
+            try:
+                return [record['p'] for record in driver_session.run(Query(query, timeout=remaining),
+                                                                      {**parameters, **(extra or {})})]
+            except Neo4jError as e:
+                if 'TransactionTimedOut' in (e.code or ''):
+                    raise TimeoutError from e
+                raise
+
+    try:
+        if not (source_ids and target_ids):
+            paths = []
+
+        elif mode in ['shortest', 'all_shortest']:
+            function = 'shortestPath' if mode == 'shortest' else 'allShortestPaths'
+            found = run(f'''
+                {PATH_ENDPOINTS}
+                MATCH p = {function}((a){left}[:{types}*..{int(max_depth)}]{right}(b))
+                WHERE {PATH_NODE_FILTER}
+                RETURN p
+                ''')
+            found.sort(key=lambda path: len(path.relationships))
+
+            if found:
+                shortest = len(found[0].relationships)
+                found = [path for path in found if len(path.relationships) == shortest]
+
+            paths = found[:1] if mode == 'shortest' else found
+
+        else:
+            shortest = run(f'''
+                {PATH_ENDPOINTS}
+                MATCH p = shortestPath((a){left}[:{types}*..{int(max_depth)}]{right}(b))
+                WHERE {PATH_NODE_FILTER}
+                RETURN p
+                ''')
+            seen = set()
+
+            for depth in range(min([len(path.relationships) for path in shortest], default=max_depth + 1), max_depth + 1):
+                for path in run(f'''
+                        {PATH_ENDPOINTS}
+                        MATCH p = (a){left}[:{types}*{depth}]{right}(b)
+                        WHERE {PATH_NODE_FILTER} AND {PATH_SIMPLE_FILTER}
+                        RETURN p
+                        LIMIT $limit
+                        ''', {'limit': k - len(paths)}):
+                    key = tuple(rel.element_id for rel in path.relationships)
+
+                    if key not in seen:
+                        seen.add(key)
+                        paths.append(path)
+
+                if len(paths) >= k:
+                    break
+
+    except TimeoutError:
+        complete = False
+
+    gc.collect()
+
+    return {'paths': [path_data(path) for path in paths[:k]], 'complete': complete, 'elapsed': time.time() - time_start}
+
+
 def search_path(database_url: str, database_name: str,
-                node_a: Union[AuthorApp.AUTHOR, PaperApp.PAPER, InstitutionApp.ORGANIZATION,
+                node_a: Union[AuthorApp.AUTHOR, PaperApp.PAPER, PaperApp.FIELD_OF_STUDY, InstitutionApp.ORGANIZATION,
                               InstitutionApp.PUBLISHER, InstitutionApp.VENUE],
-                node_b: Union[AuthorApp.AUTHOR, PaperApp.PAPER, InstitutionApp.ORGANIZATION,
+                node_b: Union[AuthorApp.AUTHOR, PaperApp.PAPER, PaperApp.FIELD_OF_STUDY, InstitutionApp.ORGANIZATION,
                               InstitutionApp.PUBLISHER, InstitutionApp.VENUE],
-                name_a: str, name_b: str) -> dict:
+                name_a: str, name_b: str, candidates: int = 5, **kwargs) -> dict:
     '''
-    Search for a path between two nodes with the specified names in the database.
-    Using the neomodel library.
+    Search for a path between two nodes with the specified names (titles for papers) in the database.
+    The endpoints are resolved through the indexes ('resolve_nodes'), then the paths between them are
+    searched with 'find_paths'.
 
     Parameters
     ----------
@@ -130,25 +663,326 @@ def search_path(database_url: str, database_name: str,
         URL of the database.
     database_name : str
         Name of the database.
-    node_a : Union[AuthorApp.AUTHOR, PaperApp.PAPER, InstitutionApp.ORGANIZATION, InstitutionApp.PUBLISHER, InstitutionApp.VENUE]
+    node_a : Union[AuthorApp.AUTHOR, PaperApp.PAPER, PaperApp.FIELD_OF_STUDY, InstitutionApp.ORGANIZATION, InstitutionApp.PUBLISHER, InstitutionApp.VENUE]
         Label of the first node in the path.
-    node_b : Union[AuthorApp.AUTHOR, PaperApp.PAPER, InstitutionApp.ORGANIZATION, InstitutionApp.PUBLISHER, InstitutionApp.VENUE]
+    node_b : Union[AuthorApp.AUTHOR, PaperApp.PAPER, PaperApp.FIELD_OF_STUDY, InstitutionApp.ORGANIZATION, InstitutionApp.PUBLISHER, InstitutionApp.VENUE]
         Label of the second node in the path.
     name_a : str
         Name of the first node in the path.
     name_b : str
         Name of the second node in the path.
+    candidates : int
+        Maximum nodes of each name. Default is 5.
+    **kwargs
+        Options of 'find_paths', e.g. max_depth, relationship_types, mode, time_budget.
 
     Returns
     -------
-    results
-        Path between the two nodes with the specified names in the database.
+    dict
+        Paths between the two nodes, see 'find_paths'.
     '''
-    config.DATABASE_URL = database_url
-    config.DATABASE_NAME = database_name
+    source_ids = resolve_nodes(database_url, database_name, node_a, name_a, candidates)
+    target_ids = resolve_nodes(database_url, database_name, node_b, name_b, candidates)
 
-    query = f"MATCH p = shortestPath((n:{node_a.value})-[*]-(m:{node_b.value})) WHERE n.name CONTAINS '{name_a}' AND m.name CONTAINS '{name_b}' RETURN p"
+    return find_paths(database_url, database_name, source_ids, target_ids, **kwargs)
 
-    results, meta = db.cypher_query(query)
 
-    return results
+def projection(variable: str, fields: Optional[List[str]] = None) -> str:
+    '''
+    Build the Cypher map projection of some properties of a node, e.g. 'n {.name, .title}'.
+
+    Parameters
+    ----------
+    variable : str
+        Variable of the node in the query.
+    fields : Optional[List[str]]
+        Properties returned, by default None (every property).
+
+    Returns
+    -------
+    str
+        Projection of the node.
+
+    Raises
+    ------
+    ValueError
+        If a field is not a valid property name.
+    '''
+    if fields is None:
+        return f'properties({variable})'
+
+    for field in fields:
+        if not CYPHER_NAME.fullmatch(field):
+            raise ValueError(f'Invalid field: {field}')
+
+    return f'{variable} {{{", ".join(f".{field}" for field in fields)}}}'
+
+
+def iter_search_nodes(database_url: str, database_name: str,
+                      label: Union[AuthorApp.AUTHOR, PaperApp.PAPER, PaperApp.FIELD_OF_STUDY,
+                                   InstitutionApp.ORGANIZATION, InstitutionApp.VENUE],
+                      text: str, fields: Optional[List[str]] = None, fetch_size: int = 1000,
+                      prefix: bool = True, cursor: Optional[dict] = None) -> Iterator[dict]:
+    '''
+    Stream every match of a full-text search, best matches first. Generator version of 'search_nodes'.
+    The matches are read with a single query: the index is searched and sorted once, and the driver pulls
+    'fetch_size' records at a time, with only the projected fields. Memory does not grow with the number of
+    matches, and stopping the iteration stops the reads. The (score, element id) cursor of 'search_nodes'
+    is only used to resume after the last match read.
+
+    Parameters
+    ----------
+    database_url : str
+        URL of the database.
+    database_name : str
+        Name of the database.
+    label : Union[AuthorApp.AUTHOR, PaperApp.PAPER, PaperApp.FIELD_OF_STUDY, InstitutionApp.ORGANIZATION, InstitutionApp.VENUE]
+        Label of the nodes to be searched.
+    text : str
+        Search text, see 'fulltext_query'.
+    fields : Optional[List[str]]
+        Properties returned, by default None (every property).
+    fetch_size : int
+        Records fetched from the server at a time. Default is 1000.
+    prefix : bool
+        Also match the words that start with the words of the text. Default is True.
+    cursor : Optional[dict]
+        Resume after a match: {'score': ..., 'element_id': ...} of the last match read. Default is None.
+
+    Yields
+    ------
+    dict
+        element_id, score and properties of each match.
+
+    Raises
+    ------
+    ValueError
+        If the label has no full-text index or a field is invalid.
+    '''
+    index_name, prop = get_fulltext_index(label.value)
+
+    if label == PaperApp.FIELD_OF_STUDY:
+        text = text.replace('_', ' ')
+
+    search = fulltext_query(text, prefix)
+    if not search:
+        return
+
+    query = f'''
+        CALL db.index.fulltext.queryNodes($index_name, $search) YIELD node, score
+        WITH node, score, elementId(node) AS element_id
+        WHERE $after_score IS NULL
+           OR score < $after_score
+           OR (score = $after_score AND element_id > $after_element_id)
+        RETURN element_id, score, {projection('node', fields)} AS properties
+        ORDER BY score DESC, element_id
+        '''
+    parameters = {
+        'index_name': index_name,
+        'search': search,
+        'after_score': cursor['score'] if cursor else None,
+        'after_element_id': cursor['element_id'] if cursor else None,
+    }
+
+    with session(database_url, database_name, fetch_size=fetch_size) as driver_session:
+        for record in driver_session.run(query, parameters):
+            yield record.data()
+
+
+def iter_nodes_by_name(database_url: str, database_name: str,
+                       label: Union[AuthorApp.AUTHOR, PaperApp.PAPER, PaperApp.FIELD_OF_STUDY,
+                                    InstitutionApp.ORGANIZATION, InstitutionApp.PUBLISHER, InstitutionApp.VENUE],
+                       name: str, fields: Optional[List[str]] = None, page_size: int = 10000, fetch_size: int = 1000,
+                       after=None) -> Iterator[dict]:
+    '''
+    Stream the nodes whose name (title for papers) contains a text, with keyset pagination.
+    The pages are ordered by the unique property of the label ('KEYSET_PROPERTIES'). Each page continues
+    from the last key with a range seek on the index of the constraint, instead of skipping the previous
+    pages. Within a page the driver pulls 'fetch_size' records at a time. Only the projected fields are returned.
+
+    Parameters
+    ----------
+    database_url : str
+        URL of the database.
+    database_name : str
+        Name of the database.
+    label : Union[AuthorApp.AUTHOR, PaperApp.PAPER, PaperApp.FIELD_OF_STUDY, InstitutionApp.ORGANIZATION, InstitutionApp.PUBLISHER, InstitutionApp.VENUE]
+        Label of the nodes to be searched.
+    name : str
+        Text contained in the name (case-sensitive, like CONTAINS).
+    fields : Optional[List[str]]
+        Properties returned, by default None (every property).
+    page_size : int
+        Nodes per query. Default is 10000.
+    fetch_size : int
+        Records fetched from the server at a time. Default is 1000.
+    after : optional
+        Resume after a key, the 'key' of the last node read. Default is None.
+
+    Yields
+    ------
+    dict
+        key, element_id and properties of each node.
+
+    Raises
+    ------
+    ValueError
+        If the label has no unique property or a field is invalid.
+    '''
+    if label.value not in KEYSET_PROPERTIES:
+        raise ValueError(f'No keyset property for label: {label.value}')
+
+    key = KEYSET_PROPERTIES[label.value]
+    name_property = 'title' if label == PaperApp.PAPER else 'name'
+
+    def query(first: bool) -> str:
+        return f'''
+            MATCH (n:{label.value})
+            WHERE {'n.' + key + ' IS NOT NULL' if first else 'n.' + key + ' > $after'} AND n.{name_property} CONTAINS $name
+            RETURN n.{key} AS key, elementId(n) AS element_id, {projection('n', fields)} AS properties
+            ORDER BY n.{key}
+            LIMIT $limit
+            '''
+
+    while True:
+        rows = 0
+
+        with session(database_url, database_name, fetch_size=fetch_size) as driver_session:
+            for record in driver_session.run(query(after is None), {'after': after, 'name': name, 'limit': page_size}):
+                rows += 1
+                after = record['key']
+                yield record.data()
+
+        if rows < page_size:
+            return
+
+
+def iter_search_node_by_name(database_url: str, database_name: str,
+                             label: Union[AuthorApp.AUTHOR, PaperApp.PAPER, PaperApp.FIELD_OF_STUDY,
+                                          InstitutionApp.ORGANIZATION, InstitutionApp.PUBLISHER, InstitutionApp.VENUE],
+                             name: str, fields: Optional[List[str]] = None, page_size: int = 1000,
+                             fetch_size: int = 1000) -> Iterator[dict]:
+    '''
+    Stream the nodes with the specified name. Generator version of 'search_node_by_name', with projected
+    fields instead of inflated nodes. Labels with a full-text index are searched with 'iter_search_nodes'
+    (best matches first). The others (Publisher) are searched with 'iter_nodes_by_name'.
+
+    Parameters
+    ----------
+    database_url : str
+        URL of the database.
+    database_name : str
+        Name of the database.
+    label : Union[AuthorApp.AUTHOR, PaperApp.PAPER, PaperApp.FIELD_OF_STUDY, InstitutionApp.ORGANIZATION, InstitutionApp.PUBLISHER, InstitutionApp.VENUE]
+        Label of the nodes to be searched.
+    name : str
+        Name of the nodes to be searched.
+    fields : Optional[List[str]]
+        Properties returned, by default None (every property).
+    page_size : int
+        Nodes per query of 'iter_nodes_by_name'. The full-text searches are read with one query. Default is 1000.
+    fetch_size : int
+        Records fetched from the server at a time. Default is 1000.
+
+    Yields
+    ------
+    dict
+        element_id and properties of each node, with the score or the key of its pagination.
+    '''
+    try:
+        get_fulltext_index(label.value)
+    except ValueError:
+        yield from iter_nodes_by_name(database_url, database_name, label, name, fields, page_size, fetch_size)
+        return
+
+    yield from iter_search_nodes(database_url, database_name, label, name, fields, fetch_size=fetch_size)
+
+
+def iter_search_path(database_url: str, database_name: str,
+                     node_a: Union[AuthorApp.AUTHOR, PaperApp.PAPER, PaperApp.FIELD_OF_STUDY, InstitutionApp.ORGANIZATION,
+                                   InstitutionApp.PUBLISHER, InstitutionApp.VENUE],
+                     node_b: Union[AuthorApp.AUTHOR, PaperApp.PAPER, PaperApp.FIELD_OF_STUDY, InstitutionApp.ORGANIZATION,
+                                   InstitutionApp.PUBLISHER, InstitutionApp.VENUE],
+                     name_a: str, name_b: str, candidates: int = 5, fields: Optional[List[str]] = None,
+                     max_depth: int = 6, relationship_types: Optional[List[str]] = None, direction: str = 'both',
+                     excluded_labels: Optional[List[str]] = None, max_degree: Optional[int] = None,
+                     fetch_size: int = 100, timeout: Optional[float] = None) -> Iterator[dict]:
+    '''
+    Stream the simple paths between two nodes with the specified names. Generator version of 'search_path'.
+    Paths are read one length at a time, from the shortest length up to 'max_depth'. The driver pulls
+    'fetch_size' paths at a time, and the nodes only hold the projected fields. The caller decides how many paths
+    to read: stopping the iteration stops the query.
+
+    Parameters
+    ----------
+    database_url : str
+        URL of the database.
+    database_name : str
+        Name of the database.
+    node_a : Union[AuthorApp.AUTHOR, PaperApp.PAPER, PaperApp.FIELD_OF_STUDY, InstitutionApp.ORGANIZATION, InstitutionApp.PUBLISHER, InstitutionApp.VENUE]
+        Label of the first node in the path.
+    node_b : Union[AuthorApp.AUTHOR, PaperApp.PAPER, PaperApp.FIELD_OF_STUDY, InstitutionApp.ORGANIZATION, InstitutionApp.PUBLISHER, InstitutionApp.VENUE]
+        Label of the second node in the path.
+    name_a : str
+        Name of the first node in the path.
+    name_b : str
+        Name of the second node in the path.
+    candidates : int
+        Maximum nodes of each name. Default is 5.
+    fields : Optional[List[str]]
+        Properties of the nodes returned, by default None (every property).
+    max_depth : int
+        Maximum number of relationships of a path. Default is 6.
+    relationship_types : Optional[List[str]]
+        Relationship types followed, by default 'PATH_RELATIONSHIP_TYPES'.
+    direction : str - Options: 'both', 'outgoing', 'incoming'
+        Direction of the relationships from the start to the end nodes. Default is 'both'.
+    excluded_labels : Optional[List[str]]
+        Labels of the nodes the paths do not go through, by default 'SUPERNODE_LABELS'.
+    max_degree : Optional[int]
+        Maximum number of relationships of the nodes the paths go through, by default None (no limit).
+    fetch_size : int
+        Paths fetched from the server at a time. Default is 100.
+    timeout : Optional[float]
+        Transaction timeout of each query in seconds, by default None (the server setting).
+
+    Yields
+    ------
+    dict
+        Path, shortest first: length, nodes (element_id, labels, properties) and relationships (type, start and end element ids).
+    '''
+    source_ids = resolve_nodes(database_url, database_name, node_a, name_a, candidates)
+    target_ids = resolve_nodes(database_url, database_name, node_b, name_b, candidates)
+
+    left, right, types, parameters = path_query_parts(source_ids, target_ids, relationship_types, direction,
+                                                      excluded_labels, max_degree)
+
+    if not (source_ids and target_ids):
+        return
+
+    with session(database_url, database_name, fetch_size=fetch_size) as driver_session:
+        shortest = driver_session.run(Query(f'''
+            {PATH_ENDPOINTS}
+            MATCH p = shortestPath((a){left}[:{types}*..{int(max_depth)}]{right}(b))
+            WHERE {PATH_NODE_FILTER}
+            RETURN min(length(p)) AS length
+            ''', timeout=timeout), parameters).single()
+
+        if shortest is None or shortest['length'] is None:
+            return
+
+        for depth in range(shortest['length'], max_depth + 1):
+            result = driver_session.run(Query(f'''
+                {PATH_ENDPOINTS}
+                MATCH p = (a){left}[:{types}*{depth}]{right}(b)
+                WHERE {PATH_NODE_FILTER} AND {PATH_SIMPLE_FILTER}
+                RETURN [n IN nodes(p) | {{element_id: elementId(n), labels: labels(n), properties: {projection('n', fields)}}}] AS nodes,
+                       [r IN relationships(p) | {{type: type(r), start: elementId(startNode(r)), end: elementId(endNode(r))}}] AS relationships
+                ''', timeout=timeout), parameters)
+
+            for record in result:
+                yield {
+                    'length': depth,
+                    'nodes': [{**node, 'labels': sorted(node['labels'])} for node in record['nodes']],
+                    'relationships': record['relationships'],
+                }
@@ -0,0 +1,415 @@
+import gc
+import time
+import inspect
+import importlib
+from typing import Dict, List, Optional, Tuple
+
+import pandas as pd
+from neomodel import db, StructuredNode, StructuredRel
+
+from core.enums.db_enums import DatabaseType
+from database.utils.db_connection import neomodel_connect
+from database.utils.connection_manager import use_database
+
+
+# Modules of the neomodel models, the same apps installed by 'install_labels'.
+MODEL_MODULES = ['apps.author.models', 'apps.institution.models', 'apps.paper.models']
+
+# Secondary indexes of the lookups that the constraints of the models do not cover, as (label, properties).
+LOOKUP_INDEXES = [
+    ('Paper', ('paper_id', 'title')),   # Paper connections ('bulk' and 'neomodel' engines)
+    ('Paper', ('title',)),              # database/populate_db.py, database/utils/querys.py
+    ('Author', ('name',)),              # database/populate_db.py, database/utils/querys.py
+    ('Venue', ('name',)),               # Venue nodes and Paper connections
+]
+
+# Full-text indexes of the name searches of 'database/utils/querys.py', as (label, property, analyzer).
+# Field of study names are stored with underscores ('machine_learning'), the 'simple' analyzer splits them into words.
+FULLTEXT_INDEXES = [
+    ('Paper', 'title', 'standard-no-stop-words'),
+    ('Author', 'name', 'standard-no-stop-words'),
+    ('Organization', 'name', 'standard-no-stop-words'),
+    ('Venue', 'name', 'standard-no-stop-words'),
+    ('FieldOfStudy', 'name', 'simple'),
+]
+
+# Node lookups of the loaders and queries, as (label, properties compared by equality), see 'uncovered_lookups'.
+LOADER_LOOKUPS = [
+    ('Paper', ('paper_id',)),
+    ('Paper', ('paper_id', 'title')),
+    ('Paper', ('title',)),
+    ('Author', ('author_id',)),
+    ('Author', ('name',)),
+    ('Organization', ('name',)),
+    ('Publisher', ('name',)),
+    ('Venue', ('name',)),
+    ('VenueType', ('type',)),
+    ('DocumentType', ('type',)),
+    ('FieldOfStudy', ('name',)),
+]
+
+
+
+def get_models() -> List[type]:
+    '''
+    Get the neomodel node models of 'MODEL_MODULES'.
+
+    Returns
+    -------
+    List[type]
+        StructuredNode classes, in the order they are defined.
+    '''
+    models = []
+
+    for module_name in MODEL_MODULES:
+        module = importlib.import_module(module_name)
+
+        for cls in vars(module).values():
+            if inspect.isclass(cls) and issubclass(cls, StructuredNode) and cls.__module__ == module_name and cls not in models:
+                models.append(cls)
+
+    return models
+
+
+def get_fulltext_index(label: str) -> Tuple[str, str]:
+    '''
+    Get the full-text index of a label.
+
+    Parameters
+    ----------
+    label : str
+        Node label.
+
+    Returns
+    -------
+    Tuple[str, str]
+        index_name : str
+            Name of the full-text index.
+        property : str
+            Indexed property.
+
+    Raises
+    ------
+    ValueError
+        If the label has no full-text index.
+    '''
+    for index_label, prop, analyzer in FULLTEXT_INDEXES:
+        if index_label == label:
+            return f'fulltext_{label}_{prop}', prop
+
+    raise ValueError(f'There is no full-text index for {label}. Options: {", ".join(index[0] for index in FULLTEXT_INDEXES)}.')
+
+
+def get_schema() -> Dict[str, List[dict]]:
+    '''
+    Derive the schema of the database from the neomodel models:
+        - constraints: a uniqueness constraint for every 'unique_index' property of the nodes and relationships
+          (e.g. 'Paper.paper_id', 'DocumentType.type', 'PaperFieldOfStudyRel.paper_fos_id').
+          Named like 'neomodel_install_labels' does, so the constraints it created are reused.
+        - indexes: a range index for every 'index' property of the models, the 'LOOKUP_INDEXES'
+          (e.g. the composite index on Paper (paper_id, title)) and the 'FULLTEXT_INDEXES'.
+
+    Returns
+    -------
+    Dict[str, List[dict]]
+        'constraints' and 'indexes', each item with: name, type ('RANGE' or 'FULLTEXT'), entity ('node' or
+        'relationship'), label (label or relationship type), properties (tuple) and the query that creates it.
+    '''
+    schema = {'constraints': [], 'indexes': []}
+    seen = set()
+
+    def add(kind: str, entity: str, label: str, properties: Tuple[str, ...], index_type: str = 'RANGE',
+            analyzer: Optional[str] = None) -> None:
+        if (kind, index_type, entity, label, properties) in seen:
+            return
+        seen.add((kind, index_type, entity, label, properties))
+
+        prefix = {'constraints': 'constraint_unique', 'RANGE': 'index', 'FULLTEXT': 'fulltext'}[kind if kind == 'constraints' else index_type]
+        name = f'{prefix}_{label}_{"_".join(properties)}'
+        variable = 'n' if entity == 'node' else 'r'
+        pattern = f'(n:{label})' if entity == 'node' else f'()-[r:{label}]-()'
+        keys = ', '.join(f'{variable}.{prop}' for prop in properties)
+
+        if kind == 'constraints':
+            query = f'CREATE CONSTRAINT {name} IF NOT EXISTS FOR {pattern} REQUIRE ({keys}) IS UNIQUE'
+        elif index_type == 'FULLTEXT':
+            query = (f'CREATE FULLTEXT INDEX {name} IF NOT EXISTS FOR {pattern} ON EACH [{keys}] '
+                     f"OPTIONS {{indexConfig: {{`fulltext.analyzer`: '{analyzer}'}}}}")
+        else:
+            query = f'CREATE INDEX {name} IF NOT EXISTS FOR {pattern} ON ({keys})'
+
+        schema[kind].append({'name': name, 'type': index_type, 'entity': entity, 'label': label,
+                             'properties': properties, 'query': query})
+
+    def add_properties(entity: str, label: str, cls) -> None:
+        for prop_name, prop in cls.defined_properties(aliases=False, rels=False).items():
+            db_property = prop.get_db_property_name(prop_name)
+
+            if prop.index:
+                add('indexes', entity, label, (db_property,))
+            elif prop.unique_index:
+                add('constraints', entity, label, (db_property,))
+
+    for model in get_models():
+        add_properties('node', model.__label__, model)
+
+        for relationship in model.defined_properties(aliases=False, properties=False, rels=True).values():
+            relationship_model = relationship.definition['model']
+
+            if relationship_model is not None and issubclass(relationship_model, StructuredRel):
+                add_properties('relationship', relationship.definition['relation_type'], relationship_model)
+
+    for label, properties in LOOKUP_INDEXES:
+        add('indexes', 'node', label, properties)
+
+    for label, prop, analyzer in FULLTEXT_INDEXES:
+        add('indexes', 'node', label, (prop,), 'FULLTEXT', analyzer)
+
+    return schema
+
+
+def get_indexes(database_url: str, database_name: str) -> pd.DataFrame:
+    '''
+    Get the indexes of the database ('SHOW INDEXES'), including the ones that back the constraints.
+
+    Parameters
+    ----------
+    database_url : str
+        URL of the database.
+    database_name : str
+        Name of the database.
+
+    Returns
+    -------
+    pd.DataFrame
+        One row per index: name, state, populationPercent, type, entityType, labelsOrTypes, properties
+        and owningConstraint.
+    '''
+    use_database(database_url, database_name)
+
+    columns = ['name', 'state', 'populationPercent', 'type', 'entityType', 'labelsOrTypes', 'properties', 'owningConstraint']
+    results, meta = db.cypher_query(f'SHOW INDEXES YIELD {", ".join(columns)}')
+
+    return pd.DataFrame(results, columns=columns)
+
+
+def wait_for_indexes(database_url: str, database_name: str, names: Optional[List[str]] = None,
+                     timeout: float = 3600, poll_interval: float = 2) -> pd.DataFrame:
+    '''
+    Block until the indexes are ONLINE, printing the population progress.
+    A constraint is ready when its backing index is ONLINE.
+
+    Parameters
+    ----------
+    database_url : str
+        URL of the database.
+    database_name : str
+        Name of the database.
+    names : Optional[List[str]]
+        Names of the indexes or constraints to wait for, by default every index of the database.
+    timeout : float
+        Maximum seconds to wait. Default is 3600.
+    poll_interval : float
+        Seconds between two checks. Default is 2.
+
+    Returns
+    -------
+    pd.DataFrame
+        Indexes of the database when they are all ONLINE, see 'get_indexes'.
+
+    Raises
+    ------
+    RuntimeError
+        If an index is FAILED, or a name is neither an index nor a constraint of the database.
+    TimeoutError
+        If the indexes are not ONLINE after 'timeout' seconds.
+    '''
+    deadline = time.time() + timeout
+
+    while True:
+        indexes = get_indexes(database_url, database_name)
+
+        if names is not None:
+            selected = indexes[indexes['name'].isin(names) | indexes['owningConstraint'].isin(names)]
+            missing = set(names) - set(selected['name']) - set(selected['owningConstraint'].dropna())
+
+            if missing:
+                raise RuntimeError(f'Indexes not found in the database: {", ".join(sorted(missing))}')
+        else:
+            selected = indexes
+
+        failed = selected[selected['state'] == 'FAILED']
+        if len(failed):
+            raise RuntimeError(f'Indexes failed to populate: {", ".join(failed["name"])}. '
+                               'Check them with SHOW INDEXES YIELD name, failureMessage')
+
+        pending = selected[selected['state'] != 'ONLINE']
+        if not len(pending):
+            return indexes
+
+        if time.time() > deadline:
+            raise TimeoutError(f'Indexes not ONLINE after {timeout} seconds: {", ".join(pending["name"])}')
+
+        progress = ', '.join(f'{name} {percent:.0f}%' for name, percent in zip(pending['name'], pending['populationPercent']))
+        print(f'Waiting for indexes: {progress}')
+        time.sleep(poll_interval)
+
+
+def apply_schema(database_url: str, database_name: str, kind: str, wait: bool = True,
+                 timeout: float = 3600) -> List[str]:
+    '''
+    Create the constraints or the indexes of 'get_schema' that are not in the database yet.
+
+    Parameters
+    ----------
+    database_url : str
+        URL of the database.
+    database_name : str
+        Name of the database.
+    kind : str - Options: 'constraints', 'indexes'
+        Part of the schema to create.
+    wait : bool
+        Block until the created constraints and indexes are ONLINE. Default is True.
+    timeout : float
+        Maximum seconds to wait. Default is 3600.
+
+    Returns
+    -------
+    List[str]
+        Names of the indexes of the schema in the database (a constraint is named after its backing index).
+    '''
+    use_database(database_url, database_name)
+
+    items = get_schema()[kind]
+
+    # Uniqueness constraints on relationships need Neo4j 5.7
+    if kind == 'constraints' and not db.version_is_higher_than('5.7'):
+        items = [item for item in items if item['entity'] == 'node']
+
+    for item in items:
+        print(f'Creating {"constraint" if kind == "constraints" else "index"} {item["name"]}')
+        db.cypher_query(item['query'])
+
+    # An equivalent index created before under another name (e.g. by 'neomodel_install_labels') is not created
+    # again, so the indexes are found by their label and properties
+    indexes = get_indexes(database_url, database_name)
+    names = []
+
+    for item in items:
+        entity_type = 'NODE' if item['entity'] == 'node' else 'RELATIONSHIP'
+        matches = indexes[(indexes['entityType'] == entity_type) & (indexes['type'] == item['type'])
+                          & indexes['labelsOrTypes'].apply(lambda labels: list(labels or []) == [item['label']])
+                          & indexes['properties'].apply(lambda properties: list(properties or []) == list(item['properties']))]
+        names.append(matches['name'].iloc[0] if len(matches) else item['name'])
+
+    if wait:
+        wait_for_indexes(database_url, database_name, names, timeout)
+
+    gc.collect()
+
+    return names
+
+
+def apply_constraints(database_url: str, database_name: str, wait: bool = True, timeout: float = 3600) -> List[str]:
+    '''
+    Create the uniqueness constraints of the models. Apply them before loading: the loaders MERGE on the
+    constrained properties, and each MERGE is an index seek instead of a label scan.
+    With data in the database, the creation fails if a property has duplicate values.
+    See 'apply_schema'.
+    '''
+    return apply_schema(database_url, database_name, 'constraints', wait, timeout)
+
+
+def apply_indexes(database_url: str, database_name: str, wait: bool = True, timeout: float = 3600) -> List[str]:
+    '''
+    Create the secondary indexes. Creating them after the nodes are loaded avoids maintaining them on every
+    write, but the lookups they cover (e.g. Paper (paper_id, title) for the Paper connections) need them
+    before the load that uses them. See 'apply_schema'.
+    '''
+    return apply_schema(database_url, database_name, 'indexes', wait, timeout)
+
+
+def uncovered_lookups(database_url: str, database_name: str,
+                      lookups: Optional[List[Tuple[str, Tuple[str, ...]]]] = None) -> List[Tuple[str, Tuple[str, ...]]]:
+    '''
+    Find the node lookups that no ONLINE index of the database can serve, so each of them scans every node
+    of the label. A lookup is covered by a range or text index of its label whose first property is compared
+    in the lookup (composite indexes are used from their first property).
+
+    Parameters
+    ----------
+    database_url : str
+        URL of the database.
+    database_name : str
+        Name of the database.
+    lookups : Optional[List[Tuple[str, Tuple[str, ...]]]]
+        Lookups as (label, properties), by default 'LOADER_LOOKUPS'.
+
+    Returns
+    -------
+    List[Tuple[str, Tuple[str, ...]]]
+        Lookups not covered by any index.
+    '''
+    indexes = get_indexes(database_url, database_name)
+    indexes = indexes[(indexes['state'] == 'ONLINE') & (indexes['entityType'] == 'NODE')
+                      & indexes['type'].isin(['RANGE', 'TEXT', 'BTREE'])]
+
+    first_properties = {}
+    for labels, properties in zip(indexes['labelsOrTypes'], indexes['properties']):
+        for label in labels or []:
+            first_properties.setdefault(label, set()).add(properties[0])
+
+    return [(label, properties) for label, properties in (lookups or LOADER_LOOKUPS)
+            if not first_properties.get(label, set()) & set(properties)]
+
+
+
+
+if __name__ == '__main__':
+    print('==============================')
+    print(' Database Schema')
+    print('==============================')
+    print('Choose Database:')
+    print(f'1. {DatabaseType.PRODUCTION.value}')
+    print(f'2. {DatabaseType.TEST.value}')
+
+    db_option = None
+    while db_option not in [DatabaseType.PRODUCTION.value, DatabaseType.TEST.value]:
+        db_option = input('\nDatabase: ')
+
+        if db_option not in [DatabaseType.PRODUCTION.value, DatabaseType.TEST.value]:
+            print(f'Invalid Database. Please choose between \'{DatabaseType.PRODUCTION.value}\' and \'{DatabaseType.TEST.value}\'.')
+
+    db_option = DatabaseType(db_option)
+    database_url, database_name = neomodel_connect(db_option)
+
+    print(f'Database: {database_name}')
+
+    print('\nSelect an option:')
+    print('1. Create constraints (before loading)')
+    print('2. Create indexes (after loading the nodes)')
+    print('3. Create constraints and indexes')
+    print('4. Show indexes and uncovered lookups')
+
+    option = None
+    while option not in ['1', '2', '3', '4']:
+        option = input('\nOption: ')
+
+    if option in ['1', '3']:
+        apply_constraints(database_url, database_name)
+        print('\nConstraints ONLINE.')
+
+    if option in ['2', '3']:
+        apply_indexes(database_url, database_name)
+        print('\nIndexes ONLINE.')
+
+    print(f'\nIndexes in \'{db_option.value}\' Database:')
+    print(get_indexes(database_url, database_name).to_string())
+
+    uncovered = uncovered_lookups(database_url, database_name)
+    if uncovered:
+        print('\nLookups not covered by any index:')
+        for label, properties in uncovered:
+            print(f'{label} ({", ".join(properties)})')
+    else:
+        print('\nEvery lookup is covered by an index.')
@@ -0,0 +1,404 @@
+import os
+import gc
+import json
+import shutil
+from os.path import join, exists
+from typing import FrozenSet, Iterator, Optional
+
+import ijson
+import numpy as np
+import pyarrow as pa
+from tqdm import tqdm
+
+from core.funcs import detect_encoding
+from dataset.utils.projection import projected_columns
+
+
+CACHE_VERSION = 1
+MANIFEST_FILE = 'manifest.json'
+
+# Tables of the cache. Every table is written in record batches aligned with the 'papers' batches:
+# batch i of a child table holds the rows of the papers in batch i of 'papers'.
+# 'paper_idx' is the row number of the paper in 'papers', 'venue_idx' and 'fos_idx' the row number in 'venues' and 'fos'.
+SCHEMAS = {
+    'papers': pa.schema([
+        ('paper_id', pa.int64()),
+        ('title', pa.string()),
+        ('doi', pa.string()),
+        ('year', pa.int32()),
+        ('n_citation', pa.int64()),
+        ('page_start', pa.string()),
+        ('page_end', pa.string()),
+        ('volume', pa.string()),
+        ('issue', pa.string()),
+        ('doc_type', pa.string()),
+        ('publisher', pa.string()),
+        ('venue_idx', pa.int32()),
+    ]),
+    'venues': pa.schema([
+        ('venue_id', pa.int64()),
+        ('raw', pa.string()),
+        ('type', pa.string()),
+    ]),
+    'authors': pa.schema([
+        ('author_id', pa.int64()),
+        ('name', pa.string()),
+    ]),
+    'paper_author': pa.schema([
+        ('paper_idx', pa.int32()),
+        ('paper_id', pa.int64()),
+        ('author_id', pa.int64()),
+        ('name', pa.string()),
+        ('org', pa.string()),
+    ]),
+    'fos': pa.schema([
+        ('name', pa.string()),
+    ]),
+    'paper_fos': pa.schema([
+        ('paper_idx', pa.int32()),
+        ('paper_id', pa.int64()),
+        ('fos_idx', pa.int32()),
+        ('w', pa.float64()),
+    ]),
+    'references': pa.schema([
+        ('paper_idx', pa.int32()),
+        ('paper_id', pa.int64()),
+        ('ref_id', pa.int64()),
+    ]),
+}
+
+PAPER_STRING_FIELDS = ['title', 'doi', 'page_start', 'page_end', 'volume', 'issue', 'doc_type', 'publisher']
+
+# Child table of each list field of the records.
+CHILD_TABLES = {
+    'authors': 'paper_author',
+    'fos': 'paper_fos',
+    'references': 'references',
+}
+
+
+
+def get_cache_dir() -> str:
+    '''
+    Get the directory of the columnar dataset cache.
+    Set with the 'DATASET_CACHE_PATH' environment variable. Default is './dataset/cache'.
+
+    Returns
+    -------
+    str
+        Path to the cache directory.
+    '''
+    return os.environ.get('DATASET_CACHE_PATH', './dataset/cache')
+
+
+def source_signature(dataset_path: str) -> dict:
+    '''
+    Get the signature of the source dataset used to invalidate the cache.
+
+    Parameters
+    ----------
+    dataset_path : str
+        Path to the dataset.
+
+    Returns
+    -------
+    dict
+        Cache version, size and modification time of the dataset.
+    '''
+    stat = os.stat(dataset_path)
+
+    return {
+        'version': CACHE_VERSION,
+        'size': stat.st_size,
+        'mtime_ns': stat.st_mtime_ns,
+    }
+
+
+def is_cache_valid(dataset_path: str, cache_dir: Optional[str] = None) -> bool:
+    '''
+    Check if the cache was built from the current version of the dataset.
+    The cache is invalid when the dataset size or modification time changed since it was built.
+
+    Parameters
+    ----------
+    dataset_path : str
+        Path to the dataset.
+    cache_dir : Optional[str]
+        Path to the cache directory, by default 'get_cache_dir()'.
+
+    Returns
+    -------
+    bool
+        True if the cache can be used instead of the dataset.
+    '''
+    cache_dir = cache_dir or get_cache_dir()
+    manifest_path = join(cache_dir, MANIFEST_FILE)
+
+    if not (exists(dataset_path) and exists(manifest_path)):
+        return False
+
+    with open(manifest_path, 'r', encoding='utf-8') as f:
+        manifest = json.load(f)
+
+    return manifest.get('source', None) == source_signature(dataset_path) \
+        and all(exists(join(cache_dir, f'{table}.arrow')) for table in SCHEMAS)
+
+
+def _flush(writers: dict, buffers: dict) -> None:
+    '''
+    Write the buffered rows of every table as one record batch and empty the buffers.
+    '''
+    for table, columns in buffers.items():
+        batch = pa.RecordBatch.from_pydict(columns, schema=SCHEMAS[table])
+        writers[table].write_batch(batch)
+
+        for column in columns.values():
+            column.clear()
+
+
+def build_cache(dataset_path: str, dataset_encoding: Optional[str] = None,
+                cache_dir: Optional[str] = None, chunk_size: int = 100000) -> None:
+    '''
+    Convert the DBLP dataset into columnar Arrow IPC files, one per table.
+    The dataset is streamed and written in record batches of 'chunk_size' papers, so memory stays flat.
+    The 'indexed_abstract' field is not stored, no loader uses it.
+    Files are written in a temporary directory and moved in place with the manifest written last,
+    so an interrupted build never leaves a cache that looks valid.
+
+    Parameters
+    ----------
+    dataset_path : str
+        Path to the dataset.
+    dataset_encoding : Optional[str]
+        Encoding of the dataset, detected if not provided.
+    cache_dir : Optional[str]
+        Path to the cache directory, by default 'get_cache_dir()'.
+    chunk_size : int
+        Papers per record batch. Default is 100000.
+    '''
+    cache_dir = cache_dir or get_cache_dir()
+    dataset_encoding = dataset_encoding or detect_encoding(dataset_path)
+    signature = source_signature(dataset_path)
+
+    tmp_dir = f'{cache_dir.rstrip(os.sep)}.tmp'
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(tmp_dir)
+
+    writers = {table: pa.ipc.new_file(join(tmp_dir, f'{table}.arrow'), schema) for table, schema in SCHEMAS.items()}
+    buffers = {table: {name: [] for name in schema.names} for table, schema in SCHEMAS.items()}
+
+    venues = {}
+    fos = {}
+    authors = set()
+    paper_idx = 0
+
+    with open(dataset_path, 'r', encoding=dataset_encoding) as f:
+        objects = ijson.items(f, 'item')
+
+        for obj in tqdm(objects, desc='Building dataset cache', unit=' papers'):
+            paper_id = int(obj['id'])
+            papers = buffers['papers']
+
+            papers['paper_id'].append(paper_id)
+            papers['year'].append(int(obj['year']) if obj.get('year', None) else None)
+            papers['n_citation'].append(int(obj['n_citation']) if obj.get('n_citation', None) is not None else None)
+            for field in PAPER_STRING_FIELDS:
+                value = obj.get(field, None)
+                papers[field].append(str(value) if value is not None else None)
+
+            venue = obj.get('venue', None)
+            venue_idx = None
+            if venue:
+                key = (venue.get('id', None), venue.get('raw', None), venue.get('type', None))
+
+                if key not in venues:
+                    venues[key] = len(venues)
+                    buffers['venues']['venue_id'].append(int(key[0]) if key[0] is not None else None)
+                    buffers['venues']['raw'].append(key[1])
+                    buffers['venues']['type'].append(key[2])
+
+                venue_idx = venues[key]
+            papers['venue_idx'].append(venue_idx)
+
+            for author in obj.get('authors', []):
+                author_id = int(author['id']) if author.get('id', None) is not None else None
+
+                if author_id is not None and author_id not in authors:
+                    authors.add(author_id)
+                    buffers['authors']['author_id'].append(author_id)
+                    buffers['authors']['name'].append(author.get('name', None))
+
+                paper_author = buffers['paper_author']
+                paper_author['paper_idx'].append(paper_idx)
+                paper_author['paper_id'].append(paper_id)
+                paper_author['author_id'].append(author_id)
+                paper_author['name'].append(author.get('name', None))
+                paper_author['org'].append(author.get('org', None))
+
+            for field_of_study in obj.get('fos', []):
+                fos_name = field_of_study['name']
+
+                if fos_name not in fos:
+                    fos[fos_name] = len(fos)
+                    buffers['fos']['name'].append(fos_name)
+
+                paper_fos = buffers['paper_fos']
+                paper_fos['paper_idx'].append(paper_idx)
+                paper_fos['paper_id'].append(paper_id)
+                paper_fos['fos_idx'].append(fos[fos_name])
+                paper_fos['w'].append(float(field_of_study.get('w', 0.0)))
+
+            for ref_id in obj.get('references', []):
+                references = buffers['references']
+                references['paper_idx'].append(paper_idx)
+                references['paper_id'].append(paper_id)
+                references['ref_id'].append(int(ref_id))
+
+            paper_idx += 1
+            if paper_idx % chunk_size == 0:
+                _flush(writers, buffers)
+
+    if buffers['papers']['paper_id']:
+        _flush(writers, buffers)
+
+    for writer in writers.values():
+        writer.close()
+
+    with open(join(tmp_dir, MANIFEST_FILE), 'w', encoding='utf-8') as f:
+        json.dump({'source': signature, 'dataset_path': os.path.abspath(dataset_path), 'papers': paper_idx}, f, indent=4)
+
+    shutil.rmtree(cache_dir, ignore_errors=True)
+    os.replace(tmp_dir, cache_dir)
+
+    gc.collect()
+
+
+def read_table(table: str, cache_dir: Optional[str] = None) -> pa.Table:
+    '''
+    Open a table of the cache. The file is memory-mapped, so columns are read without copying.
+
+    Parameters
+    ----------
+    table : str
+        Name of the table. Options: keys of 'SCHEMAS'.
+    cache_dir : Optional[str]
+        Path to the cache directory, by default 'get_cache_dir()'.
+
+    Returns
+    -------
+    pa.Table
+        Memory-mapped table.
+    '''
+    cache_dir = cache_dir or get_cache_dir()
+    source = pa.memory_map(join(cache_dir, f'{table}.arrow'), 'r')
+
+    return pa.ipc.open_file(source).read_all()
+
+
+def iter_cached_papers(cache_dir: Optional[str] = None, start: int = 0,
+                       fields: Optional[FrozenSet[str]] = None) -> Iterator[dict]:
+    '''
+    Iterate over the cached papers as dictionaries with the same shape as the dataset records,
+    so they can be passed to the loaders in 'database/load_by_model.py' unchanged.
+    Empty fields are left out of the dictionaries, like in the dataset.
+    With a projection only the needed columns of 'papers' are read, and the child tables of the fields
+    that are not selected are not opened.
+
+    Parameters
+    ----------
+    cache_dir : Optional[str]
+        Path to the cache directory, by default 'get_cache_dir()'.
+    start : int
+        Index of the first paper. Record batches before it are skipped without being read. Default is 0.
+    fields : Optional[FrozenSet[str]]
+        Top-level fields to keep ('projection.get_projection'), by default None (every field).
+
+    Yields
+    ------
+    dict
+        Paper record.
+    '''
+    cache_dir = cache_dir or get_cache_dir()
+
+    child_tables = [table for field, table in CHILD_TABLES.items() if fields is None or field in fields]
+    readers = {table: pa.ipc.open_file(pa.memory_map(join(cache_dir, f'{table}.arrow'), 'r'))
+               for table in ['papers'] + child_tables}
+    columns = projected_columns(fields, SCHEMAS['papers'].names)
+
+    venues = []
+    if 'venue_idx' in columns:
+        venues = [{key: value for key, value in venue.items() if value is not None}
+                  for venue in read_table('venues', cache_dir).rename_columns(['id', 'raw', 'type']).to_pylist()]
+
+    fos_names = read_table('fos', cache_dir).column('name').to_pylist() if 'paper_fos' in child_tables else []
+
+    paper_offset = 0
+
+    for i in range(readers['papers'].num_record_batches):
+        papers = readers['papers'].get_batch(i)
+        n_papers = papers.num_rows
+
+        if paper_offset + n_papers <= start:
+            paper_offset += n_papers
+            continue
+
+        papers = papers.select(columns).to_pydict()
+        paper_range = np.arange(paper_offset, paper_offset + n_papers + 1)
+
+        # Tables that are not read have no rows for any paper
+        children = {table: ({}, np.zeros(len(paper_range), dtype=np.int64)) for table in CHILD_TABLES.values()}
+        for table in child_tables:
+            batch = readers[table].get_batch(i)
+            bounds = np.searchsorted(batch.column('paper_idx').to_numpy(), paper_range)
+            children[table] = (batch.to_pydict(), bounds)
+
+        paper_author, author_bounds = children['paper_author']
+        paper_fos, fos_bounds = children['paper_fos']
+        references, ref_bounds = children['references']
+
+        for j in range(max(0, start - paper_offset), n_papers):
+            obj = {field: values[j] for field, values in papers.items()
+                   if field != 'venue_idx' and values[j] is not None}
+
+            if 'paper_id' in obj:
+                obj['id'] = obj.pop('paper_id')
+
+            if 'venue_idx' in papers and papers['venue_idx'][j] is not None:
+                obj['venue'] = dict(venues[papers['venue_idx'][j]])
+
+            a, b = author_bounds[j], author_bounds[j + 1]
+            if a < b:
+                obj['authors'] = [{key: value for key, value in (('name', name), ('org', org), ('id', author_id)) if value is not None}
+                                  for name, org, author_id in zip(paper_author['name'][a:b], paper_author['org'][a:b], paper_author['author_id'][a:b])]
+
+            a, b = fos_bounds[j], fos_bounds[j + 1]
+            if a < b:
+                obj['fos'] = [{'name': fos_names[fos_idx], 'w': w}
+                              for fos_idx, w in zip(paper_fos['fos_idx'][a:b], paper_fos['w'][a:b])]
+
+            a, b = ref_bounds[j], ref_bounds[j + 1]
+            if a < b:
+                obj['references'] = references['ref_id'][a:b]
+
+            yield obj
+
+        paper_offset += n_papers
+
+
+
+
+if __name__ == '__main__':
+    dataset_path = os.environ.get('DATASET_PATH', './dataset/dblp.v12.json')
+    cache_dir = get_cache_dir()
+
+    print('==========================')
+    print(' Build Dataset Cache')
+    print('==========================')
+    print(f'Dataset: {dataset_path}')
+    print(f'Cache: {cache_dir}')
+
+    if is_cache_valid(dataset_path, cache_dir):
+        print('\nThe cache is up to date with the dataset.')
+    else:
+        build_cache(dataset_path, cache_dir=cache_dir)
+        print('\nDataset cache built successfully.')
@@ -0,0 +1,145 @@
+import codecs
+from itertools import islice
+from typing import FrozenSet, Iterator, Optional, Tuple
+
+import ijson
+
+from dataset.utils.columnar_cache import get_cache_dir, is_cache_valid, iter_cached_papers
+from dataset.utils.parallel_reader import iter_dataset_parallel, iter_parsed_ranges, split_dataset
+from dataset.utils.projection import iter_projected_items
+
+
+# Byte ranges are parsed as UTF-8 by the workers
+PARALLEL_ENCODINGS = {'utf-8', 'ascii'}
+
+
+def iter_dataset(dataset_path: str, dataset_encoding: str,
+                 use_cache: bool = True, cache_dir: Optional[str] = None,
+                 workers: int = 1, ordered: bool = True, fields: Optional[FrozenSet[str]] = None) -> Iterator[dict]:
+    '''
+    Iterate over the papers of the DBLP dataset.
+    When the columnar cache ('dataset/utils/columnar_cache.py') is up to date with the dataset,
+    the papers are read from it instead of parsing the JSON file.
+    Otherwise the JSON file is parsed in one process, or split in byte ranges parsed by
+    'workers' processes ('dataset/utils/parallel_reader.py'). Files that cannot be split in byte ranges
+    (without one element per line) or that are not UTF-8 are always streamed in one process.
+    With a projection ('projection.get_projection'), the records only hold the selected top-level fields.
+    Small projections (e.g. the DocumentType or FieldOfStudy phases) skip the other fields in the parser, so they
+    are never built. Projections that keep most of the record build it whole with 'ijson.items' and drop the
+    other fields, which parses faster ('projection.is_low_memory_parse').
+
+    Parameters
+    ----------
+    dataset_path : str
+        Path to the dataset.
+    dataset_encoding : str
+        Encoding of the dataset.
+    use_cache : bool
+        Read from the columnar cache when it is valid. Default is True.
+    cache_dir : Optional[str]
+        Path to the cache directory, by default 'columnar_cache.get_cache_dir()'.
+    workers : int
+        Number of processes used to parse the JSON file. Default is 1.
+    ordered : bool
+        Yield the papers in file order when parsing in parallel. Default is True.
+    fields : Optional[FrozenSet[str]]
+        Top-level fields to keep, by default None (every field).
+
+    Yields
+    ------
+    dict
+        Paper record.
+    '''
+    cache_dir = cache_dir or get_cache_dir()
+
+    if use_cache and is_cache_valid(dataset_path, cache_dir):
+        yield from iter_cached_papers(cache_dir, fields=fields)
+        return
+
+    if workers > 1 and codecs.lookup(dataset_encoding).name in PARALLEL_ENCODINGS:
+        ranges = split_dataset(dataset_path)
+
+        # A single range would be read and parsed in memory at once, stream it instead
+        if len(ranges) > 1:
+            yield from iter_dataset_parallel(dataset_path, workers, ordered=ordered, fields=fields, ranges=ranges)
+            return
+
+    with open(dataset_path, 'r', encoding=dataset_encoding) as f:
+        if fields is not None:
+            yield from iter_projected_items(f, fields)
+        else:
+            yield from ijson.items(f, 'item')
+
+
+def iter_dataset_positions(dataset_path: str, dataset_encoding: str, start: Optional[dict] = None,
+                           use_cache: bool = True, cache_dir: Optional[str] = None,
+                           workers: int = 1, fields: Optional[FrozenSet[str]] = None) -> Iterator[Tuple[dict, dict]]:
+    '''
+    Iterate over the papers of the DBLP dataset with the position of each paper, starting at a given position.
+    Positions are stored by the load checkpoints ('database/utils/checkpoints.py') to resume a load
+    without reading the papers before the checkpoint again:
+        - index: index of the paper in the dataset.
+        - offset: start offset of the byte range of the paper ('parallel_reader.split_dataset'), None when reading the cache.
+        - skip: index of the paper in its byte range.
+    From the columnar cache, the record batches before the start are skipped. From the JSON file, the reader seeks
+    to the byte range of the start, and only the papers before it in that range are parsed again.
+    Files without one element per line cannot be split, and files that are not UTF-8 are not parsed in byte ranges,
+    they are parsed from the beginning up to the start.
+
+    Parameters
+    ----------
+    dataset_path : str
+        Path to the dataset.
+    dataset_encoding : str
+        Encoding of the dataset.
+    start : Optional[dict]
+        Position of the first paper, by default the beginning of the dataset.
+    use_cache : bool
+        Read from the columnar cache when it is valid. Default is True.
+    cache_dir : Optional[str]
+        Path to the cache directory, by default 'columnar_cache.get_cache_dir()'.
+    workers : int
+        Number of processes used to parse the JSON file. Default is 1.
+    fields : Optional[FrozenSet[str]]
+        Top-level fields to keep, by default None (every field).
+
+    Yields
+    ------
+    Tuple[dict, dict]
+        Position and paper record.
+    '''
+    cache_dir = cache_dir or get_cache_dir()
+    start = start or {'index': 0, 'offset': None, 'skip': 0}
+
+    if use_cache and is_cache_valid(dataset_path, cache_dir):
+        for index, obj in enumerate(iter_cached_papers(cache_dir, start['index'], fields), start['index']):
+            yield {'index': index, 'offset': None, 'skip': 0}, obj
+        return
+
+    ranges = split_dataset(dataset_path)
+
+    if len(ranges) == 1 or codecs.lookup(dataset_encoding).name not in PARALLEL_ENCODINGS:
+        objects = iter_dataset(dataset_path, dataset_encoding, use_cache=False, fields=fields)
+        for index, obj in enumerate(islice(objects, start['index'], None), start['index']):
+            yield {'index': index, 'offset': ranges[0][0], 'skip': index}, obj
+        return
+
+    index = 0
+    skip = 0
+    offsets = [range_start for range_start, range_end in ranges]
+
+    if start.get('offset', None) in offsets:
+        ranges = ranges[offsets.index(start['offset']):]
+        index = start['index'] - start['skip']
+        skip = start['skip']
+
+    elif start['index']:
+        # The checkpoint was taken with other ranges (e.g. another chunk size), skip from the beginning
+        skip = start['index']
+
+    for range_start, records in iter_parsed_ranges(dataset_path, ranges, workers, fields):
+        for position, obj in enumerate(records[skip:], skip):
+            yield {'index': index + position, 'offset': range_start, 'skip': position}, obj
+
+        index += len(records)
+        skip = max(0, skip - len(records))
@@ -1,8 +1,10 @@
+import os
 import time
 import json
-import ijson
 
 from core.funcs import detect_encoding
+from dataset.utils.columnar_cache import is_cache_valid, read_table
+from dataset.utils.dataset_reader import iter_dataset
 
 
 start_time = time.time()
@@ -11,6 +13,7 @@ end_time = None
 
 input_file = './dataset/dblp.v12.json'
 output_file = './dataset/data_extraction/unique_venue_types.json'
+workers = int(os.environ.get('PARSE_WORKERS', 1))
 
 unique_venue_types = set()
 
@@ -19,8 +22,13 @@ encoding = detect_encoding(input_file)
 print(f'Detected encoding: {encoding}')
 
 
-with open(input_file, 'r', encoding=encoding) as f:
-    for i, item in enumerate(ijson.items(f, "item")):
+if is_cache_valid(input_file):
+    print('Reading venue types from the dataset cache')
+    venue_types = read_table('venues').column('type').drop_null().unique().to_pylist()
+    unique_venue_types.update(venue_type for venue_type in venue_types if venue_type)
+
+else:
+    for item in iter_dataset(input_file, encoding, use_cache=False, workers=workers, ordered=False, fields=frozenset(['venue'])):
         venue_type = item.get('venue', {}).get('type')
 
         if venue_type:
@@ -0,0 +1,273 @@
+import io
+import os
+import queue
+from collections import deque
+from multiprocessing import Pool
+from typing import FrozenSet, Iterator, List, Optional, Tuple
+
+import ijson
+
+from dataset.utils.projection import iter_projected_items
+
+
+CHUNK_SIZE = 16 * 1024 * 1024
+SCAN_BLOCK_SIZE = 64 * 1024
+PENDING_PER_WORKER = 2
+
+
+
+def _array_bounds(f) -> Tuple[int, int]:
+    '''
+    Get the offsets right after the opening '[' and at the closing ']' of the top-level array.
+    '''
+    head = f.read(SCAN_BLOCK_SIZE)
+    start = head.find(b'[')
+
+    f.seek(0, os.SEEK_END)
+    size = f.tell()
+    f.seek(max(0, size - SCAN_BLOCK_SIZE))
+    tail = f.read()
+    end = tail.rfind(b']')
+
+    if start == -1 or end == -1:
+        raise ValueError('The dataset is not a JSON array.')
+
+    return start + 1, size - len(tail) + end
+
+
+def _next_boundary(f, offset: int, end: int) -> int:
+    '''
+    Find the first top-level element boundary at or after 'offset'.
+    A boundary is the start of a line that begins, without indentation, with '{' or ',{'.
+    JSON strings cannot hold raw newlines, so in a file with one element per line (like DBLP)
+    such a line always starts a new element of the top-level array.
+    Returns 'end' if there is no boundary before the end of the array.
+    '''
+    f.seek(offset)
+    position = offset
+    carry = b''
+
+    while position < end:
+        block = carry + f.read(SCAN_BLOCK_SIZE)
+        if len(block) == len(carry):
+            break
+
+        search_from = 0
+        while True:
+            newline = block.find(b'\n', search_from)
+            if newline == -1 or newline + 2 >= len(block):
+                break
+
+            line_start = block[newline + 1:newline + 3]
+            if line_start[:1] == b'{' or line_start == b',{':
+                return min(position + newline + 1, end)
+
+            search_from = newline + 1
+
+        # Keep the last bytes, a boundary can be split between two blocks
+        keep = min(len(block), 2)
+        position += len(block) - keep
+        carry = block[-keep:]
+
+    return end
+
+
+def split_dataset(dataset_path: str, chunk_size: int = CHUNK_SIZE) -> List[Tuple[int, int]]:
+    '''
+    Split the top-level array of the dataset into byte ranges aligned on element boundaries.
+    Every range holds complete elements, so it can be parsed on its own.
+    Files that are not written with one element per line (e.g. indented or minified JSON)
+    have no boundaries to split on, and are returned as a single range.
+
+    Parameters
+    ----------
+    dataset_path : str
+        Path to the dataset.
+    chunk_size : int
+        Approximate size of each range in bytes. Default is 16 MB.
+
+    Returns
+    -------
+    List[Tuple[int, int]]
+        Start and end offsets of each range.
+    '''
+    with open(dataset_path, 'rb') as f:
+        start, end = _array_bounds(f)
+
+        boundaries = [start]
+        offset = start + chunk_size
+
+        while offset < end:
+            boundary = _next_boundary(f, offset, end)
+
+            if boundary >= end:
+                break
+
+            if boundary > boundaries[-1]:
+                boundaries.append(boundary)
+
+            offset = boundary + chunk_size
+
+    boundaries.append(end)
+
+    return list(zip(boundaries[:-1], boundaries[1:]))
+
+
+def parse_range(dataset_path: str, start: int, end: int, fields: Optional[FrozenSet[str]] = None) -> List[dict]:
+    '''
+    Parse the elements of the dataset between two offsets returned by 'split_dataset'.
+    The whole range is read and parsed in memory, files that 'split_dataset' cannot split
+    must be streamed with the sequential reader ('dataset_reader.iter_dataset') instead.
+
+    Parameters
+    ----------
+    dataset_path : str
+        Path to the dataset.
+    start : int
+        Start offset of the range.
+    end : int
+        End offset of the range.
+    fields : Optional[FrozenSet[str]]
+        Top-level fields to keep ('projection.get_projection'), by default None (every field).
+
+    Returns
+    -------
+    List[dict]
+        Paper records in the range, in file order.
+    '''
+    with open(dataset_path, 'rb') as f:
+        f.seek(start)
+        data = f.read(end - start).strip()
+
+    if data.startswith(b','):
+        data = data[1:]
+    if data.endswith(b','):
+        data = data[:-1]
+
+    try:
+        if fields is not None:
+            return list(iter_projected_items(io.BytesIO(b'[' + data + b']'), fields))
+
+        return list(ijson.items(io.BytesIO(b'[' + data + b']'), 'item'))
+
+    except ijson.JSONError as e:
+        raise ValueError(f'Could not parse the dataset between bytes {start} and {end}. '
+                         'Use the sequential reader for files without one element per line.') from e
+
+
+def _parse_range_task(task: Tuple[str, int, int, Optional[FrozenSet[str]]]) -> List[dict]:
+    '''
+    Pool task wrapper of 'parse_range'.
+    '''
+    return parse_range(*task)
+
+
+def _imap_bounded(pool: Pool, tasks: List[Tuple[str, int, int, Optional[FrozenSet[str]]]],
+                  max_pending: int, ordered: bool = True) -> Iterator[List[dict]]:
+    '''
+    Parse ranges in the pool with at most 'max_pending' ranges submitted and not yet consumed.
+    'Pool.imap' submits every task at once, so the workers parse the whole dataset ahead of a slow
+    consumer (e.g. the Neo4j writes) and the parsed ranges pile up in this process.
+    '''
+    if ordered:
+        pending = deque()
+
+        for task in tasks:
+            pending.append(pool.apply_async(_parse_range_task, (task,)))
+
+            if len(pending) >= max_pending:
+                yield pending.popleft().get()
+
+        while pending:
+            yield pending.popleft().get()
+        return
+
+    done = queue.Queue()
+    in_flight = 0
+
+    def _next_done() -> List[dict]:
+        result = done.get()
+        if isinstance(result, BaseException):
+            raise result
+        return result
+
+    for task in tasks:
+        pool.apply_async(_parse_range_task, (task,), callback=done.put, error_callback=done.put)
+        in_flight += 1
+
+        if in_flight >= max_pending:
+            in_flight -= 1
+            yield _next_done()
+
+    for _ in range(in_flight):
+        yield _next_done()
+
+
+def iter_dataset_parallel(dataset_path: str, workers: Optional[int] = None,
+                          chunk_size: int = CHUNK_SIZE, ordered: bool = True,
+                          fields: Optional[FrozenSet[str]] = None,
+                          ranges: Optional[List[Tuple[int, int]]] = None) -> Iterator[dict]:
+    '''
+    Iterate over the papers of the dataset, parsing byte ranges of the file in separate processes.
+    At most 'PENDING_PER_WORKER' ranges per worker are parsed ahead of the consumer.
+
+    Parameters
+    ----------
+    dataset_path : str
+        Path to the dataset.
+    workers : Optional[int]
+        Number of worker processes, by default the number of CPUs.
+    chunk_size : int
+        Approximate size of each range in bytes. Default is 16 MB.
+    ordered : bool
+        Yield the papers in file order. If False, ranges are yielded as soon as they are parsed. Default is True.
+    fields : Optional[FrozenSet[str]]
+        Top-level fields to keep, by default None (every field). The workers send back only these fields.
+    ranges : Optional[List[Tuple[int, int]]]
+        Byte ranges to parse, by default 'split_dataset(dataset_path, chunk_size)'.
+
+    Yields
+    ------
+    dict
+        Paper record.
+    '''
+    workers = workers or os.cpu_count() or 1
+    ranges = ranges or split_dataset(dataset_path, chunk_size)
+    tasks = [(dataset_path, start, end, fields) for start, end in ranges]
+
+    with Pool(workers) as pool:
+        for records in _imap_bounded(pool, tasks, PENDING_PER_WORKER * workers, ordered):
+            yield from records
+
+
+def iter_parsed_ranges(dataset_path: str, ranges: List[Tuple[int, int]], workers: int = 1,
+                       fields: Optional[FrozenSet[str]] = None) -> Iterator[Tuple[int, List[dict]]]:
+    '''
+    Parse byte ranges returned by 'split_dataset', in order.
+
+    Parameters
+    ----------
+    dataset_path : str
+        Path to the dataset.
+    ranges : List[Tuple[int, int]]
+        Start and end offsets of each range.
+    workers : int
+        Number of worker processes. With 1 the ranges are parsed in this process. Default is 1.
+    fields : Optional[FrozenSet[str]]
+        Top-level fields to keep, by default None (every field).
+
+    Yields
+    ------
+    Tuple[int, List[dict]]
+        Start offset of the range and its paper records.
+    '''
+    tasks = [(dataset_path, start, end, fields) for start, end in ranges]
+
+    if workers <= 1:
+        for task in tasks:
+            yield task[1], _parse_range_task(task)
+        return
+
+    with Pool(workers) as pool:
+        for task, records in zip(tasks, _imap_bounded(pool, tasks, PENDING_PER_WORKER * workers)):
+            yield task[1], records
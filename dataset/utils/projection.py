@@ -0,0 +1,194 @@
+from typing import IO, Iterable, Iterator, List, Optional, Union
+
+import ijson
+
+from core.enums.app_enums import AuthorApp, InstitutionApp, PaperApp
+
+
+# Fields of the dataset records read by the node loaders of each model
+# ('database/bulk_load_by_model.py' and 'database/load_by_model.py').
+MODEL_FIELDS = {
+    PaperApp.DOCUMENT_TYPE: {'doc_type'},
+    InstitutionApp.PUBLISHER: {'publisher'},
+    InstitutionApp.VENUE: {'venue'},
+    AuthorApp.AUTHOR: {'authors'},
+    InstitutionApp.ORGANIZATION: {'authors'},
+    PaperApp.FIELD_OF_STUDY: {'fos'},
+    PaperApp.PAPER: {'id', 'title', 'doi', 'year', 'page_start', 'page_end', 'volume', 'issue', 'n_citation'},
+}
+
+# Fields read to connect each model to the Paper nodes ('paper_connection_rows' matches papers by 'id' and 'title').
+CONNECTION_FIELDS = {
+    PaperApp.DOCUMENT_TYPE: {'id', 'title', 'doc_type'},
+    InstitutionApp.PUBLISHER: {'id', 'title', 'publisher'},
+    InstitutionApp.VENUE: {'id', 'title', 'venue'},
+    AuthorApp.AUTHOR: {'id', 'title', 'authors'},
+    PaperApp.FIELD_OF_STUDY: {'id', 'title', 'fos'},
+    PaperApp.PAPER_CITES_REL: {'id', 'references'},
+}
+
+# Top-level fields of the records of the DBLP v12 dataset.
+DATASET_FIELDS = frozenset({
+    'id', 'title', 'authors', 'venue', 'year', 'keywords', 'fos', 'references', 'n_citation', 'page_start', 'page_end',
+    'doc_type', 'lang', 'publisher', 'volume', 'issue', 'issn', 'isbn', 'doi', 'pdf', 'url', 'indexed_abstract',
+})
+
+_START_EVENTS = ('start_map', 'start_array')
+_END_EVENTS = ('end_map', 'end_array')
+
+
+
+def get_projection(models: Iterable[Union[AuthorApp, InstitutionApp, PaperApp]] = (),
+                   connection_models: Iterable[Union[AuthorApp, InstitutionApp, PaperApp]] = ()) -> frozenset:
+    '''
+    Get the fields of the dataset records needed to load the nodes of some models and their Paper connections.
+
+    Parameters
+    ----------
+    models : Iterable[Union[AuthorApp, InstitutionApp, PaperApp]]
+        Models whose nodes are loaded.
+    connection_models : Iterable[Union[AuthorApp, InstitutionApp, PaperApp]]
+        Models connected to the Paper model.
+
+    Returns
+    -------
+    frozenset
+        Names of the top-level fields of the records.
+    '''
+    fields = set()
+
+    for model in models:
+        fields |= MODEL_FIELDS[model]
+
+    for model in connection_models:
+        fields |= CONNECTION_FIELDS[model]
+
+    return frozenset(fields)
+
+
+def is_low_memory_parse(fields: Iterable[str]) -> bool:
+    '''
+    Check if a projection is parsed event by event, skipping the other fields without building them.
+    This is the case when it keeps less than half of the fields of a record ('DATASET_FIELDS'), e.g. the
+    DocumentType, Publisher, Venue and FieldOfStudy phases, or the Paper nodes. Projections that cover
+    most of the record (e.g. every model and connection in one pass) are built whole by 'ijson.items'.
+    '''
+    return len(frozenset(fields) & DATASET_FIELDS) * 2 < len(DATASET_FIELDS)
+
+
+def iter_projected_items(f: IO, fields: Iterable[str], low_memory: Optional[bool] = None) -> Iterator[dict]:
+    '''
+    Iterate over the elements of a JSON array of objects keeping only some of their top-level fields.
+    With 'low_memory', the file is read with the low-level parser events ('ijson.basic_parse'). The values of
+    the other fields (the 'references' list, the 'indexed_abstract' inverted index, ...) are skipped event by event
+    and never built as Python objects, which lowers the peak RSS of a batch of parsed records. The event loop
+    runs in Python, so parsing is about 2x slower than building whole elements.
+    Otherwise every element is built by the C backend of ijson ('ijson.items') and the other fields are dropped,
+    which is faster when the projection keeps most of the record anyway.
+    Numbers are parsed like 'ijson.items' does in both modes (Decimal for non-integers).
+
+    Parameters
+    ----------
+    f : IO
+        Binary or text file positioned at the start of the array.
+    fields : Iterable[str]
+        Names of the top-level fields to keep.
+    low_memory : Optional[bool]
+        Skip the other fields event by event. Default is None, 'is_low_memory_parse(fields)'.
+
+    Yields
+    ------
+    dict
+        Element with the selected fields that it has.
+
+    Raises
+    ------
+    ValueError
+        If the file is not an array of objects.
+    '''
+    fields = frozenset(fields)
+
+    if low_memory is None:
+        low_memory = is_low_memory_parse(fields)
+
+    if not low_memory:
+        for obj in ijson.items(f, 'item'):
+            if not isinstance(obj, dict):
+                raise ValueError('The dataset is not a JSON array of objects.')
+
+            yield {key: value for key, value in obj.items() if key in fields}
+        return
+
+    events = ijson.basic_parse(f)
+
+    for event, value in events:
+        if event != 'start_array':
+            raise ValueError('The dataset is not a JSON array.')
+        break
+
+    for event, value in events:
+        if event == 'end_array':
+            return
+        if event != 'start_map':
+            raise ValueError('The dataset is not a JSON array of objects.')
+
+        obj = {}
+
+        for event, key in events:
+            if event == 'end_map':
+                break
+
+            event, value = next(events)
+
+            if event not in _START_EVENTS:
+                if key in fields:
+                    obj[key] = value
+                continue
+
+            # Nested value: build it only if the field is selected, otherwise just consume its events
+            builder = ijson.ObjectBuilder() if key in fields else None
+            depth = 0
+
+            while True:
+                if event in _START_EVENTS:
+                    depth += 1
+                elif event in _END_EVENTS:
+                    depth -= 1
+
+                if builder is not None:
+                    builder.event(event, value)
+                if not depth:
+                    break
+
+                event, value = next(events)
+
+            if builder is not None:
+                obj[key] = builder.value
+
+        yield obj
+
+
+def projected_columns(fields: Optional[Iterable[str]], columns: List[str]) -> List[str]:
+    '''
+    Get the columns of the 'papers' table of the columnar cache needed for a projection.
+    The 'id' field is the 'paper_id' column and the 'venue' field is the 'venue_idx' column.
+
+    Parameters
+    ----------
+    fields : Optional[Iterable[str]]
+        Names of the fields to keep, None for every field.
+    columns : List[str]
+        Columns of the 'papers' table.
+
+    Returns
+    -------
+    List[str]
+        Columns to read.
+    '''
+    if fields is None:
+        return columns
+
+    names = {'id': 'paper_id', 'venue': 'venue_idx'}
+    selected = {names.get(field, field) for field in fields}
+
+    return [column for column in columns if column in selected]
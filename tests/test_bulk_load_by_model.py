@@ -0,0 +1,80 @@
+import json
+from decimal import Decimal
+
+import pytest
+from neo4j._codec.hydration.v1 import HydrationHandler
+from neo4j._codec.packstream.v1 import PackableBuffer, Packer
+
+from core.enums.app_enums import AuthorApp, InstitutionApp, PaperApp
+from dataset.utils.dataset_reader import iter_dataset
+from database.bulk_load_by_model import paper_connection_statements, paper_statements
+
+
+RECORDS = [
+    {'id': 1, 'title': 'First paper', 'doc_type': 'Journal', 'publisher': 'Springer',
+     'venue': {'raw': 'Venue A', 'type': 'J'},
+     'authors': [{'name': 'Ada', 'id': 10, 'org': 'Org A'}],
+     'fos': [{'name': 'Machine learning', 'w': 0.4567}, {'name': 'Graphs', 'w': 1}],
+     'references': [2]},
+    {'id': 2, 'title': 'Second paper', 'fos': [{'name': 'Graphs', 'w': 0.25}]},
+]
+
+
+
+def pack(value) -> None:
+    '''
+    Pack a value with the Bolt packer of the driver, as it is sent to the server.
+    '''
+    Packer(PackableBuffer()).pack(value, dehydration_hooks=HydrationHandler().new_hydration_scope().dehydration_hooks)
+
+
+def test_packer_rejects_decimal_weights():
+    # The parameters are only checked by the packer, a fake backend never packs them
+    with pytest.raises(ValueError):
+        pack({'rows': [{'weight': Decimal('0.4567')}]})
+
+
+def test_paper_connection_statements_pack_json_records(tmp_path):
+    dataset_path = tmp_path / 'dataset.json'
+    dataset_path.write_text(json.dumps(RECORDS), encoding='utf-8')
+
+    # ijson parses the non-integer weights as decimal.Decimal
+    nodes = list(iter_dataset(str(dataset_path), 'utf-8'))
+    models = [PaperApp.DOCUMENT_TYPE, InstitutionApp.PUBLISHER, InstitutionApp.VENUE, AuthorApp.AUTHOR,
+              PaperApp.FIELD_OF_STUDY, PaperApp.PAPER_CITES_REL]
+
+    statements = paper_connection_statements(nodes, models)
+    assert statements
+
+    for query, params in statements:
+        pack(params)
+
+    weights = [row['weight'] for query, params in statements for row in params.get('rows', []) if 'weight' in row]
+    assert weights == [0.4567, 1.0, 0.25]
+    assert all(type(weight) is float for weight in weights)
+
+
+def test_paper_statements_send_cleaned_columns():
+    nodes = [
+        {'id': 3, 'title': 'Third paper', 'year': 2001, 'page_start': '12', 'page_end': '12a', 'volume': 'e123',
+         'issue': '007', 'doi': '', 'n_citation': None},
+        {'id': 4, 'title': 'Fourth paper', 'year': '99999', 'page_start': None, 'doi': '10.1/x', 'n_citation': 5},
+        {'id': 3, 'title': 'Repeated paper'},
+    ]
+
+    [(query, params)] = paper_statements(nodes)
+    pack(params)
+
+    assert 'UNWIND range(0, size($paper_id) - 1) AS i' in query
+    assert params == {
+        'paper_id': [3, 4],
+        'title': ['Third paper', 'Fourth paper'],
+        'doi': [None, '10.1/x'],
+        'year': ['2001', None],
+        'page_start': [12, None],
+        'page_end': [None, None],
+        'volume': [None, None],
+        'issue': [7, None],
+        'n_citation': [0, 5],
+    }
+    assert all(type(value) is int for value in params['paper_id'] + params['page_start'][:1] + params['n_citation'])
@@ -0,0 +1,87 @@
+import os
+
+from core.enums.app_enums import AuthorApp, PaperApp
+from database.utils.checkpoints import CheckpointStore
+
+
+CITES = ('connections', PaperApp.PAPER_CITES_REL)
+
+
+
+def make_store(tmp_path) -> CheckpointStore:
+    dataset_path = tmp_path / 'dataset.json'
+    if not dataset_path.exists():
+        dataset_path.write_text('[]', encoding='utf-8')
+
+    return CheckpointStore(str(tmp_path / 'neo4j.json'), str(dataset_path))
+
+
+def test_checkpoints_are_resumed_from_the_earliest_unfinished_key(tmp_path):
+    store = make_store(tmp_path)
+    store.set('nodes', PaperApp.PAPER, {'index': 300, 'offset': 10, 'skip': 0})
+    store.set('nodes', AuthorApp.AUTHOR, {'index': 200, 'offset': 5, 'skip': 2})
+    store.mark_done([('nodes', PaperApp.FIELD_OF_STUDY)])
+
+    resumed = make_store(tmp_path)
+
+    assert resumed.is_done('nodes', PaperApp.FIELD_OF_STUDY)
+    assert resumed.get('nodes', PaperApp.PAPER)['index'] == 300
+    assert resumed.start_position([('nodes', PaperApp.PAPER), ('nodes', AuthorApp.AUTHOR),
+                                   ('nodes', PaperApp.FIELD_OF_STUDY)])['index'] == 200
+
+    # A key without checkpoint starts the load at the beginning
+    assert resumed.start_position([('nodes', PaperApp.PAPER), ('nodes', PaperApp.DOCUMENT_TYPE)]) is None
+
+
+def test_checkpoints_of_another_dataset_version_are_discarded(tmp_path):
+    store = make_store(tmp_path)
+    store.set('nodes', PaperApp.PAPER, {'index': 300, 'offset': 10, 'skip': 0})
+
+    (tmp_path / 'dataset.json').write_text('[{"id": 1}]', encoding='utf-8')
+
+    assert make_store(tmp_path).checkpoints == {}
+
+
+def test_spool_is_truncated_to_the_last_checkpoint(tmp_path):
+    store = make_store(tmp_path)
+
+    with store.open_spool(*CITES) as spool:
+        spool.write(b'committed')
+        store.set(*CITES, {'index': 10, 'offset': 0, 'skip': 10, 'spool_bytes': spool.tell()})
+        spool.write(b'not committed')
+
+    with make_store(tmp_path).open_spool(*CITES) as spool:
+        assert spool.tell() == len(b'committed')
+        spool.seek(0)
+        assert spool.read() == b'committed'
+
+
+def test_lost_spool_starts_the_key_over(tmp_path):
+    store = make_store(tmp_path)
+
+    with store.open_spool(*CITES) as spool:
+        spool.write(b'committed')
+        store.set(*CITES, {'index': 10, 'offset': 0, 'skip': 10, 'spool_bytes': spool.tell()})
+
+    os.remove(store.spool_path(*CITES))
+    resumed = make_store(tmp_path)
+
+    with resumed.open_spool(*CITES) as spool:
+        assert spool.tell() == 0
+
+    assert resumed.get(*CITES) is None
+
+
+def test_clear_removes_the_checkpoints_and_the_spool_files(tmp_path):
+    store = make_store(tmp_path)
+
+    with store.open_spool(*CITES) as spool:
+        spool.write(b'committed')
+        store.set(*CITES, {'index': 10, 'offset': 0, 'skip': 10, 'spool_bytes': spool.tell()})
+    store.set('nodes', PaperApp.PAPER, {'index': 10, 'offset': 0, 'skip': 10})
+
+    resumed = make_store(tmp_path)
+    resumed.clear()
+
+    assert not os.path.exists(store.spool_path(*CITES))
+    assert make_store(tmp_path).checkpoints == {}
@@ -0,0 +1,67 @@
+import numpy as np
+
+from analytics.citation_graph import CitationGraph, gather_rows
+
+
+PAPER_IDS = np.array([30, 10, 20, 40, 10])
+
+# Two batches, with a repeated reference (10 -> 20) and a reference to a paper that is not in the graph (99)
+PAIRS = [
+    (np.array([10, 10, 30, 40]), np.array([20, 30, 20, 99])),
+    (np.array([10, 20, 40]), np.array([20, 30, 10])),
+]
+
+
+
+def build() -> CitationGraph:
+    return CitationGraph.from_pairs(PAPER_IDS, iter(PAIRS))
+
+
+def test_csr_arrays_are_built_from_the_pairs():
+    graph = build()
+
+    assert graph.paper_ids.tolist() == [10, 20, 30, 40]
+    assert graph.edges == 5
+
+    # Positions: 10 -> 0, 20 -> 1, 30 -> 2, 40 -> 3
+    assert graph.out_indptr.tolist() == [0, 2, 3, 4, 5]
+    assert graph.out_indices.tolist() == [1, 2, 2, 1, 0]
+    assert graph.in_indptr.tolist() == [0, 1, 3, 5, 5]
+    assert graph.in_indices.tolist() == [3, 0, 2, 0, 1]
+
+    assert graph.out_degree().tolist() == [2, 1, 1, 1]
+    assert graph.in_degree().tolist() == [1, 2, 2, 0]
+
+
+def test_references_and_citations_are_paper_ids():
+    graph = build()
+
+    assert graph.references(10).tolist() == [20, 30]
+    assert graph.cited_by(20).tolist() == [10, 30]
+    assert graph.references(99).tolist() == []
+    assert graph.positions([40, 99]).tolist() == [3, -1]
+
+
+def test_graph_without_pairs_has_no_edges():
+    graph = CitationGraph.from_pairs(PAPER_IDS, iter([]))
+
+    assert graph.edges == 0
+    assert graph.out_indptr.tolist() == graph.in_indptr.tolist() == [0, 0, 0, 0, 0]
+
+
+def test_gather_rows_concatenates_the_rows():
+    graph = build()
+
+    assert gather_rows(graph.out_indptr, graph.out_indices, np.array([3, 0])).tolist() == [0, 1, 2]
+    assert gather_rows(graph.in_indptr, graph.in_indices, np.array([3])).tolist() == []
+
+
+def test_saved_snapshot_is_replaced_while_it_is_open(tmp_path):
+    path = str(tmp_path / 'citation-graph')
+    build().save(path)
+    opened = CitationGraph.load(path)
+
+    CitationGraph.from_pairs(PAPER_IDS, iter(PAIRS[:1])).save(path)
+
+    assert opened.edges == 5
+    assert CitationGraph.load(path).edges == 3
@@ -0,0 +1,45 @@
+import pytest
+
+from database.utils.entity_cache import EntityCache
+
+
+
+def test_transaction_caches_entries_after_commit():
+    cache = EntityCache()
+
+    with cache.transaction():
+        cache.put('Organization', 'Org A', '4:a:1')
+
+        # Visible inside the transaction, not cached yet
+        assert cache.get('Organization', 'Org A') == '4:a:1'
+        assert len(cache) == 0
+
+    assert len(cache) == 1
+    assert cache.get('Organization', 'Org A') == '4:a:1'
+
+
+def test_transaction_drops_entries_on_error():
+    cache = EntityCache()
+    cache.put('Organization', 'Org A', '4:a:1')
+
+    with pytest.raises(MemoryError):
+        with cache.transaction():
+            cache.put('Organization', 'Org B', '4:a:2')
+            cache.put('Author', 10, '4:a:3')
+            raise MemoryError
+
+    assert cache.get('Organization', 'Org B') is None
+    assert cache.get('Author', 10) is None
+    assert cache.get('Organization', 'Org A') == '4:a:1'
+
+
+def test_nested_transaction_belongs_to_the_outer_one():
+    cache = EntityCache()
+
+    with pytest.raises(ValueError):
+        with cache.transaction():
+            with cache.transaction():
+                cache.put('Author', 10, '4:a:3')
+            raise ValueError
+
+    assert len(cache) == 0
@@ -0,0 +1,59 @@
+import json
+
+import pytest
+
+from dataset.utils.dataset_reader import iter_dataset
+from dataset.utils.parallel_reader import iter_parsed_ranges, parse_range, split_dataset
+
+
+RECORDS = [{'id': paper_id, 'title': f'Paper {paper_id}', 'references': list(range(paper_id % 5))}
+           for paper_id in range(60)]
+
+
+
+def write_lines(path) -> str:
+    '''
+    Write the records like DBLP: one element per line, the next ones starting with ','.
+    '''
+    lines = [json.dumps(RECORDS[0])] + [f',{json.dumps(obj)}' for obj in RECORDS[1:]]
+    path.write_text('[\n' + '\n'.join(lines) + '\n]\n', encoding='utf-8')
+    return str(path)
+
+
+def test_ranges_cover_the_array_on_element_boundaries(tmp_path):
+    dataset_path = write_lines(tmp_path / 'dataset.json')
+
+    ranges = split_dataset(dataset_path, chunk_size=256)
+
+    assert len(ranges) > 1
+    assert all(end == next_start for (_, end), (next_start, _) in zip(ranges, ranges[1:]))
+    assert [obj for start, end in ranges for obj in parse_range(dataset_path, start, end)] == RECORDS
+
+
+def test_parsed_ranges_keep_the_projection_and_the_file_order(tmp_path):
+    dataset_path = write_lines(tmp_path / 'dataset.json')
+    ranges = split_dataset(dataset_path, chunk_size=256)
+
+    parsed = list(iter_parsed_ranges(dataset_path, ranges, fields=frozenset(['id'])))
+
+    assert [start for start, records in parsed] == [start for start, end in ranges]
+    assert [obj for start, records in parsed for obj in records] == [{'id': obj['id']} for obj in RECORDS]
+
+
+@pytest.mark.parametrize('indent', [None, 2])
+def test_file_without_one_element_per_line_is_not_split(tmp_path, indent):
+    dataset_path = tmp_path / 'dataset.json'
+    dataset_path.write_text(json.dumps(RECORDS, indent=indent), encoding='utf-8')
+
+    assert len(split_dataset(str(dataset_path), chunk_size=256)) == 1
+
+    # Streamed in this process even with several workers
+    assert list(iter_dataset(str(dataset_path), 'utf-8', use_cache=False, workers=4)) == RECORDS
+
+
+def test_range_that_is_not_on_element_boundaries_is_rejected(tmp_path):
+    dataset_path = write_lines(tmp_path / 'dataset.json')
+    start, end = split_dataset(dataset_path, chunk_size=256)[0]
+
+    with pytest.raises(ValueError):
+        parse_range(dataset_path, start + 5, end)
@@ -0,0 +1,49 @@
+import io
+import json
+
+from core.enums.app_enums import AuthorApp, InstitutionApp, PaperApp
+from dataset.utils import projection
+from dataset.utils.projection import (CONNECTION_FIELDS, MODEL_FIELDS, get_projection, is_low_memory_parse,
+                                      iter_projected_items)
+
+
+RECORDS = [
+    {'id': 1, 'title': 'First paper', 'doc_type': 'Journal', 'fos': [{'name': 'Graphs', 'w': 0.5}],
+     'references': [2, 3], 'indexed_abstract': {'IndexLength': 2, 'InvertedIndex': {'a': [0], 'b': [1]}}},
+    {'id': 2, 'title': 'Second paper', 'venue': {'raw': 'Venue A', 'type': 'J'}},
+]
+
+
+
+def dataset() -> io.BytesIO:
+    return io.BytesIO(json.dumps(RECORDS).encode('utf-8'))
+
+
+def test_dimension_phases_skip_the_other_fields_in_the_parser():
+    for model in [PaperApp.DOCUMENT_TYPE, InstitutionApp.PUBLISHER, InstitutionApp.VENUE, PaperApp.FIELD_OF_STUDY]:
+        assert is_low_memory_parse(get_projection([model]))
+
+    assert not is_low_memory_parse(get_projection(MODEL_FIELDS, CONNECTION_FIELDS))
+
+
+def test_small_projection_never_builds_whole_records(monkeypatch):
+    def items(*args, **kwargs):
+        raise AssertionError('ijson.items builds every field')
+
+    monkeypatch.setattr(projection.ijson, 'items', items)
+
+    assert list(iter_projected_items(dataset(), get_projection([PaperApp.FIELD_OF_STUDY]))) == [
+        {'fos': [{'name': 'Graphs', 'w': 0.5}]}, {},
+    ]
+
+
+def test_both_parse_paths_keep_the_same_fields():
+    fields = get_projection([AuthorApp.AUTHOR], [InstitutionApp.VENUE, PaperApp.PAPER_CITES_REL])
+
+    low_memory = list(iter_projected_items(dataset(), fields, low_memory=True))
+    whole = list(iter_projected_items(dataset(), fields, low_memory=False))
+
+    assert low_memory == whole == [
+        {'id': 1, 'title': 'First paper', 'references': [2, 3]},
+        {'id': 2, 'title': 'Second paper', 'venue': {'raw': 'Venue A', 'type': 'J'}},
+    ]